@@ -41,6 +41,7 @@ setup(
         "pytest-xdist",
         "click",
         "pytest",
+        "numpy",
         "pandas",
         "IPython",
         "nbmake",
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+from .util import read_file, file_digest, file_stamp
+
+
+class BuildCache:
+    """A persistent, content-addressed cache of build results.
+
+    Entries are keyed on a hash of everything that goes into a build (see
+    :meth:`compute_key`) and record the files the compiler read while
+    building (from the :code:`-MMD` dependency files) so that changes to
+    included headers invalidate the entry as well.
+
+    An entry is only valid if the files it refers to are still exactly as
+    the build left them, so a hit lets the builder skip :code:`make`
+    entirely.
+
+    The cache holds at most :code:`max_entries` entries (default: the
+    :code:`build_cache_max_entries` configuration option).  When it's
+    full, storing an entry removes the least recently used ones.
+    :code:`None` means there's no limit.
+    """
+
+    def __init__(self, cache_directory, max_entries=None):
+        from .config import get_config
+        self._cache_directory = cache_directory
+        self._max_entries = max_entries if max_entries is not None else get_config("build_cache_max_entries")
+
+    def compute_key(self, sources, build_parameters, tools, extra=None):
+        """Compute the cache key for a build.
+
+        Args:
+          sources: Source files that are compiled.  Their contents are part of the key.
+          build_parameters: :obj:`dict` of build parameters.
+          tools: Executables (e.g., the compiler) used in the build.  Their path, size, and modification time are part of the key.
+          extra: Other strings that should be part of the key.
+
+        Returns:
+          :obj:`str`: The key.
+        """
+        m = hashlib.sha256()
+
+        for s in sources:
+            m.update(f"source:{os.path.abspath(s)}:".encode())
+            m.update(file_digest(s).encode())
+
+        for k, v in sorted(build_parameters.items()):
+            m.update(f"parameter:{k}={v}\n".encode())
+
+        for t in tools:
+            m.update(f"tool:{_tool_identity(t)}\n".encode())
+
+        for e in extra or []:
+            m.update(f"extra:{e}\n".encode())
+
+        return m.hexdigest()
+
+    def lookup(self, key):
+        """Return the entry for :code:`key` or :code:`None` if there is no valid entry.
+
+        Entries we can't read (e.g., from an older version of CFiddle) are misses.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            if not self._is_valid(entry):
+                return None
+        except (OSError, EOFError, pickle.UnpicklingError, ImportError, AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+        try:
+            os.utime(path)  # Mark it recently used.
+        except OSError:
+            pass
+        return entry
+
+    def store(self, key, entry, dependency_files=None, output_files=None):
+        """Add an entry to the cache.
+
+        Args:
+          key: The key from :meth:`compute_key`.
+          entry: A :obj:`dict` with the information needed to reconstruct the build result.
+          dependency_files: :code:`make` dependency (:code:`.d`) files listing the headers the build used.
+          output_files: Files the build produced.  The entry is only valid while they remain unchanged.
+        """
+        entry = dict(entry)
+        entry["dependencies"] = {d: file_digest(d) for d in _read_dependencies(dependency_files or [])}
+        entry["outputs"] = {o: file_stamp(o) for o in output_files or []}
+
+        os.makedirs(self._cache_directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self._cache_directory)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(entry, f)
+        os.replace(temp_path, self._entry_path(key))
+        self._evict()
+
+    def _evict(self):
+        if self._max_entries is None:
+            return
+        entries = []
+        for e in os.scandir(self._cache_directory):
+            if e.name.endswith(".pickle"):
+                try:
+                    entries.append((e.stat().st_mtime_ns, e.path))
+                except OSError:
+                    pass  # Another process removed it.
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self._max_entries)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _is_valid(self, entry):
+        for path, stamp in entry["outputs"].items():
+            if file_stamp(path) != stamp:
+                return False
+
+        for path, digest in entry["dependencies"].items():
+            try:
+                if file_digest(path) != digest:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    def _entry_path(self, key):
+        return os.path.join(self._cache_directory, f"{key}.pickle")
+
+
+def _tool_identity(tool):
+    from .Toolchain import TheToolchainProbeCache
+    path = TheToolchainProbeCache.which(tool)
+    if path is None:
+        return tool
+    return f"{path}:{file_stamp(os.path.realpath(path))}"
+
+
+def _read_dependencies(dependency_files):
+    dependencies = []
+    for d in dependency_files:
+        if not os.path.exists(d):
+            continue
+        contents = read_file(d).replace("\\\n", " ")
+        for line in contents.split("\n"):
+            if ":" not in line:
+                continue
+            _, prerequisites = line.split(":", 1)
+            dependencies += [os.path.abspath(p) for p in prerequisites.split()]
+    return list(dict.fromkeys(dependencies))
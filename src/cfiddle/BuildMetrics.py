@@ -0,0 +1,175 @@
+import json
+import os
+import re
+
+
+class BuildMetrics:
+    """What it cost to build an :obj:`Executable`.
+
+    Attributes:
+      wall_time: Seconds :code:`make` ran for.
+      user_time: User CPU seconds used by :code:`make` and everything it ran (e.g., the compiler).
+      system_time: System CPU seconds used by :code:`make` and everything it ran.
+      max_rss: Peak resident set size, in bytes, of the largest process :code:`make` ran (usually the compiler).
+      object_sizes: :obj:`dict` mapping each object file to its size in bytes.
+      library_size: Size of the :code:`.so` file in bytes.
+      time_report: :obj:`list` of :obj:`dict`, one per compiler phase per object file, from :code:`-ftime-report` or :code:`-ftime-trace`.  Empty unless the build used :code:`time_report=True`.
+      cached: :code:`True` if the build came from the build cache.  The other values describe the original build.
+      batch: For builds done in a batch with :code:`batch_make`, an identifier shared by the builds in the batch, otherwise :code:`None`.
+
+    :code:`make` builds a whole batch at once, so for builds done in a
+    batch, the :code:`make` times and memory usage are the batch's.
+    """
+
+    def __init__(self, wall_time=None, user_time=None, system_time=None, max_rss=None,
+                 object_sizes=None, library_size=None, time_report=None, cached=False, batch=None):
+        self.wall_time = wall_time
+        self.user_time = user_time
+        self.system_time = system_time
+        self.max_rss = max_rss
+        self.object_sizes = object_sizes or {}
+        self.library_size = library_size
+        self.time_report = time_report or []
+        self.cached = cached
+        self.batch = batch
+
+    def as_dict(self):
+        """Return the metrics as a flat :obj:`dict`.
+
+        The object sizes are summed into :code:`object_size`, and the
+        time report is summarized as :code:`compile_time`, the total
+        wall time the compiler reported.
+        """
+        return dict(build_wall_time=self.wall_time,
+                    build_user_time=self.user_time,
+                    build_system_time=self.system_time,
+                    build_max_rss=self.max_rss,
+                    object_size=sum(self.object_sizes.values()) if self.object_sizes else None,
+                    library_size=self.library_size,
+                    compile_time=_total_compile_time(self.time_report),
+                    build_cached=self.cached,
+                    build_batch=self.batch)
+
+    def __repr__(self):
+        return f"BuildMetrics({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+
+
+def collect_build_metrics(usage, object_files, library, output=None, time_report=False, batch=None):
+    """Build a :obj:`BuildMetrics` for a build that just finished.
+
+    Args:
+      usage: The resource usage from :func:`invoke_process_with_usage()` or :code:`None`.
+      object_files: The object files the build produced.
+      library: The :code:`.so` the build produced.
+      output: :code:`make`'s output, to search for :code:`-ftime-report` output.
+      time_report: Whether the build asked the compiler for a time report.
+      batch: The batch the build was done in, if any (see :obj:`BuildMetrics`).
+
+    Returns:
+      :obj:`BuildMetrics`
+    """
+    usage = usage or {}
+    report = []
+    if time_report:
+        report = parse_time_report(output or "", object_files)
+        reported = {r["file"] for r in report}
+        for o in object_files:
+            trace = os.path.splitext(o)[0] + ".json"
+            if o not in reported and os.path.exists(trace):
+                report += parse_time_trace(trace, o)
+
+    return BuildMetrics(wall_time=usage.get("wall_time"),
+                        user_time=usage.get("user_time"),
+                        system_time=usage.get("system_time"),
+                        max_rss=usage.get("max_rss"),
+                        object_sizes={o: os.path.getsize(o) for o in object_files if os.path.exists(o)},
+                        library_size=os.path.getsize(library) if os.path.exists(library) else None,
+                        time_report=report,
+                        batch=batch)
+
+
+_time_report_line = re.compile(r"^\s*(?P<phase>\S.*?)\s*:" +
+                               r"".join(fr"\s*(?P<{k}>[\d.]+)\s*(?:\(\s*\d+%\))?" for k in ["user", "system", "wall"]) +
+                               r"\s*(?P<ggc>\d+[kMG]?)")
+_compile_command = re.compile(r"\s-o\s+(\S+\.o)(\s|$)")
+
+
+def parse_time_report(output, object_files):
+    """Extract GCC's :code:`-ftime-report` tables from :code:`make`'s output.
+
+    Each table is attributed to the most recent compile command that
+    :code:`make` printed before it.  Tables for other files are ignored.
+
+    Returns:
+      :obj:`list` of :obj:`dict` with keys :code:`file`, :code:`phase`, :code:`user`, :code:`system`, :code:`wall`, and :code:`ggc` (bytes of garbage collected memory).
+    """
+    object_files = set(object_files)
+    current = None
+    in_report = False
+    rows = []
+
+    for line in output.split("\n"):
+        m = _compile_command.search(line)
+        if m:
+            current = m.group(1)
+            in_report = False
+            continue
+
+        if line.startswith("Time variable"):
+            in_report = True
+            continue
+
+        if not in_report or current not in object_files:
+            continue
+
+        m = _time_report_line.match(line)
+        if m is None:
+            continue
+        rows.append(dict(file=current,
+                         phase=m.group("phase"),
+                         user=float(m.group("user")),
+                         system=float(m.group("system")),
+                         wall=float(m.group("wall")),
+                         ggc=_parse_size(m.group("ggc"))))
+    return rows
+
+
+def parse_time_trace(trace_file, object_file):
+    """Extract the phase totals from a Clang :code:`-ftime-trace` file.
+
+    Clang only reports wall time, so :code:`user`, :code:`system`, and :code:`ggc` are :code:`None`.
+
+    Returns:
+      :obj:`list` of :obj:`dict` in the same format as :func:`parse_time_report()`.
+    """
+    try:
+        with open(trace_file) as f:
+            events = json.load(f).get("traceEvents", [])
+    except (OSError, ValueError):
+        return []
+
+    rows = []
+    for e in events:
+        name = e.get("name", "")
+        if not name.startswith("Total ") or "dur" not in e:
+            continue
+        phase = name[len("Total "):]
+        rows.append(dict(file=object_file,
+                         phase="TOTAL" if phase == "ExecuteCompiler" else phase,
+                         user=None,
+                         system=None,
+                         wall=e["dur"] / 1e6,
+                         ggc=None))
+    return rows
+
+
+def _total_compile_time(report):
+    totals = [r["wall"] for r in report if r["phase"] == "TOTAL"]
+    return sum(totals) if totals else None
+
+
+def _parse_size(size):
+    multipliers = dict(k=1 << 10, M=1 << 20, G=1 << 30)
+    if size[-1] in multipliers:
+        return int(size[:-1]) * multipliers[size[-1]]
+    return int(size)
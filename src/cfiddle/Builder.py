@@ -1,11 +1,13 @@
 import hashlib
 import collections
+import concurrent.futures
 from .CProtoParser import CProtoParser
 from .util import arg_map, read_file, ListDelegator, type_check, type_check_list, infer_language
 from .Exceptions import *
 import types
 import os
 import pytest
+import pandas as pd
 
 
 class ExecutableDescription:
@@ -41,19 +43,42 @@ class ExecutableDescription:
         
 class Executable:
 
-    def __init__(self, lib, toolchain, build_dir, output, build_command, build_spec, functions):
+    def __init__(self, lib, toolchain, build_dir, output, build_command, build_spec, functions, build_metrics=None):
         self.lib = lib
         self.build_dir = build_dir
         self.output = output
         self.build_command = build_command
         self.build_spec = build_spec
-        self.functions = functions
+        self._functions = functions
         self.toolchain = toolchain
+        self.build_metrics = build_metrics
         self._raise_on_invalid_types()
     
 
     def get_toolchain(self):
         return self.toolchain
+
+    @property
+    def functions(self):
+        """A :obj:`dict` mapping the names of the functions in the source to their :obj:`Prototype`.
+
+        Builders may provide a callable (e.g., :obj:`LazyPrototypes`)
+        instead of a :obj:`dict`, in which case we call it the first
+        time someone asks.
+        """
+        if callable(self._functions):
+            self._functions = self._functions()
+            self._raise_on_invalid_functions()
+        return self._functions
+
+    @functions.setter
+    def functions(self, functions):
+        self._functions = functions
+
+    def __getstate__(self):
+        # Parse before pickling so each process we send this to doesn't have to.
+        self.functions
+        return self.__dict__
         
     def compute_built_filename(self, filename):
         return os.path.join(self.build_dir, filename)
@@ -70,6 +95,12 @@ class Executable:
         
         return self.build_spec.build_parameters
 
+    def get_build_metrics(self):
+        """
+        Returns the :obj:`BuildMetrics` describing how long the build took and how big its outputs are (or :code:`None` if they aren't available).
+        """
+        return self.build_metrics
+
     def get_toolchain(self):
         return self.toolchain
     
@@ -78,8 +109,12 @@ class Executable:
         type_check(self.build_dir, str)
         type_check(self.build_command, str)
         type_check(self.build_spec, ExecutableDescription)
-        type_check(self.functions, dict)
-        type_check_list(self.functions.keys(), str)
+        if not callable(self._functions):
+            self._raise_on_invalid_functions()
+
+    def _raise_on_invalid_functions(self):
+        type_check(self._functions, dict)
+        type_check_list(self._functions.keys(), str)
         
 
 class Builder:
@@ -137,6 +172,7 @@ class ExecutableList(list):
 
     1.  Build parameters.
     2.  Source file.
+    3.  Build metrics (see :obj:`BuildMetrics`).
 
     You can also call :method:`rebuild()` to recompile with the latest
     version of the undedrlying source code.
@@ -160,16 +196,146 @@ class ExecutableList(list):
         except TypeError:
             return result
 
+    def as_df(self):
+        """Return the build parameters and build metrics as a Pandas dataframe.
+
+        Returns:
+          :obj:`Dataframe`: One row per build.
+        """
+        rows = []
+        for e in self:
+            row = dict(e.get_build_parameters())
+            row["source_file"] = e.build_spec.source_file
+            if e.build_metrics is not None:
+                row.update(e.build_metrics.as_dict())
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def basic_blocks_df(self, function):
+        """Return the basic blocks of :code:`function` in each build (see :meth:`InstrumentedExecutable.basic_blocks()`) as a Pandas dataframe.
+
+        Returns:
+          :obj:`Dataframe`: One row per basic block, per build, with the build parameters.
+        """
+        return self._disassembly_df(lambda e: e.basic_blocks(function))
+
+    def instructions_df(self, function):
+        """Return the instructions in :code:`function` in each build (see :meth:`InstrumentedExecutable.instructions()`) as a Pandas dataframe.
+
+        Returns:
+          :obj:`Dataframe`: One row per instruction, per build, with the build parameters.
+        """
+        return self._disassembly_df(lambda e: e.instructions(function))
+
+    def _disassembly_df(self, get_df):
+        dfs = []
+        for e in self:
+            df = get_df(e)
+            parameters = dict(e.get_build_parameters())
+            parameters["source_file"] = e.build_spec.source_file
+            for i, (k, v) in enumerate(parameters.items()):
+                df.insert(i, k, [v] * len(df))
+            dfs.append(df)
+        if not dfs:
+            return pd.DataFrame()
+        return pd.concat(dfs, ignore_index=True)
+
+    def time_report_df(self):
+        """Return the compiler's time reports (from :code:`build(..., time_report=True)`) as a Pandas dataframe.
+
+        Returns:
+          :obj:`Dataframe`: One row per compiler phase, per object file, per build, with the build parameters.
+        """
+        rows = []
+        for e in self:
+            if e.build_metrics is None:
+                continue
+            for r in e.build_metrics.time_report:
+                row = dict(e.get_build_parameters())
+                row["source_file"] = e.build_spec.source_file
+                row.update(r)
+                row["build_batch"] = e.build_metrics.batch
+                rows.append(row)
+        return pd.DataFrame(rows)
+
     def rebuild(self):
         from cfiddle import build_list
         build_specs = [dict(source=b.build_spec.source_file, build_parameters=b.build_spec.build_parameters) for b in self]
         return build_list(build_specs)
-        
-    
+
+
+def build_in_parallel(builders, jobs=None, progress_bar=None):
+    """Run several :obj:`Builder` objects concurrently.
+
+    Builds run in a thread pool (the real work happens in :code:`make`
+    and the compiler, so threads are enough).  Builders that share a
+    build directory run one after another in the same thread, since
+    they would otherwise race on the same files.
+
+    The results come back in the same order as :code:`builders`.  If
+    any of the builds fail, the others still run to completion and
+    :obj:`BuildFailures` reports every failure at once.
+
+    Args:
+      builders: A list of :obj:`Builder` objects.
+      jobs: The maximum number of concurrent builds.  :code:`None` means :func:`os.cpu_count()`.
+      progress_bar: Progress bar to wrap the completed builds in.  Defaults to none.
+
+    Returns:
+      :obj:`ExecutableList`: The results of each build.
+    """
+    if progress_bar is None:
+        progress_bar = lambda x, *argc, **kwargs: x
+
+    if jobs is None:
+        jobs = os.cpu_count()
+
+    groups = collections.OrderedDict()
+    for i, builder in enumerate(builders):
+        groups.setdefault(builder.build_directory, []).append(i)
+
+    results = [None] * len(builders)
+    failures = []
+
+    def build_group(indices):
+        for i in indices:
+            try:
+                results[i] = builders[i].build()
+            except CFiddleException as e:
+                failures.append((i, e))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(build_group, indices) for indices in groups.values()]
+        for f in progress_bar(concurrent.futures.as_completed(futures), total=len(futures), miniters=1):
+            f.result()
+
+    if failures:
+        failures.sort(key=lambda x: x[0])
+        raise BuildFailures([(builders[i].build_spec, e) for i, e in failures], ExecutableList(results))
+
+    return ExecutableList(results)
+
+
 class BuildFailure(CFiddleException):
     def __str__(self):
         return f"Build command failed:\n\n{self.args[0]}\n\n{self.args[1]}"
-    
+
+
+class BuildFailures(BuildFailure):
+    """One or more builds in a parallel build failed.
+
+    :code:`failures` is a list of :code:`(build_spec, exception)` pairs, one for each failed build.
+    :code:`executables` holds the results of the whole build with :code:`None` in place of the failed builds.
+    """
+    def __init__(self, failures, executables):
+        super().__init__(failures, executables)
+        self.failures = failures
+        self.executables = executables
+
+    def __str__(self):
+        reports = [f"{spec.source_file} with {spec.build_parameters}:\n\n{e}" for spec, e in self.failures]
+        return f"{len(self.failures)} of {len(self.executables)} builds failed.\n\n" + "\n\n".join(reports)
+
 class InvalidBuildParameter(CFiddleException):
     pass
 
@@ -1,14 +1,18 @@
+import collections
 import enum
+import json
 import pydot
 import click
 import r2pipe
-import tempfile
 import subprocess
 import networkx as nx
 import re
 import sys
-import time
+import threading
 import os
+import pandas as pd
+
+from ..Exceptions import CFiddleException
 
 """
 CLI for x86 CFGs using radare2
@@ -21,20 +25,45 @@ def in_notebook():
     return 'ipykernel' in sys.modules
 
 
-def dst_dominates_src(dst=None, src=None, immed_doms=None):
+def dominator_intervals(immed_doms, start_node):
     """
-    Returns whether or not the destination node dominates the source node. 
-    Dst and src nodes must be distinct. 
+    Number the nodes of the dominator tree in DFS order.  Returns a dict
+    mapping each node to (pre, post), so that a dominates b if and only if
+    a's interval contains b's.
     """
-    curr_dominator = immed_doms[src] if src in immed_doms.keys() else None
-
-    if curr_dominator is None or curr_dominator == src: # Base case
-        return False
+    children = collections.defaultdict(list)
+    for n, d in immed_doms.items():
+        if n != d:
+            children[d].append(n)
+
+    intervals = {}
+    counter = 0
+    stack = [(start_node, False)]
+    pre = {}
+    while stack:
+        n, done = stack.pop()
+        if done:
+            intervals[n] = (pre[n], counter)
+            counter += 1
+            continue
+        pre[n] = counter
+        counter += 1
+        stack.append((n, True))
+        for c in children[n]:
+            stack.append((c, False))
+    return intervals
 
-    if curr_dominator == dst:
-        return True
 
-    return dst_dominates_src(dst=dst, src=curr_dominator, immed_doms=immed_doms)
+def dst_dominates_src(dst=None, src=None, intervals=None):
+    """
+    Returns whether or not the destination node dominates the source node,
+    given the dominator tree intervals from dominator_intervals().
+    """
+    if dst not in intervals or src not in intervals:
+        return False
+    dst_pre, dst_post = intervals[dst]
+    src_pre, src_post = intervals[src]
+    return dst_pre <= src_pre and src_post <= dst_post
 
 
 def is_self_loop(dst=None, src=None):
@@ -52,14 +81,12 @@ def get_back_edges(cfg):
     start_node = list(cfg.nodes)[0]
     back_edges = []
     immed_doms = nx.immediate_dominators(cfg, start_node)
+    intervals = dominator_intervals(immed_doms, start_node)
     for e in cfg.edges():
-        is_back_edge = False
         src_node = e[0]
         dst_node = e[1]
         if is_self_loop(dst_node, src_node) \
-        or dst_dominates_src(dst_node, src_node, immed_doms):
-            is_back_edge = True 
-        if is_back_edge:
+        or dst_dominates_src(dst_node, src_node, intervals):
             back_edges.append(e)
     
     return back_edges
@@ -84,35 +111,25 @@ def identify_loops(cfg, back_edges):
     Identify the loops in the cfg by the following definition:
     Given header node h and back edge source node n, all nodes reachable from
     h that also reach n without going through h are in the loop.
+
+    Since h dominates n, these are the nodes we find by walking backwards
+    from n and stopping at h (i.e., the natural loop), which takes time
+    linear in the size of the loop.
     Return a list of the identified loops
     """
     loops = []
     
     for e in back_edges:
-        stack = []
-        curr_loop = []
-        visted_nodes = set()
-
         n = e[0]
         header = e[1]
-        curr_loop.append(n)
-        curr_loop.append(header)
-        # DFS
-        stack.append(header)
+        curr_loop = {header, n}
+        stack = [n] if n != header else []
         while stack:
             v = stack.pop()
-            if v not in visted_nodes:
-                visted_nodes.add(v)
-                # Is v reachable from header?
-                header_reachable = nx.has_path(cfg, source=header, target=v)
-                if header_reachable:
-                    # Find path from v to n that does not go through header
-                    paths = nx.all_simple_paths(cfg, v, n)
-                    valid_paths = [p for p in paths if header not in p]
-                    if valid_paths:
-                        curr_loop.append(v)    
-                for w in cfg.out_edges(v):
-                    stack.append(w[1])
+            for w in cfg.predecessors(v):
+                if w not in curr_loop:
+                    curr_loop.add(w)
+                    stack.append(w)
         loops.append(sorted(curr_loop))
 
     return loops
@@ -267,6 +284,246 @@ def do_trim_comments(pydot_cfg):
     return pydot_cfg
 
 
+class R2Session:
+    """
+    A radare2 session for one library, analyzed once and kept open.
+    Commands are serialized, since r2pipe is not thread-safe.
+    """
+    def __init__(self, file, stamp):
+        self.file = file
+        self.stamp = stamp
+        self._lock = threading.Lock()
+        self._r2 = r2pipe.open(f'{file}', flags="-e bin.cache=true".split())
+        self._r2.cmd('aab')
+        self._r2.cmd('e asm.syntax=att')
+        self._symbols = None
+        self._graphs = {}
+        self._blocks = {}
+
+    def cmd(self, command):
+        with self._lock:
+            return self._r2.cmd(command)
+
+    def symbols(self):
+        """
+        Returns the names of the symbols radare2 found
+        """
+        if self._symbols is None:
+            listing = self.cmd('fs symbols; f; fs *')
+            self._symbols = [l.split(" ")[2] for l in listing.split("\n") if len(l.split(" ")) > 2]
+        return self._symbols
+
+    def function_graph(self, fcn_name):
+        """
+        Returns (nx_cfg, back_edges, loops) for a function.  The result is
+        cached, so don't modify it.
+        """
+        graph = self._graphs.get(fcn_name)
+        if graph is None:
+            dot = self.cmd(f'agfd @ {fcn_name}')
+            nx_cfg = nx.drawing.nx_pydot.from_pydot(pydot.graph_from_dot_data(dot)[0])
+            back_edges = get_back_edges(nx_cfg)
+            loops = identify_loops(nx_cfg, back_edges)
+            graph = (nx_cfg, back_edges, loops)
+            with self._lock:
+                self._graphs[fcn_name] = graph
+        return graph
+
+    def function_blocks(self, fcn_name):
+        """
+        Returns radare2's description of a function's basic blocks and
+        their instructions (the output of agfj).  The result is cached, so
+        don't modify it.
+        """
+        blocks = self._blocks.get(fcn_name)
+        if blocks is None:
+            output = self.cmd(f'agfj @ {fcn_name}')
+            try:
+                functions = json.loads(output) if output.strip() else []
+            except ValueError:
+                functions = []
+            if not functions:
+                raise CFGError(f"radare2 couldn't find function '{fcn_name}' in {self.file}.")
+            blocks = functions[0].get("blocks", [])
+            with self._lock:
+                self._blocks[fcn_name] = blocks
+        return blocks
+
+    def close(self):
+        with self._lock:
+            try:
+                self._r2.quit()
+            except Exception:
+                pass
+
+
+class R2SessionCache:
+    """
+    Keep one R2Session per library.  A session is replaced if the library
+    changes, and the least recently used ones are closed if there are too
+    many.
+    """
+    def __init__(self, max_sessions=8, session_type=R2Session):
+        self._sessions = collections.OrderedDict()
+        self._max_sessions = max_sessions
+        self._session_type = session_type
+        self._lock = threading.Lock()
+
+    def get_session(self, file):
+        stamp = file_stamp(file)
+        with self._lock:
+            session = self._sessions.get(file)
+            if session is not None and session.stamp == stamp:
+                self._sessions.move_to_end(file)
+                return session
+
+        stale = [session] if session is not None else []
+        session = self._session_type(file, stamp)
+        with self._lock:
+            self._sessions[file] = session
+            self._sessions.move_to_end(file)
+            while len(self._sessions) > self._max_sessions:
+                stale.append(self._sessions.popitem(last=False)[1])
+        for s in stale:
+            s.close()
+        return session
+
+    def clear(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for s in sessions:
+            s.close()
+
+
+BRANCH_TYPES = {"jmp", "cjmp", "ujmp", "rjmp", "ijmp", "irjmp", "mjmp", "ucjmp", "rcjmp", "mcjmp"}
+
+
+def is_call(op_type):
+    return op_type.endswith("call")
+
+
+def block_successors(block):
+    """
+    Returns the addresses of the blocks that can follow a block from agfj
+    """
+    successors = [block[k] for k in ("jump", "fail") if k in block]
+    successors += [c["jump"] for c in block.get("switchop", {}).get("cases", []) if "jump" in c]
+    return successors
+
+
+def block_loop_depths(blocks):
+    """
+    Returns a dict mapping each block's address to the number of loops
+    it is in.  The first block is the entry.
+    """
+    if not blocks:
+        return {}
+    cfg = nx.DiGraph()
+    cfg.add_nodes_from(b["offset"] for b in blocks)
+    for b in blocks:
+        for s in block_successors(b):
+            if s in cfg:
+                cfg.add_edge(b["offset"], s)
+
+    depths = dict.fromkeys(cfg.nodes, 0)
+    # Back edges that share a header are the same loop.
+    loops = {}
+    for e in get_back_edges(cfg):
+        loops.setdefault(e[1], set()).update(identify_loops(cfg, [e])[0])
+    for l in loops.values():
+        for n in l:
+            depths[n] += 1
+    return depths
+
+
+def basic_blocks_df(function, blocks):
+    """
+    Returns a dataframe with one row per basic block and some static
+    metrics for each one.  weighted_instructions is a rough estimate of
+    the block's cost: its instruction count times 10 for each loop it's in.
+    """
+    depths = block_loop_depths(blocks)
+    rows = []
+    for b in blocks:
+        ops = b.get("ops", [])
+        types = [op.get("type", "") for op in ops]
+        rows.append(dict(function=function,
+                         block=b["offset"],
+                         size=b.get("size", sum(op.get("size", 0) for op in ops)),
+                         instructions=len(ops),
+                         branches=sum(t in BRANCH_TYPES for t in types),
+                         calls=sum(is_call(t) for t in types),
+                         successors=len(block_successors(b)),
+                         loop_depth=depths.get(b["offset"], 0),
+                         weighted_instructions=len(ops) * 10 ** depths.get(b["offset"], 0)))
+    return pd.DataFrame(rows, columns=["function", "block", "size", "instructions", "branches", "calls",
+                                       "successors", "loop_depth", "weighted_instructions"])
+
+
+def instructions_df(function, blocks):
+    """
+    Returns a dataframe with one row per instruction
+    """
+    rows = []
+    for b in blocks:
+        for op in b.get("ops", []):
+            disasm = op.get("disasm", op.get("opcode", ""))
+            rows.append(dict(function=function,
+                             block=b["offset"],
+                             address=op.get("offset"),
+                             size=op.get("size"),
+                             mnemonic=disasm.split()[0] if disasm.split() else "",
+                             type=op.get("type"),
+                             bytes=op.get("bytes"),
+                             disasm=disasm))
+    return pd.DataFrame(rows, columns=["function", "block", "address", "size", "mnemonic", "type", "bytes", "disasm"])
+
+
+def r2_function_name(symbol):
+    if not symbol.startswith("sym."):
+        return f"sym.{symbol}"
+    else:
+        return symbol
+
+
+class RenderCache:
+    """
+    Keep the most recently rendered CFG images, keyed by library, function,
+    options, and format.
+    """
+    def __init__(self, max_entries=64):
+        self._images = collections.OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self._max_entries:
+                self._images.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+
+def file_stamp(file):
+    s = os.stat(file)
+    return (s.st_size, s.st_mtime_ns)
+
+
+TheR2SessionCache = R2SessionCache()
+TheRenderCache = RenderCache()
+
+
 @click.command()
 @click.argument('file', nargs=1)
 @click.option('-o', '--output', default="out.png", type=str, help='Output PNG file name')
@@ -288,11 +545,9 @@ def do_cfg(file,  symbol, output=None,
            trim_addresses=True, number_nodes=False, jupyter=False,
            inst_counts=False, pretty_loops=True, filt=None,
            just_list=None):
-    r2 = r2pipe.open(f'{file}', flags="-e bin.cache=true".split())
-    listing = r2.cmd('aab; fs symbols; f')
+    r2 = TheR2SessionCache.get_session(file)
     if not symbol or just_list:
-        symbols = [l.split(r" ")[2] for l in listing.split(r"\n") if len(l) > 0]
-        filtered_symbols = filter(lambda x: x.startswith("sym."), symbols)
+        filtered_symbols = filter(lambda x: x.startswith("sym."), r2.symbols())
         if filt:
             filtered_symbols = filter(lambda x: filt in x , filtered_symbols)
         click.echo("\n".join(filtered_symbols))
@@ -300,23 +555,24 @@ def do_cfg(file,  symbol, output=None,
             return
         symbol = click.prompt('Enter a function symbol name from one of the above', type=str)
 
-    if not symbol.startswith("sym."):
-        fcn_name = f"sym.{symbol}"
-    else:
-        fcn_name = symbol
-
+    fcn_name = r2_function_name(symbol)
 
-    with tempfile.TemporaryDirectory() as temp_dir:
+    if output is None:
+        if in_notebook() or jupyter:
+            output = f"{file}-{symbol}.svg"
+        else:
+            output = f"{file}-{symbol}.png"
 
-        r2.cmd('e asm.syntax=att')
-        finished = False
-        r2.cmd(f's {fcn_name}; agfd > {temp_dir}/tmp.dot')
-        time.sleep(0.5)
-        nx_cfg = nx.drawing.nx_pydot.read_dot(f'{temp_dir}/tmp.dot')
+    ext = os.path.splitext(output)[1]
+    if ext not in [".png", ".svg"]:
+        return output
 
-        back_edges = get_back_edges(nx_cfg)
-        loops = identify_loops(nx_cfg, back_edges)
+    key = (file, r2.stamp, fcn_name, ext, spacing, trim_comments, remove_assembly,
+           trim_addresses, number_nodes, inst_counts, pretty_loops)
+    image = TheRenderCache.get(key)
 
+    if image is None:
+        nx_cfg, back_edges, loops = r2.function_graph(fcn_name)
 
         # Try fiddling with the dot file itself to see if it's better
         # Try heuristic where the node going out of a loop is of lower rank
@@ -325,8 +581,6 @@ def do_cfg(file,  symbol, output=None,
         # Make last return block have lowest rank
         # Create invisible nodes to define node ordering: https://newbedev.com/how-can-i-control-within-level-node-order-in-graphviz-s-dot
 
-        nx.nx_pydot.write_dot(nx_cfg, f'{temp_dir}/nx_tmp.dot')
-
         pydot_cfg = nx.nx_pydot.to_pydot(nx_cfg)
         pydot_cfg = prettify_back_edges(pydot_cfg, back_edges)
 
@@ -345,21 +599,13 @@ def do_cfg(file,  symbol, output=None,
 
         pydot_cfg.set_ranksep(spacing) # Increase spacing between ranks and thus the nodes
 
-        if output is None:
-            if in_notebook() or jupyter:
-                output = f"{file}-{symbol}.svg"
-            else:
-                output = f"{file}-{symbol}.png"
+        image = pydot_cfg.create(format=ext[1:])
+        TheRenderCache.put(key, image)
 
-        ext = os.path.splitext(output)[1]
+    with open(output, "wb") as f:
+        f.write(image)
 
-        pydot_cfg.write_raw(f'{temp_dir}/pretty_tmp.dot')
-        if ext == ".png":
-            pydot_cfg.write_png(f'{output}')
-        elif ext == ".svg":
-            pydot_cfg.write_svg(f'{output}')
-
-        return output
+    return output
 
 if __name__ == '__main__':
     cfg()
@@ -373,6 +619,10 @@ class CFG:
         <https://rada.re/n/>`_ toolkit.  Redare will sometimes fail to create a
         coherent CFG.
 
+        Radare2 analyzes each library once, and the resulting CFGs and images
+        are cached, so drawing another function (or the same one again) is
+        fast.
+
         Args:
            function: function to show.
            output: filename in which to put the resulting ``png`` file or ``None``, which an anonymous file will be created.
@@ -381,3 +631,41 @@ class CFG:
 
         """
         return do_cfg(self.lib, function,  output=output, **kwargs)
+
+    def basic_blocks(self, function):
+        """Return the basic blocks of a function's compiled code as a Pandas dataframe.
+
+        Like :meth:`cfg()`, this uses `Redare2 <https://rada.re/n/>`_.  Each
+        row describes one basic block: its address (:code:`block`), its
+        size in bytes, and how many instructions, branches, and calls it
+        contains.  :code:`loop_depth` is the number of loops the block is
+        in, and :code:`weighted_instructions` is a rough static estimate
+        of its cost: the number of instructions times 10 for each loop.
+
+        Args:
+           function: function to analyze.
+        Returns:
+           :obj:`Dataframe`: One row per basic block.
+        """
+        blocks = TheR2SessionCache.get_session(self.lib).function_blocks(r2_function_name(function))
+        return basic_blocks_df(function, blocks)
+
+    def instructions(self, function):
+        """Return the instructions in a function's compiled code as a Pandas dataframe.
+
+        Each row gives the instruction's basic block, address, size in
+        bytes, mnemonic, Radare2's classification of the instruction
+        (:code:`type`, e.g., :code:`mov`, :code:`cjmp`, or :code:`call`),
+        encoding, and disassembly.
+
+        Args:
+           function: function to analyze.
+        Returns:
+           :obj:`Dataframe`: One row per instruction.
+        """
+        blocks = TheR2SessionCache.get_session(self.lib).function_blocks(r2_function_name(function))
+        return instructions_df(function, blocks)
+
+
+class CFGError(CFiddleException):
+    pass
@@ -0,0 +1,313 @@
+import bisect
+import collections
+import re
+import threading
+
+import pandas as pd
+from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import SymbolTableSection
+
+from .util import same_file
+
+
+FunctionLocation = collections.namedtuple("FunctionLocation", "name,address_range,source_lines,asm_lines")
+FunctionLocation.__doc__ = """Where a function is in an executable.
+
+Each field is :code:`None` if we couldn't find the function there.
+
+Attributes:
+  name: The function's symbol name (i.e., mangled, for C++).
+  address_range: :code:`(start, end)` addresses of the function's code in the library.
+  source_lines: :code:`(start, end)` lines of the function in the source file.  Lines are numbered from 0 and :code:`end` is exclusive, just like :code:`show` in :meth:`Source.source()`.
+  asm_lines: :code:`(start, end)` lines of the function in the assembly file, numbered the same way.
+"""
+
+
+class AsmLabelIndex:
+    """The lines where each label starts and each function ends in an assembly file.
+
+    Building this takes one pass over the file.  After that, finding a
+    function is a dictionary lookup and a binary search.
+
+    Args:
+      lines: The lines of the assembly.
+      end_regex: A regex that matches the line that ends a function (e.g., :code:`.cfi_endproc`).
+    """
+
+    _label = re.compile(r"^[^\s.#;]")
+
+    def __init__(self, lines, end_regex):
+        self.labels = {}
+        self.ends = []
+        self._demangled_labels = None
+        end = re.compile(end_regex)
+
+        for n, l in enumerate(lines):
+            if self._label.match(l):
+                # 'foo(int):' and 'std::foo():' are both labels, so we record every prefix that ends in a ':'.
+                for m in re.finditer(":", l):
+                    self.labels.setdefault(l[:m.start()], n)
+            if end.search(l):
+                self.ends.append(n)
+
+    def find(self, function):
+        """Return :code:`(start, end)` lines for :code:`function` or :code:`None` if it's not there."""
+        start = self.labels.get(function)
+        if start is None:
+            return None
+        i = bisect.bisect_right(self.ends, start)
+        if i == len(self.ends):
+            return None
+        return start, self.ends[i] + 1
+
+    def find_demangled(self, function, demangler):
+        """Like :meth:`find()`, but :code:`function` is the demangled version of the label.
+
+        Only the labels are demangled (once), not the whole file.
+        """
+        if self._demangled_labels is None:
+            mangled = [l for l in self.labels if l.startswith("_Z")]
+            demangled = demangler(mangled)
+            self._demangled_labels = {}
+            for l in mangled:
+                self._demangled_labels.setdefault(demangled[l], l)
+
+        label = self._demangled_labels.get(function)
+        if label is None:
+            return None
+        return self.find(label)
+
+
+class AsmLabelIndexCache:
+    """Cache :obj:`AsmLabelIndex` objects by filename and contents."""
+
+    def __init__(self, max_entries=128):
+        self._indices = collections.OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get_index(self, filename, text, end_regex):
+        key = (filename, len(text), hash(text), end_regex)
+        with self._lock:
+            index = self._indices.get(key)
+            if index is not None:
+                self._indices.move_to_end(key)
+                return index
+
+        index = AsmLabelIndex(text.split("\n"), end_regex)
+        with self._lock:
+            self._indices[key] = index
+            while len(self._indices) > self._max_entries:
+                self._indices.popitem(last=False)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indices.clear()
+
+
+TheAsmLabelIndexCache = AsmLabelIndexCache()
+
+
+def find_function_in_asm(executable, filename, text, function, demangler=None):
+    """Find :code:`function` in assembly :code:`text` (from :code:`filename`).
+
+    Args:
+      demangler: If provided, also look for a label that demangles to :code:`function`.  It takes a list of symbols and returns a :obj:`dict` mapping them to their demangled versions.
+
+    Returns:
+      :code:`(start, end)` lines or :code:`None` if it's not there.
+    """
+    _, end_regex = executable.get_toolchain().get_asm_function_bookends(function)
+    index = TheAsmLabelIndexCache.get_index(filename, text, end_regex)
+    region = index.find(function)
+    if region is None and demangler is not None:
+        region = index.find_demangled(function, demangler)
+    return region
+
+
+def find_function_in_source(dwarf_index, source_file, lines, function, end_regex):
+    """Find :code:`function` in :code:`source_file` using the line numbers in the DWARF data.
+
+    The function starts on the line DWARF says it's declared on.  The
+    last line with code for the function is usually its closing brace.
+    If it isn't (i.e., it doesn't end with :code:`}`), the function ends
+    on the next line that matches :code:`end_regex`.
+
+    Returns:
+      :code:`(start, end)` lines or :code:`None` if the DWARF data doesn't describe the function in :code:`source_file`.
+    """
+    if dwarf_index is None:
+        return None
+
+    f = dwarf_index.functions.get(function)
+    if f is None or f.decl_line is None or f.line_range is None:
+        return None
+
+    if not (same_file(f.decl_file, source_file) and same_file(f.line_range[0], source_file)):
+        return None
+
+    start = f.decl_line - 1
+    last = max(start, f.line_range[2] - 1)
+    if last >= len(lines):
+        return None
+
+    if lines[last].rstrip().endswith("}"):
+        return start, last + 1
+
+    end = re.compile(end_regex)
+    for n in range(last, len(lines)):
+        if end.search(lines[n]):
+            return start, n + 1
+    return None
+
+
+def find_asm_blocks(function, line_table, asm_lines):
+    """Match the instructions in :code:`function` to the lines of assembly they came from.
+
+    The compiler puts a :code:`.loc` directive in the assembly wherever
+    the source line changes, and the assembler turns each one into a row
+    of the DWARF line table, in the same order.  So, the n-th row in the
+    function's address range describes the instructions after the n-th
+    :code:`.loc` in its assembly.
+
+    Args:
+      function: The function's :obj:`FunctionLocation`.
+      line_table: The sorted DWARF line table.
+      asm_lines: The lines of the assembly file.
+
+    Returns:
+      :obj:`list` of :code:`(start_address, end_address, asm_line)` for each :code:`.loc`, or :code:`None` if the rows and directives don't match (e.g., there's no debugging information).
+    """
+    if function.address_range is None or function.asm_lines is None:
+        return None
+
+    start, end = function.address_range
+    addresses = [r[0] for r in line_table]
+    rows = addresses[bisect.bisect_left(addresses, start):bisect.bisect_left(addresses, end)]
+    locs = [n for n in range(*function.asm_lines) if _loc.match(asm_lines[n])]
+    if not rows or len(rows) != len(locs):
+        return None
+
+    ends = rows[1:] + [end]
+    return [(a, b, n) for a, b, n in zip(rows, ends, locs) if a < b]
+
+
+_loc = re.compile(r"^\s*\.loc\s")
+
+
+class CodeIndex:
+    """Where each function in an executable is: its addresses, source lines, and assembly lines.
+
+    This combines the ELF symbol table, the DWARF data (via
+    :meth:`DebugInfo.dwarf_index()`), and the compiler's assembly output.
+    Get one with :meth:`InstrumentedExecutable.code_index()`.
+
+    Attributes:
+      functions: :obj:`dict` mapping symbol names to :obj:`FunctionLocation`.
+      line_table: The DWARF line number table: a sorted :obj:`list` of :code:`(address, file, line)`.
+      asm_blocks: The instructions each :code:`.loc` in the assembly describes: a sorted :obj:`list` of :code:`(start_address, end_address, asm_line)` (see :func:`find_asm_blocks()`).
+    """
+
+    def __init__(self, functions, line_table, asm_blocks=None):
+        self.functions = functions
+        self.line_table = line_table
+        self.asm_blocks = asm_blocks or []
+        self._addresses = [r[0] for r in line_table]
+        self._block_starts = [b[0] for b in self.asm_blocks]
+        self._function_starts = None
+
+    @classmethod
+    def build(cls, lib, dwarf_index, source_file, source_lines, asm_lines, source_end_regex, asm_end_regex):
+        """Build an index.
+
+        Args:
+          lib: The library.
+          dwarf_index: The library's :obj:`DWARFIndex` or :code:`None`.
+          source_file: The source file.
+          source_lines: The lines of the source file or :code:`None`.
+          asm_lines: The lines of the compiler's assembly output or :code:`None`.
+          source_end_regex: A regex that matches the last line of a function in the source.
+          asm_end_regex: A regex that matches the last line of a function in the assembly.
+        """
+        symbols = _read_function_symbols(lib)
+
+        by_address = {}
+        if dwarf_index is not None:
+            for f in dwarf_index.functions.values():
+                if f.low_pc is not None:
+                    by_address.setdefault(f.low_pc, f)
+
+        asm_index = AsmLabelIndex(asm_lines, asm_end_regex) if asm_lines is not None else None
+
+        functions = {}
+        for name, (start, end) in symbols.items():
+            dwarf_function = by_address.get(start)
+            source = None
+            if dwarf_function is not None and source_lines is not None:
+                source = find_function_in_source(dwarf_index, source_file, source_lines, dwarf_function.name, source_end_regex)
+            asm = asm_index.find(name) if asm_index is not None else None
+            functions[name] = FunctionLocation(name=name, address_range=(start, end), source_lines=source, asm_lines=asm)
+
+        line_table = dwarf_index.line_table if dwarf_index is not None else []
+
+        asm_blocks = []
+        if asm_lines is not None:
+            for f in functions.values():
+                asm_blocks += find_asm_blocks(f, line_table, asm_lines) or []
+        asm_blocks.sort()
+
+        return cls(functions, line_table, asm_blocks)
+
+    def find_address(self, address):
+        """Return the :code:`(file, line)` for the code at :code:`address` or :code:`None` if there isn't one."""
+        i = bisect.bisect_right(self._addresses, address)
+        if i == 0:
+            return None
+        _, file, line = self.line_table[i - 1]
+        return file, line
+
+    def find_function(self, address):
+        """Return the name of the function that contains :code:`address` or :code:`None` if there isn't one."""
+        if self._function_starts is None:
+            self._function_starts = sorted((f.address_range[0], f.address_range[1], f.name) for f in self.functions.values() if f.address_range is not None)
+        i = bisect.bisect_right(self._function_starts, (address, float("inf")))
+        if i == 0:
+            return None
+        start, end, name = self._function_starts[i - 1]
+        return name if start <= address < end else None
+
+    def find_asm_line(self, address):
+        """Return the line in the assembly with the :code:`.loc` for the code at :code:`address` or :code:`None` if we don't know."""
+        i = bisect.bisect_right(self._block_starts, address)
+        if i == 0:
+            return None
+        start, end, line = self.asm_blocks[i - 1]
+        return line if address < end else None
+
+    def as_df(self):
+        """Return the function locations as a Pandas dataframe, one row per function."""
+        rows = []
+        for f in self.functions.values():
+            rows.append(dict(function=f.name,
+                             start_address=f.address_range[0],
+                             end_address=f.address_range[1],
+                             source_start=f.source_lines[0] if f.source_lines else None,
+                             source_end=f.source_lines[1] if f.source_lines else None,
+                             asm_start=f.asm_lines[0] if f.asm_lines else None,
+                             asm_end=f.asm_lines[1] if f.asm_lines else None))
+        return pd.DataFrame(rows, columns=["function", "start_address", "end_address", "source_start", "source_end", "asm_start", "asm_end"])
+
+
+def _read_function_symbols(lib):
+    symbols = {}
+    with open(lib, "rb") as f:
+        elffile = ELFFile(f)
+        tables = [s for s in elffile.iter_sections() if isinstance(s, SymbolTableSection)]
+        # Prefer the full symbol table to the dynamic one, which only has exported symbols.
+        tables.sort(key=lambda s: s.name != ".symtab")
+        for table in tables:
+            for symbol in table.iter_symbols():
+                if symbol["st_info"]["type"] == "STT_FUNC" and symbol["st_value"] != 0 and symbol.name:
+                    symbols.setdefault(symbol.name, (symbol["st_value"], symbol["st_value"] + symbol["st_size"]))
+    return symbols
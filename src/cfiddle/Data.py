@@ -1,5 +1,7 @@
 import csv
 import json
+import statistics
+import numpy as np
 import pandas as pd
 import copy
 import ctypes
@@ -40,13 +42,74 @@ class InvocationResultsList(list):
         except TypeError:
             return result
 
-    def rerun(self):
+    # We build a columnar copy of the data (see :obj:`ResultColumns`) the
+    # first time it's needed, and add results appended after that the
+    # next time it's needed.  Any other modification discards it.
+
+    def _invalidate_columns(self):
+        self._columns = None
+
+    def __setitem__(self, *argv):
+        self._invalidate_columns()
+        return list.__setitem__(self, *argv)
+
+    def __delitem__(self, *argv):
+        self._invalidate_columns()
+        return list.__delitem__(self, *argv)
+
+    def insert(self, *argv):
+        self._invalidate_columns()
+        return list.insert(self, *argv)
+
+    def pop(self, *argv):
+        self._invalidate_columns()
+        return list.pop(self, *argv)
+
+    def remove(self, *argv):
+        self._invalidate_columns()
+        return list.remove(self, *argv)
+
+    def clear(self):
+        self._invalidate_columns()
+        return list.clear(self)
+
+    def sort(self, *argv, **kwargs):
+        self._invalidate_columns()
+        return list.sort(self, *argv, **kwargs)
+
+    def reverse(self):
+        self._invalidate_columns()
+        return list.reverse(self)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_columns", None)
+        return state
+
+    def _get_columns(self):
+        columns = getattr(self, "_columns", None)
+        if columns is None or columns.result_count > len(self):
+            columns = ResultColumns()
+            self._columns = columns
+        for r in list.__getitem__(self, slice(columns.result_count, None)):
+            columns.add(r)
+        return columns
+
+    def rerun(self, **kwargs):
+        """Run the same invocations again.
+
+        Keyword arguments (e.g., :code:`checkpoint`) are passed to :func:`run_list()`.
+        """
         from cfiddle import run_list
         return run_list([dict(executable=r.invocation.executable,
                               function=r.invocation.function,
                               arguments=r.invocation.arguments,
                             #  perf_counters=r.invocation.perf_counters,
-                              run_options=r.invocation.run_options) for r in self])
+                              run_options=r.invocation.run_options,
+                              repetitions=r.invocation.repetitions,
+                              warmup=r.invocation.warmup,
+                              until_stable=r.invocation.until_stable,
+                              profile=r.invocation.profile) for r in self], **kwargs)
 
     def as_csv(self, csv_file):
         """Write results to a CSV file.
@@ -56,11 +119,11 @@ class InvocationResultsList(list):
         Returns:
           None
         """
-        keys, rows = self.__to_keys_and_dicts(self)
+        columns = self._get_columns()
         with open(csv_file, "w") as out_file:
-            writer = csv.DictWriter(out_file, keys)
-            writer.writeheader()
-            [writer.writerow(r) for r in rows]
+            writer = csv.writer(out_file)
+            writer.writerow(columns.keys())
+            writer.writerows(columns.rows())
 
 
     def as_df(self):
@@ -71,10 +134,10 @@ class InvocationResultsList(list):
         Returns:
           :obj:`Dataframe`: A copy of the data as a :obj:`Dataframe`.
         """
-        keys, rows = self.__to_keys_and_dicts(self)
-        df=  pd.DataFrame(rows, columns=keys);
-        df = self._convert_to_numeric(df)
-        return df
+        columns = self._get_columns()
+        keys = columns.keys()
+        # Each array is a new copy of the column, so the DataFrame can have it.
+        return pd.DataFrame({k: columns.array(k) for k in keys}, columns=keys, copy=False)
 
     
     def as_json(self):
@@ -83,67 +146,332 @@ class InvocationResultsList(list):
         Returns:
           :obj:`str`: A JSON represenation of the data.
         """
-        keys, rows = self.__to_keys_and_dicts(self)
-        return json.dumps(dict(keys=keys,
-                               data=rows))
+        columns = self._get_columns()
+        return json.dumps(dict(keys=columns.keys(),
+                               data=columns.dicts()))
             
-    def as_dicts(self):
-        """Return results as a :obj:`list` of :obj:`dict`.
+    def summarize(self, confidence=0.95):
+        """Summarize repeated measurements (e.g., from :code:`run(..., repetitions=10)`).
 
-        Returns:
-          :obj:`list` of :obj:`dict`: A copy of the data as a JSON-like Python object.
-        """
-        
-        return self.__to_keys_and_dicts(self)[1]
-
-    
-    def __to_keys_and_dicts(self,invocation_results):
+        Rows with the same build parameters, function, arguments, run
+        options, and non-numeric measurements (e.g., :code:`tag`) are
+        grouped together.  For each numeric measurement :code:`m`, the
+        result has columns :code:`m_mean`, :code:`m_median`,
+        :code:`m_std`, :code:`m_ci_low`, and :code:`m_ci_high`.  There is
+        also a :code:`count` column with the number of rows in each group.
 
-        ordered_keys = OrderedKeySet()
+        The confidence interval uses the normal approximation, so it's too
+        narrow for small numbers of repetitions.
 
-        for r in invocation_results:
-            ordered_keys.merge_in_keys(r.invocation.executable.build_spec.build_parameters)
-
-        ordered_keys.merge_in_keys(["function"])
-
-        for r in invocation_results:
-            ordered_keys.merge_in_keys(r.invocation.arguments)
-
-        for r in invocation_results:
-            ordered_keys.merge_in_keys(r.invocation.run_options)
+        Args:
+          confidence: The confidence level for the confidence interval.  Defaults to 0.95.
 
-        for r in invocation_results:
-            ordered_keys.merge_in_keys(r.get_results_field_names())
+        Returns:
+          :obj:`Dataframe`: One row per group.
+        """
+        columns = self._get_columns()
+        df = self.as_df()
+        invocation_keys = columns.invocation_keys()
+        measurements = [k for k in columns.result_keys() if k not in invocation_keys and k != "repetition"]
+
+        values = [k for k in measurements if pd.api.types.is_numeric_dtype(df[k])]
+        group_keys = invocation_keys + [k for k in measurements if k not in values]
+
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        groups = df.groupby(group_keys, dropna=False, sort=False)[values]
+
+        mean = groups.mean()
+        median = groups.median()
+        std = groups.std()
+        count = groups.size()
+        half_width = std.mul(z).div(count ** 0.5, axis=0)
+
+        summary = pd.DataFrame(index=mean.index)
+        summary["count"] = count
+        for k in values:
+            summary[f"{k}_mean"] = mean[k]
+            summary[f"{k}_median"] = median[k]
+            summary[f"{k}_std"] = std[k]
+            summary[f"{k}_ci_low"] = mean[k] - half_width[k]
+            summary[f"{k}_ci_high"] = mean[k] + half_width[k]
+
+        return summary.reset_index()
+
+    def as_histogram_df(self):
+        """Return the histograms recorded with :code:`cfiddle_hist_record()` as a Pandas dataframe.
+
+        There is one row for each bucket with values in it, with the
+        build parameters, the function name, the arguments, the run
+        options, and columns :code:`histogram` (the histogram's name),
+        :code:`low` and :code:`high` (the range of values in the bucket,
+        inclusive), and :code:`count`.
 
-        all_rows = []
+        Returns:
+          :obj:`Dataframe`: The buckets.
+        """
+        rows = []
+        for r in self:
+            invocation = r.invocation
+            invocation_values = {**invocation.executable.build_spec.build_parameters,
+                                 "function": invocation.function,
+                                 **invocation.arguments,
+                                 **invocation.run_options}
+            for name, h in getattr(r, "histograms", {}).items():
+                for low, high, count in h.buckets:
+                    rows.append({**invocation_values, "histogram": name, "low": low, "high": high, "count": count})
+
+        return pd.DataFrame(rows)
 
-        for r in invocation_results:
-            all_rows += self.__build_merged_rows(ordered_keys, r)
+    def as_dicts(self):
+        """Return results as a :obj:`list` of :obj:`dict`.
 
-        return ordered_keys, all_rows
+        Returns:
+          :obj:`list` of :obj:`dict`: A copy of the data as a JSON-like Python object.
+        """
+        
+        return self._get_columns().dicts()
 
 
-    def __build_merged_rows(self,ordered_keys, run_result):
-        merged_build_parameters_and_arguments = {**run_result.invocation.executable.build_spec.build_parameters,
-                                                 **run_result.invocation.arguments,
-                                                 **run_result.invocation.run_options}
+class ResultColumns:
+    """The data in an :obj:`InvocationResultsList`, stored by column.
 
-        data_from_execution = run_result.get_results()
+    Each :obj:`InvocationResult` contributes one row per row of
+    measurements (or one row, if there are none).  Rows include the
+    build parameters, the function name, the arguments, the run options,
+    and the measurements.  Columns are ordered in that order, too.  When
+    an invocation and its measurements both have a value for a column,
+    the invocation's value wins.
 
-        if len(data_from_execution) == 0:
-            data_from_execution=[{}]
-        
-        return [{**invocation_results,
-                 **merged_build_parameters_and_arguments,
-                 "function": run_result.invocation.function} for invocation_results in data_from_execution]
+    Missing values are :code:`None`.
 
-    
-    def _convert_to_numeric(self,df):
-        return df.apply(lambda x: pd.to_numeric(x, errors="ignore"))
-    
+    The columns are :obj:`TypedColumn` objects.  Adding a result copies
+    its values into them, and doesn't change the result.
+    """
 
+    def __init__(self):
+        self._build_parameter_keys = {}
+        self._argument_keys = {}
+        self._run_option_keys = {}
+        self._result_keys = {}
+        self._columns = {}
+        self.row_count = 0
+        self.result_count = 0
+
+    def add(self, invocation_result):
+        invocation = invocation_result.invocation
+        build_parameters = invocation.executable.build_spec.build_parameters
+        data = invocation_result.get_results()
+        row_count = len(data) or 1
+
+        self._build_parameter_keys.update(dict.fromkeys(build_parameters))
+        self._argument_keys.update(dict.fromkeys(invocation.arguments))
+        self._run_option_keys.update(dict.fromkeys(invocation.run_options))
+
+        invocation_values = {**build_parameters,
+                             **invocation.arguments,
+                             **invocation.run_options,
+                             "function": invocation.function}
+
+        if len(data) == 1:
+            result_keys = data[0]
+        else:
+            result_keys = {}
+            for d in data:
+                result_keys.update(dict.fromkeys(d))
+        self._result_keys.update(dict.fromkeys(result_keys))
+
+        for k in result_keys:
+            if k not in invocation_values:
+                self._extend(k, [d.get(k) for d in data])
+
+        for k, v in invocation_values.items():
+            self._extend(k, [v] * row_count)
+
+        self.row_count += row_count
+        self.result_count += 1
+
+    def keys(self):
+        return list(dict.fromkeys(self.invocation_keys() + self.result_keys()))
+
+    def invocation_keys(self):
+        """Keys that come from the invocations rather than the measurements."""
+        keys = dict.fromkeys(self._build_parameter_keys)
+        keys.update(dict.fromkeys(["function"]))
+        keys.update(dict.fromkeys(self._argument_keys))
+        keys.update(dict.fromkeys(self._run_option_keys))
+        return list(keys)
+
+    def result_keys(self):
+        return list(self._result_keys)
+
+    def rows(self):
+        return zip(*[self[k] for k in self.keys()])
+
+    def dicts(self):
+        keys = self.keys()
+        return [dict(zip(keys, r)) for r in self.rows()]
+
+    def __getitem__(self, key):
+        """Return the values in column :code:`key` as a :obj:`list`."""
+        return self._pad(key).tolist()
+
+    def array(self, key):
+        """Return the values in column :code:`key` as a NumPy array (see :meth:`TypedColumn.as_array()`)."""
+        return self._pad(key).as_array()
+
+    def _pad(self, key):
+        # Columns only grow when they get a value, so fill in the missing
+        # values at the end as needed.
+        column = self._columns.setdefault(key, TypedColumn())
+        if len(column) < self.row_count:
+            column.extend_missing(self.row_count - len(column))
+        return column
+
+    def _extend(self, key, values):
+        self._pad(key).extend(values)
+
+
+class TypedColumn:
+    """A column of values that grows as values are added.
+
+    If all the values are :obj:`int` (and fit in 64 bits) or all are
+    :obj:`float`, they are stored in an :code:`int64` or :code:`float64`
+    NumPy array.  Otherwise, they are stored in an :code:`object` array.
+    Missing values (i.e., :code:`None`) are tracked separately, so they
+    don't change the type.
+    """
 
-class OrderedKeySet(list):
-    def merge_in_keys(self, keys):
-        [self.append(k) for k in keys if k not in self]
-        
+    INITIAL_CAPACITY = 16
+
+    def __init__(self):
+        self.kind = None  # None until we see a value, then "int", "float", or "object".
+        # Both arrays have self._capacity elements, once they exist.
+        self._values = None
+        self._missing = None
+        self._capacity = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._size:
+            raise IndexError(i)
+        if self.kind is None or (self._missing is not None and self._missing[i]):
+            return None
+        return self._values[i].item() if self.kind != "object" else self._values[i]
+
+    def extend(self, values):
+        kind = _kind_of(values)
+        if kind is not None and kind != self.kind:
+            self._convert(kind if self.kind is None else "object")
+
+        start = self._size
+        self._grow(start + len(values))
+        missing = [v is None for v in values]
+        if any(missing):
+            self._missing_mask()[start:start + len(values)] = missing
+
+        if self.kind == "object":
+            for i, v in enumerate(values):
+                self._values[start + i] = v
+        elif self.kind is not None:
+            self._values[start:start + len(values)] = [0 if v is None else v for v in values]
+        self._size += len(values)
+
+    def extend_missing(self, count):
+        start = self._size
+        self._grow(start + count)
+        self._missing_mask()[start:start + count] = True
+        self._size += count
+
+    def tolist(self):
+        """Return the values as a :obj:`list` of Python objects."""
+        if self.kind is None:
+            return [None] * self._size
+        values = self._values[:self._size].tolist()
+        if self._missing is not None:
+            for i in np.flatnonzero(self._missing[:self._size]):
+                values[i] = None
+        return values
+
+    def as_array(self):
+        """Return a copy of the values as a NumPy array.
+
+        Missing values in numeric columns become :code:`NaN` (and
+        :code:`int64` columns with them become :code:`float64`).
+        :code:`object` columns are converted to numbers if they can be.
+        """
+        missing = self._missing[:self._size] if self._missing is not None else None
+        has_missing = missing is not None and missing.any()
+        if self.kind == "int" and not has_missing:
+            return self._values[:self._size].copy()
+        if self.kind in ["int", "float"]:
+            values = self._values[:self._size].astype(np.float64)
+            if has_missing:
+                values[missing] = np.nan
+            return values
+        return _convert_to_numeric(self.tolist())
+
+    def _grow(self, size):
+        if size <= self._capacity:
+            return
+        self._capacity = max(size, self._capacity * 2, self.INITIAL_CAPACITY)
+        if self._values is not None:
+            self._values = _resized(self._values, self._capacity)
+        if self._missing is not None:
+            self._missing = _resized(self._missing, self._capacity)
+
+    def _missing_mask(self):
+        if self._missing is None:
+            self._missing = np.zeros(self._capacity, dtype=bool)
+        return self._missing
+
+    def _convert(self, kind):
+        if self.kind is None:
+            # Everything so far is missing.
+            self._missing_mask()[:self._size] = True
+            self._values = np.zeros(self._capacity, dtype=_DTYPES[kind])
+        else:
+            values = np.empty(self._capacity, dtype=object)
+            values[:self._size] = self.tolist()
+            self._values = values
+        self.kind = kind
+
+
+_DTYPES = dict(int=np.int64, float=np.float64, object=object)
+
+_INT64_MIN, _INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+
+def _kind_of(values):
+    types = set(type(v) for v in values if v is not None)
+    if not types:
+        return None
+    if types == {int} and all(_INT64_MIN <= v <= _INT64_MAX for v in values if v is not None):
+        return "int"
+    if types == {float}:
+        return "float"
+    return "object"
+
+
+def _resized(array, capacity):
+    r = np.zeros(capacity, dtype=array.dtype)
+    r[:len(array)] = array
+    return r
+
+
+def _convert_to_numeric(values):
+    types = set(map(type, values))
+    try:
+        if types <= {int}:
+            return np.array(values, dtype=np.int64)
+        if types <= {int, float, type(None)}:
+            return np.array(values, dtype=np.float64)
+    except OverflowError:
+        pass
+
+    try:
+        return pd.to_numeric(values)
+    except (ValueError, TypeError):
+        return values
@@ -1,10 +1,17 @@
+import bisect
 import contextlib
 import io
+import os
+import pickle
+import tempfile
+import threading
 from elftools.elf.elffile import ELFFile
 from elftools.dwarf.die import DIE
 from elftools.dwarf.die import AttributeValue
 from elftools.dwarf.descriptions import    describe_DWARF_expr, set_global_machine_arch
 from elftools.dwarf.locationlists import     LocationEntry, LocationExpr, LocationParser
+from elftools.common.exceptions import DWARFError, ELFError
+from elftools.construct import ConstructError
 
 
 class DebugInfo:
@@ -30,14 +37,14 @@ class DebugInfo:
         """
         self.show = show
 
-        with self.DWARFInfo() as dwarfinfo:
-            if dwarfinfo is None:
-                return f"No debugging data in {self.lib}"
-            for CU in dwarfinfo.iter_CUs():
-                 top_DIE = CU.get_top_DIE()
-                 return DWARFRenderer(top_DIE, show).render()
-
-        return f"No Compilation units in {self.lib}."
+        index = self.dwarf_index()
+        if not index.has_dwarf:
+            return f"No debugging data in {self.lib}"
+        if index.debug_info is None:
+            return f"No Compilation units in {self.lib}."
+        if show is None:
+            return index.debug_info
+        return index.debug_info_by_function.get(show, "")
 
 
     def stack_frame(self, show, **kwargs):
@@ -86,70 +93,25 @@ class DebugInfo:
           :code:`str`: A description of the layout
 
         """
-        output = io.StringIO()
-        current_function = None
-        self._set_machine_architecture()
-
-        def emit(s):
-            if current_function == show:
-                output.write(s)
-                
-        with self.DWARFInfo() as dwarfinfo:
-            loc_parser = self._build_location_parser(dwarfinfo)
-
-            for CU in dwarfinfo.iter_CUs():
-                for DIE in CU.iter_DIEs():
-                    if DIE.tag == "DW_TAG_subprogram":
-                        current_function = self._extract_name(DIE)
-                        emit(self._render_function_name(DIE))
-                    elif DIE.tag in ["DW_TAG_formal_parameter", "DW_TAG_variable"]:
-                        if current_function == show:
-                            emit(self._render_variable_location(DIE, CU, dwarfinfo, loc_parser))
-                        
-        return output.getvalue()
-    
-    def _render_variable_location(self, DIE, CU, dwarfinfo, loc_parser):
-        if "DW_AT_name" in DIE.attributes:
-            name = DIE.attributes['DW_AT_name'].value.decode()
-        else:
-            name = "<unnamed>"
-        
-        if "DW_AT_location" not in DIE.attributes:
-            return f"{name} has no location\n"
-        else:
-            loc = loc_parser.parse_from_attribute(DIE.attributes["DW_AT_location"], CU['version'])
-            if isinstance(loc, LocationExpr):
-                offset = describe_DWARF_expr(loc.loc_expr, dwarfinfo.structs, CU.cu_offset)
-                return f"    {name}: {offset}\n"
-            else:
-                return f"    {name}: <not a location>\n"
-            
-
-    def _set_machine_architecture(self):
-        with self.ELFFile() as elffile:    # This is required for the descriptions module to correctly decode
-            # register names contained in DWARF expressions.
-            set_global_machine_arch(elffile.get_machine_arch())
+        function = self.dwarf_index().functions.get(show)
+        if function is None:
+            return ""
+        return function.stack_frame
 
 
-    def _render_function_name(self, DIE):
-        n = self._extract_name(DIE)
-        if n is None:
-            return f"function <anon>\n"
-        else:
-            return f"function {n}\n"
+    def dwarf_index(self):
+        """Return the :obj:`DWARFIndex` for the compiled code.
 
+        The index is built the first time it's needed and then saved next
+        to the library, so later queries (in this process or another one)
+        don't need to parse the DWARF data again.
 
-    def _extract_name(self, DIE):
-        if "DW_AT_name" in DIE.attributes:
-            return DIE.attributes['DW_AT_name'].value.decode()
-        else:
-            return None
+        Returns:
+          :obj:`DWARFIndex`: The index.
+        """
+        return TheDWARFIndexCache.get_index(self.lib)
 
-    def _build_location_parser(self, dwarfinfo):
-        location_lists = dwarfinfo.location_lists()
-        return LocationParser(location_lists)
 
-        
     @contextlib.contextmanager
     def DWARFInfo(self):
 
@@ -183,6 +145,263 @@ class DebugInfo:
             pass
 
         
+class DWARFFunction:
+    """What :obj:`DWARFIndex` knows about a function.
+
+    Attributes:
+      name: The function's name.
+      low_pc: The address of the function's first instruction (or :code:`None`).
+      high_pc: The address just past the function's last instruction (or :code:`None`).
+      decl_file: The file the function is declared in (or :code:`None`).
+      decl_line: The line the function is declared on (or :code:`None`).
+      line_range: :code:`(file, first_line, last_line)` covered by the function's code, from the line number table (or :code:`None`).
+      variables: :obj:`list` of :code:`(name, location)` for the function's parameters and local variables.  :code:`location` is a description of a DWARF expression (or :code:`None`).
+      stack_frame: The text :meth:`DebugInfo.stack_frame()` returns for this function.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.low_pc = None
+        self.high_pc = None
+        self.decl_file = None
+        self.decl_line = None
+        self.line_range = None
+        self.variables = []
+        self.stack_frame = ""
+
+
+class DWARFIndex:
+    """A summary of the DWARF data in a library, organized by function.
+
+    Build one with :meth:`DWARFIndex.build()` or, better, use
+    :meth:`DebugInfo.dwarf_index()`, which caches them.
+
+    Attributes:
+      lib: The library.
+      stamp: The library's size and modification time when we built the index.
+      has_dwarf: Whether the library has DWARF data.
+      functions: :obj:`dict` mapping function names to :obj:`DWARFFunction`.
+      debug_info: The rendering of the first compilation unit :meth:`DebugInfo.debug_info()` returns (or :code:`None` if there isn't one).
+      debug_info_by_function: :obj:`dict` mapping function names to the part of :code:`debug_info` that describes them.
+      line_table: The line number table: A sorted :obj:`list` of :code:`(address, file, line)`.
+    """
+
+    VERSION = 3
+
+    def __init__(self, lib, stamp):
+        self.version = DWARFIndex.VERSION
+        self.lib = lib
+        self.stamp = stamp
+        self.has_dwarf = False
+        self.functions = {}
+        self.debug_info = None
+        self.debug_info_by_function = {}
+        self.line_table = []
+
+    @classmethod
+    def build(cls, lib):
+        """Parse the DWARF data in :code:`lib` and build an index for it."""
+        index = cls(lib, _file_stamp(lib))
+        with open(lib, "rb") as f:
+            elffile = ELFFile(f)
+            if not elffile.has_dwarf_info():
+                return index
+            index.has_dwarf = True
+
+            # This is required for the descriptions module to correctly
+            # decode register names contained in DWARF expressions.
+            set_global_machine_arch(elffile.get_machine_arch())
+
+            dwarfinfo = elffile.get_dwarf_info()
+            loc_parser = LocationParser(dwarfinfo.location_lists())
+
+            for i, CU in enumerate(dwarfinfo.iter_CUs()):
+                if i == 0:
+                    index.debug_info, index.debug_info_by_function = DWARFRenderer(CU.get_top_DIE(), None).render_by_function()
+                index._add_CU(dwarfinfo, CU, loc_parser)
+
+        index.line_table.sort(key=lambda r: r[0])
+        return index
+
+    def _add_CU(self, dwarfinfo, CU, loc_parser):
+        current = None
+        CU_functions = []
+        for DIE in CU.iter_DIEs():
+            if DIE.tag == "DW_TAG_subprogram":
+                name = _extract_name(DIE)
+                current = self.functions.setdefault(name, DWARFFunction(name))
+                current.stack_frame += _render_function_name(name)
+                self._add_subprogram(current, DIE)
+                CU_functions.append(current)
+            elif DIE.tag in ["DW_TAG_formal_parameter", "DW_TAG_variable"] and current is not None:
+                variable, location, rendered = _describe_variable_location(DIE, CU, dwarfinfo, loc_parser)
+                current.variables.append((variable, location))
+                current.stack_frame += rendered
+
+        self._add_line_table(dwarfinfo, CU, CU_functions)
+
+    def _add_subprogram(self, function, DIE):
+        attributes = DIE.attributes
+        if "DW_AT_low_pc" in attributes:
+            function.low_pc = attributes["DW_AT_low_pc"].value
+            if "DW_AT_high_pc" in attributes:
+                high_pc = attributes["DW_AT_high_pc"]
+                if high_pc.form == "DW_FORM_addr":
+                    function.high_pc = high_pc.value
+                else:  # It's an offset from low_pc.
+                    function.high_pc = function.low_pc + high_pc.value
+        if "DW_AT_decl_line" in attributes:
+            function.decl_line = attributes["DW_AT_decl_line"].value
+        if "DW_AT_decl_file" in attributes:
+            function.decl_file = attributes["DW_AT_decl_file"].value
+
+    def _add_line_table(self, dwarfinfo, CU, CU_functions):
+        lineprog = dwarfinfo.line_program_for_CU(CU)
+        if lineprog is None:
+            return
+
+        files = _line_program_files(lineprog)
+        rows = sorted(((e.state.address, files.get(e.state.file), e.state.line) for e in lineprog.get_entries() if e.state is not None and not e.state.end_sequence),
+                      key=lambda r: r[0])
+        self.line_table += rows
+        addresses = [r[0] for r in rows]
+
+        for f in CU_functions:
+            if isinstance(f.decl_file, int):
+                f.decl_file = files.get(f.decl_file)
+
+            if f.low_pc is None or f.high_pc is None or f.line_range is not None:
+                continue
+            start = bisect.bisect_left(addresses, f.low_pc)
+            end = bisect.bisect_left(addresses, f.high_pc)
+            # Skip lines from other files (e.g., inlined functions from headers).
+            file = f.decl_file if f.decl_file is not None else rows[start][1] if start < end else None
+            lines = [line for _, line_file, line in rows[start:end] if line > 0 and line_file == file]
+            if lines:
+                f.line_range = (file, min(lines), max(lines))
+
+
+class DWARFIndexCache:
+    """Cache :obj:`DWARFIndex` objects in memory and on disk.
+
+    The index for :code:`lib.so` is saved in :code:`lib.so.dwarf-index`.
+    Both copies are used only if the library's size and modification time
+    match the ones recorded when the index was built.
+    """
+
+    SUFFIX = ".dwarf-index"
+
+    def __init__(self):
+        self._indices = {}
+        self._lock = threading.Lock()
+
+    def get_index(self, lib):
+        """Return the :obj:`DWARFIndex` for :code:`lib`, building it if needed."""
+        stamp = _file_stamp(lib)
+        with self._lock:
+            index = self._indices.get(lib)
+        if index is not None and index.stamp == stamp:
+            return index
+
+        index = self._load(lib, stamp)
+        if index is None:
+            index = DWARFIndex.build(lib)
+            self._save(index)
+
+        with self._lock:
+            self._indices[lib] = index
+        return index
+
+    def clear(self):
+        """Forget the in-memory copies of the indices."""
+        with self._lock:
+            self._indices.clear()
+
+    def _load(self, lib, stamp):
+        try:
+            with open(lib + self.SUFFIX, "rb") as f:
+                index = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            return None
+        if getattr(index, "version", None) != DWARFIndex.VERSION or index.stamp != stamp:
+            return None
+        return index
+
+    def _save(self, index):
+        directory = os.path.dirname(os.path.abspath(index.lib))
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=directory)
+        except OSError:  # We can't write there.  That's fine, we just won't save it.
+            return
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(index, f)
+        os.replace(temp_path, index.lib + self.SUFFIX)
+
+
+TheDWARFIndexCache = DWARFIndexCache()
+
+# What building a DWARFIndex can raise if the library is missing or
+# pyelftools can't make sense of it.  Code that can do without the index
+# should catch these and carry on.
+DWARF_INDEX_ERRORS = (OSError, ELFError, DWARFError, ConstructError, ValueError, KeyError, IndexError)
+
+
+def _file_stamp(path):
+    s = os.stat(path)
+    return (s.st_size, s.st_mtime_ns)
+
+
+def _extract_name(DIE):
+    if "DW_AT_name" in DIE.attributes:
+        return DIE.attributes['DW_AT_name'].value.decode()
+    else:
+        return None
+
+
+def _render_function_name(name):
+    if name is None:
+        return f"function <anon>\n"
+    else:
+        return f"function {name}\n"
+
+
+def _describe_variable_location(DIE, CU, dwarfinfo, loc_parser):
+    if "DW_AT_name" in DIE.attributes:
+        name = DIE.attributes['DW_AT_name'].value.decode()
+    else:
+        name = "<unnamed>"
+
+    if "DW_AT_location" not in DIE.attributes:
+        return name, None, f"{name} has no location\n"
+
+    # Some compilers (e.g., Go's) emit locations pyelftools can't parse.
+    # That shouldn't stop us from indexing everything else.
+    try:
+        # DWARF 5 location lists need the DIE.
+        loc = loc_parser.parse_from_attribute(DIE.attributes["DW_AT_location"], CU['version'], die=DIE)
+        if isinstance(loc, LocationExpr):
+            offset = describe_DWARF_expr(loc.loc_expr, dwarfinfo.structs, CU.cu_offset)
+            return name, offset, f"    {name}: {offset}\n"
+    except (DWARFError, ValueError, KeyError):
+        pass
+    return name, None, f"    {name}: <not a location>\n"
+
+
+def _line_program_files(lineprog):
+    # DWARF 5 numbers files from 0, earlier versions from 1.
+    first = 0 if lineprog.header.version >= 5 else 1
+    files = {}
+    for i, entry in enumerate(lineprog.header.file_entry):
+        name = entry.name.decode()
+        directory_index = entry.dir_index
+        if lineprog.header.version < 5:
+            directory_index -= 1  # 0 means the compilation directory, which isn't in include_directory.
+        if not os.path.isabs(name) and 0 <= directory_index < len(lineprog.header.include_directory):
+            name = os.path.join(lineprog.header.include_directory[directory_index].decode(), name)
+        files[i + first] = name
+    return files
+
+
 class DWARFRenderer:
     def __init__(self, die, show):
         self.root = die
@@ -195,19 +414,39 @@ class DWARFRenderer:
 
         self.output = io.StringIO()
         self.indent = 0
+        self._by_function = None
+        self._showing = []
 
     def render(self):
         self._die_info_rec(self.root)
         return self.output.getvalue()
 
+    def render_by_function(self):
+        """Render everything and each function's part in one pass.
+
+        Returns:
+          :code:`(all, by_function)`: :code:`all` is what :meth:`render()` returns if :code:`show` is :code:`None`.  :code:`by_function` maps each function name to what it returns if :code:`show` is that name.
+        """
+        self._by_function = {}
+        self.show = None
+        self.printing = 1
+        self._die_info_rec(self.root)
+        return self.output.getvalue(), {name: o.getvalue() for name, o in self._by_function.items()}
+
     def _die_info_rec(self, die):
 
         printing_increment = 0
+        showing = False
 
         if die.tag == "DW_TAG_subprogram":
 
             if self.show == self._get_die_name(die):
                 printing_increment = 1
+
+            name = self._get_die_name(die)
+            if self._by_function is not None and name not in self._showing:
+                self._showing.append(name)
+                showing = True
         self.printing += printing_increment
 
         self._output_element(die)
@@ -222,6 +461,8 @@ class DWARFRenderer:
         self._pop_indent()
 
         self.printing -= printing_increment
+        if showing:
+            self._showing.pop()
 
     def _get_die_name(self, die):
         if "DW_AT_name" in die.attributes:
@@ -237,7 +478,10 @@ class DWARFRenderer:
     def _output_element(self, e):
         if self.printing > 0:
             indent =  "  " * self.indent
-            self.output.write(f"[{e.offset:4}] {indent}{self._render_element(e)}\n")
+            line = f"[{e.offset:4}] {indent}{self._render_element(e)}\n"
+            self.output.write(line)
+            for name in self._showing:
+                self._by_function.setdefault(name, io.StringIO()).write(line)
 
     def _render_element(self, e):
         if isinstance(e, AttributeValue) :
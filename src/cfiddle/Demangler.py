@@ -0,0 +1,94 @@
+import collections
+import re
+import threading
+
+from .util import invoke_process
+from .Exceptions import CFiddleException
+
+
+class Demangler:
+    """Demangle C++ symbol names.
+
+    Instead of piping whole files through :code:`c++filt`, we find the
+    mangled symbols ourselves and pass the ones we haven't seen before to
+    a single :code:`c++filt` invocation as arguments.  We still use the
+    toolchain's :code:`c++filt` so the output is the same as before (e.g.,
+    :code:`__cxa_demangle()` abbreviates :code:`std::basic_ostream<...>`).
+
+    Demangled names are cached, as are the results for the last few
+    texts passed to :meth:`demangle_text()`.
+    """
+
+    # The characters c++filt considers part of a symbol.
+    _mangled = re.compile(r"(?<![A-Za-z0-9_$.])_Z[A-Za-z0-9_$.]+")
+
+    def __init__(self, max_texts=16):
+        self._names = {}
+        self._texts = collections.OrderedDict()
+        self._max_texts = max_texts
+        self._lock = threading.Lock()
+
+    def demangle(self, symbol, cxxfilt="c++filt"):
+        """Return the demangled version of :code:`symbol`, or :code:`symbol` if it isn't a mangled name."""
+        return self.demangle_all([symbol], cxxfilt)[symbol]
+
+    def demangle_text(self, text, cxxfilt="c++filt"):
+        """Demangle all the symbols in :code:`text` (e.g., a fragment of assembly)."""
+        key = (len(text), hash(text), cxxfilt)
+        with self._lock:
+            if key in self._texts:
+                self._texts.move_to_end(key)
+                return self._texts[key]
+
+        names = self.demangle_all(list(set(self._mangled.findall(text))), cxxfilt)
+        demangled = self._mangled.sub(lambda m: names[m.group(0)], text)
+
+        with self._lock:
+            self._texts[key] = demangled
+            while len(self._texts) > self._max_texts:
+                self._texts.popitem(last=False)
+        return demangled
+
+    def demangle_all(self, symbols, cxxfilt="c++filt"):
+        """Demangle a list of symbols at once.
+
+        Returns:
+          :obj:`dict` mapping each symbol to its demangled version.
+        """
+        with self._lock:
+            missing = [s for s in symbols if (cxxfilt, s) not in self._names]
+
+        if missing:
+            found = _demangle_with_tool(missing, cxxfilt)
+            with self._lock:
+                self._names.update(((cxxfilt, s), d) for s, d in found.items())
+
+        with self._lock:
+            return {s: self._names[(cxxfilt, s)] for s in symbols}
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+            self._texts.clear()
+
+
+def _demangle_with_tool(symbols, cxxfilt, chunk_size=1000):
+    # c++filt demangles each of its arguments and prints them one per line.
+    found = {}
+    for i in range(0, len(symbols), chunk_size):
+        chunk = symbols[i:i + chunk_size]
+        success, output = invoke_process([cxxfilt] + chunk)
+        if not success:
+            raise DemanglingFailure(f"Demangling with '{cxxfilt}' failed: {output}")
+        demangled = output.split("\n")
+        if len(demangled) < len(chunk):
+            raise DemanglingFailure(f"'{cxxfilt}' returned {len(demangled)} names for {len(chunk)} symbols.")
+        found.update(zip(chunk, demangled))
+    return found
+
+
+TheDemangler = Demangler()
+
+
+class DemanglingFailure(CFiddleException):
+    pass
@@ -0,0 +1,89 @@
+import math
+
+import pandas as pd
+
+
+class LatencyHistogram:
+    """A histogram recorded with :code:`cfiddle_hist_record()`.
+
+    The histogram only stores the buckets with values in them.  Each
+    bucket covers a range of values that is less than 1% of their size,
+    so percentiles are accurate to within 1%.  The count, minimum,
+    maximum, and mean are exact.
+
+    Attributes:
+      name: The histogram's name.
+      buckets: :obj:`list` of :code:`(low, high, count)` for the buckets with values in them, sorted by value.  :code:`low` and :code:`high` are inclusive.
+      count: The number of values.
+      min: The smallest value.
+      max: The largest value.
+      sum: The sum of the values.
+    """
+
+    def __init__(self, name, buckets, count, min, max, sum):
+        self.name = name
+        self.buckets = buckets
+        self.count = count
+        self.min = min
+        self.max = max
+        self.sum = sum
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def percentile(self, p):
+        """Return the value that :code:`p` percent of the values are less than or equal to.
+
+        Like HdrHistogram, we return the largest value in the bucket that
+        holds that value (but no more than the largest value recorded).
+        """
+        if self.count == 0:
+            return None
+        if not 0 <= p <= 100:
+            raise ValueError(f"Percentile must be between 0 and 100, not {p}.")
+
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for low, high, count in self.buckets:
+            seen += count
+            if seen >= rank:
+                return max(self.min, min(high, self.max))
+        return self.max
+
+    def summary(self, percentiles):
+        """Return a :obj:`dict` with the count, min, mean, max, and :code:`percentiles`.
+
+        The keys start with the histogram's name: e.g., :code:`lat_count`,
+        :code:`lat_p50`, and :code:`lat_p99.9` for a histogram called :code:`lat`.
+        """
+        r = {f"{self.name}_count": self.count,
+             f"{self.name}_min": self.min,
+             f"{self.name}_mean": self.mean,
+             f"{self.name}_max": self.max}
+        for p in percentiles:
+            r[f"{self.name}_p{p:g}"] = self.percentile(p)
+        return r
+
+    def merge(self, other):
+        """Return a new histogram with the values in this one and :code:`other`."""
+        if self.count == 0:
+            return other
+        if other.count == 0:
+            return self
+        counts = {}
+        for low, high, count in self.buckets + other.buckets:
+            counts[(low, high)] = counts.get((low, high), 0) + count
+        return LatencyHistogram(self.name,
+                                [(low, high, count) for (low, high), count in sorted(counts.items())],
+                                count=self.count + other.count,
+                                min=min(self.min, other.min),
+                                max=max(self.max, other.max),
+                                sum=self.sum + other.sum)
+
+    def as_df(self):
+        """Return the buckets as a Pandas dataframe with columns :code:`low`, :code:`high`, and :code:`count`."""
+        return pd.DataFrame(self.buckets, columns=["low", "high", "count"])
+
+    def __repr__(self):
+        return f"LatencyHistogram({self.name!r}, count={self.count}, min={self.min}, max={self.max})"
@@ -1,15 +1,27 @@
 import ctypes
 import tempfile
 import os
-import csv
 import faulthandler
+import statistics
+import warnings
 
 from .Runner import Runner, InvocationResult, RunnerException, RunOptionInterpreter
 from .CProtoParser import funcptr_t
 from .Exceptions import CFiddleException
 from .util import environment
+from .LibraryCache import TheLibraryCache
+from .Histogram import LatencyHistogram
+from .Profile import build_profile
 from .perfcount import install_perf_counters, clear_perf_counters
 
+# Column types reported by libcfiddle's stats_column_type().  They match DatumKind in DataSet.hpp.
+STATS_INT64 = 0
+STATS_DOUBLE = 1
+STATS_STRING = 2
+
+# Bounds on the number of repetitions for InvocationDescription.until_stable.
+MIN_STABLE_REPETITIONS = 3
+DEFAULT_MAX_REPETITIONS = 100
 
 faulthandler.enable()
 
@@ -17,17 +29,97 @@ class Invoker:
 
     def __init__(self, invocation, result_factory=None):
         from .config import get_config
-        self._libcfiddle = ctypes.CDLL("libcfiddle.so")
+        self._libcfiddle = TheLibraryCache.load_library("libcfiddle.so")
+        self._libcfiddle.stats_column_name.restype = ctypes.c_char_p
+        self._libcfiddle.stats_string_value.restype = ctypes.c_char_p
+        self._libcfiddle.histogram_name.restype = ctypes.c_char_p
+        self._libcfiddle.profile_error.restype = ctypes.c_char_p
+        self._libcfiddle.fast_measurement_error.restype = ctypes.c_char_p
+        self._libcfiddle.profile_lost_samples.restype = ctypes.c_uint64
+        self._libcfiddle.profile_resolve.restype = ctypes.c_char_p
+        self._libcfiddle.profile_resolve.argtypes = [ctypes.c_uint64, ctypes.POINTER(ctypes.c_uint64)]
         self._invocation = invocation
         self._result_factory = result_factory or get_config("InvocationResult_type")
         self._run_option_manager = get_config("RunOptionInterpreter_type")
+        self._histogram_percentiles = get_config("histogram_percentiles")
+        self._profile_frequency = get_config("profile_frequency")
+        self._profile_buffer_pages = get_config("profile_buffer_pages")
+        self._profiling = False
         
     def run(self):
         self._prepare_data_collection()
 
-        return_value = self._invoke_function()
-        results = self._collect_data()
-        return self._result_factory(invocation=self._invocation, results=results, return_value=return_value)
+        for _ in range(self._invocation.warmup):
+            self._invoke_function()
+        self._libcfiddle.clear_stats()
+
+        if self._invocation.profile:
+            self._start_profile()
+        try:
+            if self._invocation.is_repeated():
+                return_value, results, histograms = self._run_repeatedly()
+            else:
+                return_value = self._invoke_function()
+                results = self._collect_data()
+                histograms = self._collect_histograms()
+                results = self._add_histogram_columns(results, histograms)
+        except BaseException:
+            if self._profiling:
+                self._profiling = False
+                self._libcfiddle.stop_profile()
+            raise
+
+        profile = self._stop_profile() if self._invocation.profile else None
+
+        return self._result_factory(invocation=self._invocation, results=results, return_value=return_value, histograms=histograms, profile=profile)
+
+    def _run_repeatedly(self):
+        """Call the function repeatedly and tag each row of measurements with a :code:`repetition` column.
+
+        If :code:`until_stable` is set, stop once the relative standard
+        error of the total :code:`ET` for each repetition drops to
+        :code:`until_stable`, or after :code:`repetitions` (default
+        :code:`DEFAULT_MAX_REPETITIONS`) repetitions.
+
+        Histogram columns are for each repetition, but the histograms we
+        return include all of them.
+
+        Raises :obj:`NoMeasurements` if :code:`until_stable` is set and a
+        repetition doesn't record :code:`ET`, since there's nothing to
+        converge.
+        """
+        invocation = self._invocation
+        limit = invocation.repetitions
+        if limit is None:
+            limit = DEFAULT_MAX_REPETITIONS
+
+        results = []
+        times = []
+        histograms = {}
+        for repetition in range(limit):
+            return_value = self._invoke_function()
+            rows = self._collect_data()
+            repetition_histograms = self._collect_histograms()
+            rows = self._add_histogram_columns(rows, repetition_histograms)
+            self._libcfiddle.clear_stats()
+
+            for name, h in repetition_histograms.items():
+                histograms[name] = histograms[name].merge(h) if name in histograms else h
+
+            for r in rows:
+                r["repetition"] = repetition
+            results += rows
+            measured = [r["ET"] for r in rows if r.get("ET") is not None]
+            if invocation.until_stable is not None and not measured:
+                raise NoMeasurements(f"'until_stable' needs '{invocation.function}' to measure something (e.g., with start_measurement() and end_measurement()), but repetition {repetition} recorded no ET.")
+            times.append(sum(measured))
+
+            if (invocation.until_stable is not None and
+                len(times) >= MIN_STABLE_REPETITIONS and
+                relative_standard_error(times) <= invocation.until_stable):
+                break
+
+        return return_value, results, histograms
 
     def _get_build_result(self):
         return self._invocation.executable
@@ -35,7 +127,9 @@ class Invoker:
     def _resolve_function_pointer_arguments(self):
         def resolve(b):
             if isinstance(b, funcptr_t):
-                r = self._load_symbol(b.function_name)
+                symbol = self._load_symbol(b.function_name)
+                # The symbol is shared through TheLibraryCache, so tag a copy.
+                r = ctypes.cast(symbol, type(symbol))
                 r.value = b.function_name # this is ugly.
                 return r
             else:
@@ -50,13 +144,56 @@ class Invoker:
         f = self._load_symbol(self._invocation.function)
         
         with self._run_option_manager(self._invocation.run_options):
-            return f(*self.bound_arguments)
+            if not self._profiling:
+                return f(*self.bound_arguments)
+            self._libcfiddle.resume_profile()
+            try:
+                return f(*self.bound_arguments)
+            finally:
+                self._libcfiddle.pause_profile()
+
+    def _start_profile(self):
+        if not self._libcfiddle.start_profile(self._profile_frequency, self._profile_buffer_pages):
+            raise ProfilingFailure(f"Couldn't start profiling: {self._libcfiddle.profile_error().decode()}")
+        self._profiling = True
+
+    def _stop_profile(self):
+        """Stop profiling and return the samples as a :obj:`Profile`.
+
+        The raw samples are absolute addresses, so we find the library
+        each one is in now, while it's still loaded.
+        """
+        lib = self._libcfiddle
+        self._profiling = False
+        lib.stop_profile()
+
+        size = lib.profile_data_size()
+        data = (ctypes.c_uint64 * size)()
+        lib.profile_data(data)
+
+        resolved = {}
+        offset = ctypes.c_uint64()
+        def resolve(address):
+            if address not in resolved:
+                library = lib.profile_resolve(address, ctypes.byref(offset))
+                resolved[address] = (library.decode(), offset.value) if library is not None else (None, address)
+            return resolved[address]
+
+        stacks = []
+        i = 0
+        while i < size:
+            n = data[i]
+            stacks.append([resolve(a) for a in data[i + 1:i + 1 + n]])
+            i += n + 1
+
+        lost = lib.profile_lost_samples()
+        if lost:
+            warnings.warn(f"The profiler lost {lost} samples because its buffer filled up.  Try a bigger profile_buffer_pages or a lower profile_frequency.")
+        return build_profile(stacks, lost, self._get_build_result())
     
     def _load_symbol(self, symbol):
         try:
-            c_lib = ctypes.CDLL(self._get_build_result().lib)
-            #t = getattr(c_lib, self._invocation.function)
-            return getattr(c_lib, symbol)
+            return TheLibraryCache.load_symbol(self._get_build_result().lib, symbol)
         except AttributeError:
             raise RunnerException(f"Couldn't find '{symbol}' in '{self._get_build_result().lib}'.  Do you need to recompile? or declare it `extern \"C\"`?.")
         
@@ -72,26 +209,105 @@ class Invoker:
         self._libcfiddle.clear_stats()
 
     def _collect_data(self):
-        output_file = self._build_results_path()
-        
-        self._write_results(output_file)
+        """Read the measurements out of :code:`libcfiddle`.
 
-        return self._read_results(output_file)
+        Values come back typed: integers (e.g., performance counters) as
+        :obj:`int`, floating point values (e.g., :code:`ET`) as
+        :obj:`float`, and everything else as :obj:`str`.  Missing values
+        are :code:`None`.
+        """
+        lib = self._libcfiddle
+        column_count = lib.export_stats()
+        error = lib.fast_measurement_error()
+        if error:
+            lib.clear_fast_measurement_error()
+            raise FastMeasurementFailure(error.decode())
+        row_count = lib.stats_row_count()
+        results = [dict() for _ in range(row_count)]
 
-    
-    def _read_results(self, output_file):
-        with open(output_file) as infile:
-            return [r for r in csv.DictReader(infile)]
+        for c in range(column_count):
+            name = lib.stats_column_name(c).decode()
+            column_type = lib.stats_column_type(c)
 
-        
-    def _write_results(self, filename):
-        self._libcfiddle.write_stats(ctypes.c_char_p(filename.encode()))
+            if column_type == STATS_STRING:
+                column = [lib.stats_string_value(r, c) for r in range(row_count)]
+                column = [v.decode() if v is not None else None for v in column]
+            else:
+                present = (ctypes.c_char * row_count)()
+                if column_type == STATS_INT64:
+                    values = (ctypes.c_int64 * row_count)()
+                    lib.stats_column_int64(c, values, present)
+                else:
+                    values = (ctypes.c_double * row_count)()
+                    lib.stats_column_double(c, values, present)
+                column = [v if p != b"\0" else None for v, p in zip(values, present)]
 
-    
-    def _build_results_path(self):
-        arg_string = ", ".join(map(lambda x: str(x.value), self.bound_arguments))
-        _, source_file_name = os.path.split(self._get_build_result().build_spec.source_file)
-        result_file_name = f"{source_file_name}.{self._invocation.function}({arg_string}).csv"
-        return os.path.join(self._get_build_result().build_dir, result_file_name)
-    
-    
+            for row, v in zip(results, column):
+                row[name] = v
+
+        return results
+
+    def _collect_histograms(self):
+        """Read the histograms recorded with :code:`cfiddle_hist_record()` out of :code:`libcfiddle`.
+
+        Returns:
+          :obj:`dict` mapping names to :obj:`LatencyHistogram`.
+        """
+        lib = self._libcfiddle
+        histograms = {}
+        for h in range(lib.export_histograms()):
+            name = lib.histogram_name(h).decode()
+
+            count_min_max = (ctypes.c_uint64 * 3)()
+            total = ctypes.c_double()
+            lib.histogram_summary(h, count_min_max, ctypes.byref(total))
+
+            bucket_count = lib.histogram_bucket_count(h)
+            lows = (ctypes.c_uint64 * bucket_count)()
+            highs = (ctypes.c_uint64 * bucket_count)()
+            counts = (ctypes.c_uint64 * bucket_count)()
+            lib.histogram_buckets(h, lows, highs, counts)
+
+            histograms[name] = LatencyHistogram(name,
+                                                list(zip(lows, highs, counts)),
+                                                count=count_min_max[0],
+                                                min=count_min_max[1],
+                                                max=count_min_max[2],
+                                                sum=total.value)
+        return histograms
+
+    def _add_histogram_columns(self, results, histograms):
+        """Add each histogram's summary (see :meth:`LatencyHistogram.summary()`) to every row of :code:`results`.
+
+        If there are histograms but no rows, there's one row with just the summaries.
+        """
+        if not histograms:
+            return results
+
+        summary = {}
+        for h in histograms.values():
+            summary.update(h.summary(self._histogram_percentiles))
+
+        if not results:
+            results = [dict()]
+        for r in results:
+            r.update(summary)
+        return results
+
+
+def relative_standard_error(values):
+    """Return the standard error of the mean of :code:`values` divided by their mean."""
+    mean = statistics.mean(values)
+    if mean == 0:
+        return 0.0 if all(v == 0 for v in values) else float("inf")
+    return statistics.stdev(values) / len(values) ** 0.5 / abs(mean)
+
+
+class ProfilingFailure(CFiddleException):
+    pass
+
+class FastMeasurementFailure(CFiddleException):
+    pass
+
+class NoMeasurements(CFiddleException):
+    pass
@@ -0,0 +1,73 @@
+import ctypes
+import os
+import threading
+
+
+class LibraryCache:
+    """Cache the libraries CFiddle loads with :code:`ctypes` and the symbols it looks up in them.
+
+    Loading a library and looking up a symbol are expensive compared to
+    calling a small function, so we only do each once per process.
+
+    Entries are keyed on the library's path, inode, and modification time,
+    so a library that has been replaced on disk is loaded again.  Note that
+    the dynamic loader may still return the old copy if one with the same
+    path is already loaded, which is why builds produce uniquely-named
+    libraries.
+    """
+
+    def __init__(self):
+        self._libraries = {}
+        self._symbols = {}
+        self._lock = threading.Lock()
+
+    def load_library(self, path):
+        """Return a :obj:`ctypes.CDLL` for :code:`path`, loading it if needed."""
+        key = self._compute_key(path)
+        with self._lock:
+            library = self._libraries.get(key)
+            if library is None:
+                library = ctypes.CDLL(path)
+                self._libraries[key] = library
+        return library
+
+    def load_symbol(self, path, symbol):
+        """Return :code:`symbol` from the library at :code:`path`.
+
+        Raises:
+          AttributeError: if the symbol doesn't exist.
+        """
+        key = (self._compute_key(path), symbol)
+        try:
+            return self._symbols[key]
+        except KeyError:
+            pass
+
+        f = getattr(self.load_library(path), symbol)
+        with self._lock:
+            self._symbols[key] = f
+        return f
+
+    def invalidate(self, path=None):
+        """Forget cached libraries and symbols.
+
+        Args:
+          path: A library or a directory.  Only forget libraries with this path or in this directory.  Defaults to :code:`None`, which forgets everything.
+        """
+        def matches(key):
+            library_path = key[0]
+            return path is None or library_path == path or library_path.startswith(os.path.join(path, ""))
+
+        with self._lock:
+            self._libraries = {k: v for k, v in self._libraries.items() if not matches(k)}
+            self._symbols = {k: v for k, v in self._symbols.items() if not matches(k[0])}
+
+    def _compute_key(self, path):
+        try:
+            s = os.stat(path)
+        except OSError:  # e.g., 'libcfiddle.so', which the loader finds for us.
+            return (path, None, None)
+        return (path, s.st_ino, s.st_mtime_ns)
+
+
+TheLibraryCache = LibraryCache()
@@ -1,10 +1,19 @@
-from .Builder import Builder, InvalidBuildParameter, BuildFailure
+from .Builder import Builder, ExecutableList, InvalidBuildParameter, BuildFailure, BuildFailures
+from .Exceptions import CFiddleException
+import copy
+import hashlib
 import os
 import subprocess
+import tempfile
+import uuid
 import pytest
 from shutil import copyfile
-from .util import environment, invoke_process
-from .Toolchain import TheToolchainRegistry
+from .util import environment, invoke_process, invoke_process_with_usage, read_file
+from .Toolchain import TheToolchainRegistry, TheToolchainProbeCache
+from .BuildCache import BuildCache
+from .LibraryCache import TheLibraryCache
+from .BuildMetrics import BuildMetrics, collect_build_metrics
+from .ProtoParser import LazyPrototypes
 
 import pkg_resources
 
@@ -19,59 +28,129 @@ class MakeBuilder(Builder):
         self._makefile = kwargs.pop("makefile",os.path.join(DATA_PATH, "make", "cfiddle.make"))
         self._rebuild = kwargs.pop("rebuild", False)
         self._verbose = kwargs.pop("verbose", False)
+        self._use_build_cache = kwargs.pop("build_cache", None)
+        self._use_precompiled_headers = kwargs.pop("precompiled_headers", None)
+        self._time_report = kwargs.pop("time_report", None)
 
         super().__init__(*argc, **kwargs)
 
+        from .config import get_config
+        if self._use_build_cache is None:
+            self._use_build_cache = get_config("build_cache")
+        if self._use_precompiled_headers is None:
+            self._use_precompiled_headers = get_config("precompiled_headers")
+        if self._time_report is None:
+            self._time_report = get_config("build_time_report")
 
-    def build(self):
-        self.toolchain = self._resolve_toolchain()
-        
-        so_make_target = self._compute_so_make_target(self.build_directory)
-        so_unique_name = self._compute_so_unique_name(self.build_directory)
+        self._build_cache = BuildCache(os.path.join(self.build_root, "cache"))
 
-        vpath = ":".join([os.path.dirname(self.source_file), self.build_directory])
 
-        parameter_strings  = [f"{name}={value}" for name, value in self.build_parameters.items()]
-        parameter_strings += [f"BUILD={self.build_directory}"]
-        parameter_strings += [f"CFIDDLE_INCLUDE={os.path.join(DATA_PATH, 'include')}"]
-        parameter_strings += [f"CFIDDLE_VPATH={vpath}"]
-        #parameter_strings += [f"COMPILER={self.toolchain.get_compiler()}"]
-        parameter_strings += [f"TARGET={self.toolchain.get_target()}"]
-        
-        base_cmd = ["make",
-                    "-R", # turn off automatic variables
-                    "-f", self._makefile] + parameter_strings
-        
+    def build(self):
+        executable = self._prepare_build()
+        if executable is not None:
+            return executable
+
         if self._rebuild:
             make_targets = ["clean"]
         else:
             make_targets = []
             
-        make_targets.append(so_make_target)
+        make_targets.append(self._so_make_target)
+
+        cmd = self._base_make_cmd() + make_targets
 
         if self._verbose:
-            print(base_cmd + make_targets)
-            print(" ".join(base_cmd + make_targets))
-        output = self._invoke_make(base_cmd + make_targets)
+            print(cmd)
+            print(" ".join(cmd))
+        output, usage = self._invoke_make(cmd)
         if self._verbose:
             print(output)
 
-        copyfile(so_make_target, so_unique_name)
+        return self._finish_build(output, self._build_manual_make_cmd(cmd), usage)
+
+
+    def _prepare_build(self):
+        # Everything we need to do before running make.  Returns the
+        # cached Executable if there is one.
+        self.toolchain = self._resolve_toolchain()
+        self._so_make_target = self._compute_so_make_target(self.build_directory)
+
+        self._cache_key = None
+        if self._use_build_cache:
+            self._cache_key = self._compute_cache_key()
+            if not self._rebuild:
+                cached = self._build_cache.lookup(self._cache_key)
+                if cached is not None:
+                    if self._verbose:
+                        print(f"Using cached build of {self.source_file} in {self.build_directory}")
+                    return self._executable_from_cache(cached)
+        return None
+
+
+    def _make_variables(self):
+        vpath = ":".join([os.path.dirname(self.source_file), self.build_directory])
+
+        variables  = list(self.build_parameters.items())
+        variables += [("BUILD", self.build_directory)]
+        variables += [("CFIDDLE_INCLUDE", os.path.join(DATA_PATH, 'include'))]
+        variables += [("CFIDDLE_VPATH", vpath)]
+        #variables += [("COMPILER", self.toolchain.get_compiler())]
+        variables += [("TARGET", self.toolchain.get_target())]
+        if self._use_precompiled_headers and self.build_spec.get_language() == "c++":
+            variables += [("PCH_DIR", self._compute_pch_directory())]
+        if self._time_report:
+            variables += [("TIME_REPORT_FLAGS", " ".join(self.toolchain.get_time_report_flags()))]
+        return variables
+
 
-        functions = self.parser.parse_file(self.source_file)
+    def _compute_pch_directory(self):
+        # The precompiled header depends on the compiler and flags, so
+        # builds with the same build parameters (other than the extra
+        # sources) can share it.
+        m = hashlib.md5()
+        parameters = [f"{p}={v}" for p, v in sorted(self.build_parameters.items()) if p != "MORE_SRC"]
+        m.update("\n".join(parameters + [self.toolchain.get_target()]).encode())
+        return os.path.join(self.build_root, "pch", m.hexdigest())
 
-        extra_source = self._collect_extra_source()
 
-        for e in extra_source:
-            functions.update(self.parser.parse_file(e))
+    def _base_make_cmd(self):
+        return ["make",
+                "-R", # turn off automatic variables
+                "-f", self._makefile] + [f"{name}={value}" for name, value in self._make_variables()]
+
+
+    def _finish_build(self, output, build_command, usage=None, batch=None):
+        # Everything we need to do after make succeeds.
+        so_unique_name = self._compute_so_unique_name(self.build_directory)
+        copyfile(self._so_make_target, so_unique_name)
+        TheLibraryCache.invalidate(self.build_directory)
+
+        build_metrics = collect_build_metrics(usage,
+                                              self._compute_object_files(),
+                                              self._so_make_target,
+                                              output=output,
+                                              time_report=self._time_report,
+                                              batch=batch)
+
+        if self._cache_key is not None:
+            self._build_cache.store(self._cache_key,
+                                    dict(lib=so_unique_name,
+                                         toolchain=self.toolchain,
+                                         build_command=build_command,
+                                         output=output,
+                                         build_metrics=build_metrics,
+                                         build_parameters=dict(self.build_parameters)),
+                                    dependency_files=self._compute_dependency_files(),
+                                    output_files=[self._so_make_target, so_unique_name])
             
         return self.result_factory(lib=so_unique_name,
                                    toolchain=self.toolchain,
-                                   functions=functions,
-                                   build_command=self._build_manual_make_cmd(base_cmd + make_targets),
+                                   functions=self._lazy_functions(),
+                                   build_command=build_command,
                                    build_dir=self.build_directory,
                                    output=output,
-                                   build_spec=self.build_spec)
+                                   build_spec=self.build_spec,
+                                   build_metrics=build_metrics)
 
 
     def rebuild(self, rebuild=True):
@@ -86,6 +165,44 @@ class MakeBuilder(Builder):
         self._verbose = verbose
 
 
+    def _compute_cache_key(self):
+        return self._build_cache.compute_key(sources=[self.source_file] + self._collect_extra_source(),
+                                             build_parameters=self.build_parameters,
+                                             tools=[self.toolchain.get_compiler()],
+                                             extra=[self._makefile, read_file(self._makefile), DATA_PATH, self.build_directory, self._use_precompiled_headers, self._time_report])
+
+    
+    def _compute_dependency_files(self):
+        return self._compute_build_products(".d")
+
+
+    def _compute_object_files(self):
+        return self._compute_build_products(".o")
+
+
+    def _compute_build_products(self, suffix):
+        sources = [self.source_file] + self._collect_extra_source()
+        return [os.path.join(self.build_directory, f"{os.path.splitext(os.path.basename(s))[0]}{suffix}") for s in sources]
+
+    
+    def _executable_from_cache(self, cached):
+        self.build_spec.build_parameters.update(cached["build_parameters"])
+        build_metrics = copy.copy(cached.get("build_metrics") or BuildMetrics())
+        build_metrics.cached = True
+        return self.result_factory(lib=cached["lib"],
+                                   toolchain=cached["toolchain"],
+                                   functions=self._lazy_functions(),
+                                   build_command=cached["build_command"],
+                                   build_dir=self.build_directory,
+                                   output=cached["output"],
+                                   build_spec=self.build_spec,
+                                   build_metrics=build_metrics)
+
+        
+    def _lazy_functions(self):
+        return LazyPrototypes(self.parser, [self.source_file] + self._collect_extra_source())
+
+
     def _collect_extra_source(self):
         if "MORE_SRC" in self.build_parameters:
             return self.build_parameters["MORE_SRC"].split()
@@ -94,7 +211,7 @@ class MakeBuilder(Builder):
         
         
     def _get_multiarch_string(self, tool):
-        success, value = invoke_process([tool, "-print-multiarch"])
+        success, value = TheToolchainProbeCache.probe([tool, "-print-multiarch"])
         if not success:
             raise ToolError(f"Couldn't extract multiarch string from {tool}")
         else:
@@ -120,10 +237,10 @@ class MakeBuilder(Builder):
 
     
     def _invoke_make(self, cmd):
-        success, output = invoke_process(cmd)
+        success, output, usage = invoke_process_with_usage(cmd)
         if not success:
             raise BuildFailure(" ".join(cmd), output)
-        return output
+        return output, usage
 
     
     def _compute_so_make_target(self, build_directory):
@@ -148,3 +265,157 @@ class MakeBuilder(Builder):
             return "g++", "CXX"
         elif language.upper() == "GO":
             return "go", "GO"
+
+
+def build_in_batch(builders, jobs=None, verbose=False, progress_bar=None):
+    """Build several :obj:`MakeBuilder` objects with a single :code:`make` command.
+
+    This writes a makefile that includes each builder's makefile once per
+    build, with that build's parameters set, and then runs one
+    :code:`make -k -j` for all the libraries.  :code:`make` reads the
+    makefiles and checks dependencies once, and schedules the
+    compilations across :code:`jobs` processes.
+
+    Each inclusion sets the parameters with :code:`override` (so they
+    take precedence, as they would on the command line), and then
+    undefines them.  The values recipes see come from pattern-specific
+    variables on the build's directory (and its precompiled header
+    directory, if it has one).
+
+    Builds that are cached don't run :code:`make` at all.  Builders that
+    use :code:`rebuild=True` or :code:`time_report=True` (since the
+    compiler's reports would be interleaved) or aren't
+    :obj:`MakeBuilder` objects are built separately.  Builds that share a build directory, use different
+    sources with the same name, or use different makefiles go in separate
+    batches.  If a batch fails, its builds are retried one at a time so
+    that errors are reported for each failed build.
+
+    :code:`make`'s time and memory usage covers the whole batch, so the
+    :obj:`BuildMetrics` for builds done in a batch report the batch's,
+    and their :code:`batch` identifies the batch.
+
+    Args:
+      builders: A list of :obj:`Builder` objects.
+      jobs: Number of parallel jobs for :code:`make`.  :code:`None` means :func:`os.cpu_count()`.
+      verbose: Print the generated makefile and :code:`make`'s output.
+      progress_bar: Progress bar to wrap the batches (and separate builds) in.  Defaults to none.
+
+    Returns:
+      :obj:`ExecutableList`: The results of each build in the same order as :code:`builders`.
+    """
+    if jobs is None:
+        jobs = os.cpu_count()
+
+    if progress_bar is None:
+        progress_bar = lambda x, *argc, **kwargs: x
+
+    results = [None] * len(builders)
+    steps = []
+    pending = []
+
+    for i, b in enumerate(builders):
+        if not isinstance(b, MakeBuilder) or b._rebuild or b._time_report:
+            steps.append([i])
+            continue
+        results[i] = b._prepare_build()
+        if results[i] is None:
+            pending.append(i)
+
+    steps += _split_into_batches(builders, pending)
+
+    failures = []
+    def build_individually(indices):
+        for i in indices:
+            try:
+                results[i] = builders[i].build()
+            except CFiddleException as e:
+                failures.append((i, e))
+
+    for step in progress_bar(steps, miniters=1):
+        if len(step) == 1:
+            build_individually(step)
+            continue
+
+        success, output, build_command, usage = _run_batch([builders[i] for i in step], jobs, verbose)
+        if success:
+            batch = uuid.uuid4().hex
+            for i in step:
+                results[i] = builders[i]._finish_build(output, build_command, usage, batch=batch)
+        else:
+            build_individually(step)
+
+    if failures:
+        failures.sort(key=lambda x: x[0])
+        raise BuildFailures([(builders[i].build_spec, e) for i, e in failures], ExecutableList(results))
+
+    return ExecutableList(results)
+
+
+def _split_into_batches(builders, indices):
+    batches = []
+    for i in indices:
+        b = builders[i]
+        for batch in batches:
+            if _fits_in_batch(b, [builders[j] for j in batch]):
+                batch.append(i)
+                break
+        else:
+            batches.append([i])
+    return batches
+
+
+def _fits_in_batch(builder, batch):
+    # vpath is global in make, so a source name must refer to the same file throughout a batch.
+    sources = dict()
+    for b in batch:
+        for s in [b.source_file] + b._collect_extra_source():
+            sources[os.path.basename(s)] = os.path.abspath(s)
+
+    for s in [builder.source_file] + builder._collect_extra_source():
+        if sources.get(os.path.basename(s), os.path.abspath(s)) != os.path.abspath(s):
+            return False
+
+    return all(b.build_directory != builder.build_directory and b._makefile == builder._makefile for b in batch)
+
+
+def _run_batch(builders, jobs, verbose):
+    build_root = builders[0].build_root
+    os.makedirs(build_root, exist_ok=True)
+    fd, makefile = tempfile.mkstemp(dir=build_root, prefix="batch_", suffix=".make")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(_batch_makefile(builders))
+
+        cmd = ["make", "-R", "-k", f"-j{jobs}", "-f", makefile] + [b._so_make_target for b in builders]
+
+        if verbose:
+            print(read_file(makefile))
+            print(" ".join(cmd))
+        success, output, usage = invoke_process_with_usage(cmd)
+        if verbose:
+            print(output)
+    finally:
+        os.unlink(makefile)
+
+    return success, output, " ".join(cmd), usage
+
+
+def _batch_makefile(builders):
+    lines = [f"# Generated by cfiddle to build {len(builders)} libraries with one make."]
+
+    for b in builders:
+        variables = b._make_variables()
+        lines.append("")
+        lines += [f"override {name} = {_escape_make_value(value)}" for name, value in variables]
+        lines.append(f"include {b._makefile}")
+        directories = [b.build_directory] + [value for name, value in variables if name == "PCH_DIR"]
+        lines += [f"{d}/%: {name} = {_escape_make_value(value)}" for d in directories for name, value in variables]
+        lines += [f"override undefine {name}" for name, _ in variables]
+
+    return "\n".join(lines) + "\n"
+
+
+def _escape_make_value(value):
+    # Values pass through just as they would on make's command line,
+    # except that '#' would start a comment.
+    return str(value).replace("#", "\\#")
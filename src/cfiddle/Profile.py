@@ -0,0 +1,193 @@
+import collections
+
+import pandas as pd
+
+from .CodeIndex import CodeIndex
+from .DebugInfo import DWARF_INDEX_ERRORS
+from .Demangler import TheDemangler, DemanglingFailure
+from .util import same_file
+
+
+Location = collections.namedtuple("Location", "function,file,line")
+Location.__doc__ = """Where an address in a profile is.
+
+Each field is :code:`None` if we don't know.
+
+Attributes:
+  function: The name of the function (i.e., mangled, for C++).
+  file: The source file.
+  line: The line in the source file.
+"""
+
+
+class Profile:
+    """Where a function spent its time, from :code:`run(..., profile=True)`.
+
+    The samples come from the kernel (like :code:`perf record -g`):
+    each sample is the call stack at that moment.  The innermost frame
+    is always right, but the callers are found by following frame
+    pointers, so they are only reliable if the code is compiled with
+    :code:`-fno-omit-frame-pointer`.  Only the thread that called the
+    function is sampled.
+
+    Addresses are offsets from where each library is loaded (i.e., the
+    addresses in :code:`objdump` and :obj:`CodeIndex`).  For frames
+    other than the innermost, the address is the one just before the
+    return address, so it's in the calling instruction.
+
+    Attributes:
+      samples: :obj:`list` of call stacks, one per sample.  Each is a :obj:`tuple` of :code:`(library, address)` frames, innermost first.  If we don't know what library the innermost frame is in, :code:`library` is :code:`None` and :code:`address` is the absolute address.
+      locations: :obj:`dict` mapping each :code:`(library, address)` to a :obj:`Location`.
+      lost: The number of samples the kernel dropped because the buffer was full.
+    """
+
+    def __init__(self, samples, locations, lost=0):
+        self.samples = samples
+        self.locations = locations
+        self.lost = lost
+
+    @property
+    def sample_count(self):
+        return len(self.samples)
+
+    def functions(self, demangle=True):
+        """Return the hottest functions as a Pandas dataframe.
+
+        :code:`self` is the number of samples in the function itself, and
+        :code:`total` includes the functions it calls.  The
+        :code:`_percent` columns are percentages of all the samples.
+
+        Returns:
+          :obj:`Dataframe`: With columns :code:`function`, :code:`library`, :code:`self`, :code:`total`, :code:`self_percent`, and :code:`total_percent`, sorted by :code:`self`.
+        """
+        self_counts = collections.Counter()
+        total_counts = collections.Counter()
+        for stack in self.samples:
+            functions = [self._function(frame) for frame in stack]
+            if functions:
+                self_counts[functions[0]] += 1
+            for f in set(functions):
+                total_counts[f] += 1
+
+        rows = [dict(function=name, library=library, self=self_counts[(library, name)], total=total)
+                for (library, name), total in total_counts.items()]
+        df = pd.DataFrame(rows, columns=["function", "library", "self", "total"])
+        if demangle:
+            df["function"] = _demangle(df["function"])
+        return self._add_percentages(df, ["self", "total"]).sort_values(["self", "total"], ascending=False, ignore_index=True)
+
+    def lines(self):
+        """Return the hottest source lines (of the innermost frames) as a Pandas dataframe.
+
+        Returns:
+          :obj:`Dataframe`: With columns :code:`file`, :code:`line`, :code:`samples`, and :code:`percent`, sorted by :code:`samples`.  Samples in code without line numbers aren't included.
+        """
+        counts = collections.Counter()
+        for stack in self.samples:
+            if stack:
+                location = self.locations.get(stack[0])
+                if location is not None and location.line is not None:
+                    counts[(location.file, location.line)] += 1
+
+        df = pd.DataFrame([dict(file=f, line=l, samples=c) for (f, l), c in counts.items()], columns=["file", "line", "samples"])
+        return self._add_percentages(df, ["samples"]).sort_values("samples", ascending=False, ignore_index=True)
+
+    def instructions(self, demangle=True):
+        """Return the hottest instructions (i.e., innermost frames) as a Pandas dataframe.
+
+        Returns:
+          :obj:`Dataframe`: With columns :code:`library`, :code:`address`, :code:`function`, :code:`file`, :code:`line`, :code:`samples`, and :code:`percent`, sorted by :code:`samples`.
+        """
+        counts = collections.Counter(stack[0] for stack in self.samples if stack)
+        rows = []
+        for (library, address), c in counts.items():
+            location = self.locations.get((library, address), Location(None, None, None))
+            rows.append(dict(library=library, address=address, function=location.function, file=location.file, line=location.line, samples=c))
+        df = pd.DataFrame(rows, columns=["library", "address", "function", "file", "line", "samples"])
+        if demangle:
+            df["function"] = _demangle(df["function"])
+        return self._add_percentages(df, ["samples"]).sort_values("samples", ascending=False, ignore_index=True)
+
+    def address_counts(self, library):
+        """Return a :obj:`dict` mapping addresses in :code:`library` to the number of samples there (in the innermost frame)."""
+        counts = collections.Counter()
+        matches = {}
+        for stack in self.samples:
+            if not stack:
+                continue
+            frame_library, address = stack[0]
+            if frame_library not in matches:
+                matches[frame_library] = same_file(frame_library, library)
+            if matches[frame_library]:
+                counts[address] += 1
+        return dict(counts)
+
+    def _function(self, frame):
+        location = self.locations.get(frame)
+        name = location.function if location is not None and location.function is not None else f"{frame[1]:#x}"
+        return frame[0], name
+
+    def _add_percentages(self, df, columns):
+        for c in columns:
+            df[f"{c}_percent" if len(columns) > 1 else "percent"] = df[c] * 100.0 / self.sample_count if self.sample_count else 0.0
+        return df
+
+    def __repr__(self):
+        return f"Profile({self.sample_count} samples, {self.lost} lost)"
+
+
+def build_profile(stacks, lost, executable):
+    """Build a :obj:`Profile` from raw samples.
+
+    Args:
+      stacks: :obj:`list` of call stacks.  Each is a :obj:`list` of :code:`(library, offset)` frames, innermost first, where :code:`offset` is the frame's address (or return address, for the outer frames) relative to where :code:`library` is loaded.  :code:`library` is :code:`None` if we don't know it.
+      lost: The number of samples that were lost.
+      executable: The :obj:`InstrumentedExecutable` that was running.  We use its :meth:`code_index()` to find lines in its source.
+    """
+    samples = []
+    for stack in stacks:
+        frames = []
+        for depth, (library, offset) in enumerate(stack):
+            if depth == 0:
+                frames.append((library, offset))
+            elif library is not None:
+                # Return addresses point after the call.  Frames we can't
+                # place are usually garbage from code without frame pointers.
+                frames.append((library, offset - 1))
+        samples.append(tuple(frames))
+
+    indices = {}
+    locations = {}
+    for frame in set(f for s in samples for f in s):
+        library, address = frame
+        if library is None:
+            locations[frame] = Location(None, None, None)
+            continue
+        if library not in indices:
+            indices[library] = _code_index_for(library, executable)
+        index = indices[library]
+        if index is None:
+            locations[frame] = Location(None, None, None)
+            continue
+        file, line = index.find_address(address) or (None, None)
+        locations[frame] = Location(index.find_function(address), file, line)
+
+    return Profile(samples, locations, lost=lost)
+
+
+def _code_index_for(library, executable):
+    try:
+        if same_file(library, executable.lib):
+            return executable.code_index()
+        return CodeIndex.build(library, None, None, None, None, None, None)
+    except DWARF_INDEX_ERRORS:
+        return None
+
+
+def _demangle(names):
+    names = list(names)
+    try:
+        demangled = TheDemangler.demangle_all(list(set(names)))
+    except DemanglingFailure:
+        return names
+    return [demangled[n] for n in names]
@@ -2,6 +2,9 @@ import pytest
 import re
 import ctypes
 import collections
+import hashlib
+import io
+import threading
 
 from .Exceptions import CFiddleException
 
@@ -23,6 +26,74 @@ class ProtoParser:
     def parse_file(filename):
         raise NotImplementedError("parse_file")
 
+    def parse_file_cached(self, filename):
+        """Like :meth:`parse_file`, but reuse the result for files with the same contents (see :obj:`ProtoParseCache`)."""
+        return TheProtoParseCache.parse(self, filename)
+
+
+class ProtoParseCache:
+    """Parsed prototypes, keyed on the type of parser and a hash of the file's contents.
+
+    Building many variants of one source file (e.g., with different
+    :code:`OPTIMIZE` flags) only parses it once.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def parse(self, parser, filename):
+        """Return the prototypes :code:`parser` finds in :code:`filename`.
+
+        Returns:
+          :obj:`dict`: A new :obj:`dict` mapping function names to :obj:`Prototype` objects.
+        """
+        with open(filename, "rb") as f:
+            return self.parse_contents(parser, f.read())
+
+    def parse_contents(self, parser, contents):
+        """Like :meth:`parse()`, but parse :code:`contents` (:obj:`bytes`) instead of reading a file."""
+        key = (type(parser), hashlib.sha256(contents).hexdigest())
+        with self._lock:
+            table = self._tables.get(key)
+
+        if table is None:
+            table = parser.parse_file(io.StringIO(contents.decode()))
+            with self._lock:
+                self._tables[key] = table
+
+        return dict(table)
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+
+class LazyPrototypes:
+    """Parse the prototypes in a list of source files the first time they are needed.
+
+    :obj:`Executable` calls this on the first access to :code:`functions`.
+
+    The files are read when this is created (i.e., when the build
+    happens), so changing them afterward doesn't change the prototypes.
+    """
+
+    def __init__(self, parser, filenames):
+        self.parser = parser
+        self.filenames = filenames
+        self.contents = []
+        for filename in filenames:
+            with open(filename, "rb") as f:
+                self.contents.append(f.read())
+
+    def __call__(self):
+        functions = {}
+        for contents in self.contents:
+            functions.update(TheProtoParseCache.parse_contents(self.parser, contents))
+        return functions
+
     
 Prototype = collections.namedtuple("Prototype", "return_type,name,parameters")
 Parameter = collections.namedtuple("Parameter", "type,name")
+
+TheProtoParseCache = ProtoParseCache()
@@ -1,16 +1,25 @@
+import collections
 import copy
+import fcntl
 import os
 import pickle
 import click
 import subprocess
+import sys
+import threading
+import atexit
+import concurrent.futures
+import multiprocessing
+import struct
 import uuid
 
 from .Builder import Executable
 from .Exceptions import CFiddleException
-from .util import type_check, type_check_list
+from .util import type_check, type_check_list, file_digest
 
 class InvocationDescription:
-    def __init__(self, executable, function, arguments, perf_counters=None, run_options=None):
+    def __init__(self, executable, function, arguments, perf_counters=None, run_options=None,
+                 repetitions=None, warmup=0, until_stable=None, profile=False):
         if perf_counters is None:
             perf_counters = []
         if run_options is None:
@@ -21,8 +30,15 @@ class InvocationDescription:
         self.arguments = arguments
         self.perf_counters = perf_counters
         self.run_options = run_options
+        self.repetitions = repetitions
+        self.warmup = warmup
+        self.until_stable = until_stable
+        self.profile = profile
         self._raise_on_invalid_types()
 
+    def is_repeated(self):
+        return self.repetitions is not None or self.until_stable is not None
+
     def _raise_on_invalid_types(self):
 
         try:
@@ -34,6 +50,15 @@ class InvocationDescription:
         except (ValueError, TypeError) as e:
             raise InvalidInvocation(e)
 
+        if self.repetitions is not None and (not isinstance(self.repetitions, int) or self.repetitions < 1):
+            raise InvalidInvocation(f"'repetitions' must be a positive integer, not '{self.repetitions}'.")
+        if not isinstance(self.warmup, int) or self.warmup < 0:
+            raise InvalidInvocation(f"'warmup' must be a non-negative integer, not '{self.warmup}'.")
+        if self.until_stable is not None and (not isinstance(self.until_stable, (int, float)) or self.until_stable <= 0):
+            raise InvalidInvocation(f"'until_stable' must be a positive number, not '{self.until_stable}'.")
+        if not isinstance(self.profile, bool):
+            raise InvalidInvocation(f"'profile' must be True or False, not '{self.profile}'.")
+
         
 class RunOptionInterpreter(object):
     """
@@ -90,6 +115,20 @@ class Runner:
     Creating a subclass allows for other execution methods.  Notably,
     :class:`DirectRunner` runs the function in the current Python
     process, which can be useful in some instances.
+
+    The results file in the runner's directory (under
+    :code:`CFIDDLE_BUILD_ROOT`) is an append-only journal of the
+    invocations that have completed.  If you pass a :code:`checkpoint`
+    name, the runner uses :code:`CFIDDLE_BUILD_ROOT/<checkpoint>` as its
+    directory.  If the journal there already has results (e.g., from a
+    run that crashed or was interrupted), they are reused and only the
+    remaining invocations run.  Invocations match if they have the same
+    source file (and contents), build parameters, function, arguments,
+    run options, performance counters, repetitions, warmup,
+    :code:`until_stable`, and :code:`profile` (see
+    :func:`invocation_key()`).  Results in the journal that don't match
+    any of the invocations are ignored.  A checkpoint name can't contain
+    path separators, and only one run can use a checkpoint at a time.
     
     """
 
@@ -97,7 +136,8 @@ class Runner:
                  invoker=None,
                  result_factory=None,
                  result_list_factory=None,
-                 progress_bar=None):
+                 progress_bar=None,
+                 checkpoint=None):
         from .config import get_config
         self._invocations = invocations
         self._invoker = invoker or get_config("Invoker_type")
@@ -105,47 +145,234 @@ class Runner:
         self._result_list_factory = result_list_factory or get_config("InvocationResultsList_type")
         self._progress_bar = progress_bar or get_config("ProgressBar")
         self._cmd_runner = get_config("RunnerDelegate_type")
-        self._uuid = get_uuid()
+        if checkpoint is not None:
+            _check_checkpoint_name(checkpoint)
+        self._checkpoint = checkpoint
+        self._uuid = checkpoint or get_uuid()
 
 
     def run(self):
-        cmd_runner = self._cmd_runner()
-        
+        keyed = []
+        for key, r in self._progress_bar(self._streamed_run(), total=len(self._invocations), miniters=1):
+            keyed.append((key, r))
+
+        if self._checkpoint is not None:
+            # Results from the journal come first, so restore the original order.
+            order = {}
+            for i, invocation in enumerate(self._invocations):
+                order.setdefault(invocation_key(invocation), []).append(i)
+            # A key won't match if the source changed during the run.  Put those results last.
+            keyed.sort(key=lambda kr: order[kr[0]].pop(0) if order.get(kr[0]) else len(self._invocations))
+
+        results = self._result_list_factory()
+        for _, r in keyed:
+            results.append(r)
+        return results
+
+    def iter_run(self, batch_size=None):
+        """Run the invocations and yield the results as they complete.
+
+        The results don't all have to fit in memory, and if the run fails
+        part way through, you still get the results that finished.
+
+        Args:
+          batch_size: If not :code:`None`, yield lists of up to this many results instead of individual results.
+        """
+        results = (r for _, r in self._streamed_run())
+        if batch_size is None:
+            return results
+        return self._batched(results, batch_size)
+
+    def _batched(self, results, batch_size):
+        batch = self._result_list_factory()
+        for r in results:
+            batch.append(r)
+            if len(batch) == batch_size:
+                yield batch
+                batch = self._result_list_factory()
+        if batch:
+            yield batch
+
+    def _streamed_run(self):
+        # Yields (key, result) pairs, where key is the invocation_key()
+        # of the result's invocation.
+        #
+        # cfiddle-run writes each result to the results file as it
+        # completes (see do_invoke_runner()).  We run the delegate in a
+        # thread and read the results as they arrive.
         runner_filename, results_filename = self._temp_files()
-        if os.path.exists(results_filename):
-            os.remove(results_filename)
 
-        self._pickle_run(runner_filename)
+        # Hold a lock on the journal for the whole run, so two runs with
+        # the same checkpoint can't append to it at once.
+        with open(results_filename, "a+b") as journal:
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RunnerException(f"Another run is using checkpoint '{self._checkpoint}'.")
+            yield from self._journaled_run(runner_filename, results_filename, journal)
 
-        cmd_runner.execute(["cfiddle-run", "--runner", runner_filename, "--results", results_filename], runner=self)
+    def _journaled_run(self, runner_filename, results_filename, journal):
+        cmd_runner = self._cmd_runner()
+
+        keys = [invocation_key(i) for i in self._invocations]
+        needed = collections.Counter(keys)
+        matching = collections.defaultdict(list)
+        for key, i in zip(keys, self._invocations):
+            matching[key].append(i)
+
+        completed, journal_end = self._read_journal(journal)
+        reused = collections.Counter()
+        for key, _, r in completed:
+            if reused[key] < needed[key]:
+                if r.invocation is None:
+                    r.invocation = matching[key][reused[key]]
+                reused[key] += 1
+                yield key, r
+
+        remaining = []
+        for key, i in zip(keys, self._invocations):
+            if reused[key] > 0:
+                reused[key] -= 1
+            else:
+                remaining.append(i)
+
+        if completed and not remaining:
+            return
+
+        runner = copy.copy(self)
+        runner._invocations = remaining
+        self._pickle_run(runner_filename, runner)
+
+        failure = []
+        def execute():
+            try:
+                cmd_runner.execute(["cfiddle-run", "--runner", runner_filename, "--results", results_filename], runner=self)
+            except Exception as e:
+                failure.append(e)
+
+        delegate = threading.Thread(target=execute, daemon=True)
+        delegate.start()
+
+        with open(results_filename, "rb") as results:
+            results.seek(journal_end)
+            while True:
+                finished = not delegate.is_alive()
+
+                for kind, value in read_records(results):
+                    if kind == "result":
+                        key, index, r = value
+                        if r.invocation is None:
+                            r.invocation = remaining[index]
+                        yield key, r
+                    elif kind == "error":
+                        delegate.join()
+                        raise value
+                    elif kind == "done":
+                        delegate.join()
+                        if failure:
+                            raise failure[0]
+                        return
+
+                if finished:
+                    if failure:
+                        raise failure[0]
+                    raise RunnerException(f"cfiddle-run exited before finishing the run.  Results are in '{results_filename}'.")
+
+                delegate.join(timeout=0.01)
 
-        r = self._unpickle_results(results_filename)
-        if isinstance(r, Exception):
-            raise r
-        else:
-            return r
-        
     def _delegated_run(self):
-        l = self._result_list_factory()
-        for i in self._progress_bar(self._invocations, miniters=1):
-            l.append(self._invoker(i, self._result_factory).run())
-        return l
-    
+        results = self._result_list_factory()
+        for r in self._progress_bar(self._delegated_iter(), total=len(self._invocations), miniters=1):
+            results.append(r)
+        return results
+
+    def _delegated_iter(self):
+        from .config import get_config
+        cpus = get_config("run_cpus")
+
+        if cpus:
+            return self._scheduled_run(cpus)
+        else:
+            return (self._invoker(i, self._result_factory).run() for i in self._invocations)
+
+    def _scheduled_run(self, cpus):
+        # Yields the results in order.  If an invocation kills its worker
+        # (e.g., with a segmentation fault), the pool breaks and every
+        # invocation that hadn't finished fails with it.  We keep the
+        # results that had finished and start a new pool for the rest.
+        # The ones that were running when the pool broke run again by
+        # themselves, so we can tell which one crashed.  Only that one is
+        # lost, and we raise RunnerException about it at the end.
+        cpus = resolve_cpu_list(cpus)
+        context = multiprocessing.get_context("fork")
+        started = context.Array("b", len(self._invocations), lock=False)
+
+        pending = list(range(len(self._invocations)))
+        suspects = []
+        finished = {}
+        crashed = set()
+        next_result = 0
+
+        while pending or suspects:
+            if pending:
+                batch, pending = pending, []
+            else:
+                batch = [suspects.pop(0)]
+
+            available_cpus = context.Queue()
+            for c in cpus:
+                available_cpus.put(c)
+
+            with concurrent.futures.ProcessPoolExecutor(max_workers=len(cpus) if len(batch) > 1 else 1,
+                                                        mp_context=context,
+                                                        initializer=_start_worker,
+                                                        initargs=(available_cpus, started)) as executor:
+                futures = [executor.submit(_run_invocation, self._invoker, self._result_factory, i, self._invocations[i]) for i in batch]
+                for i, f in zip(batch, futures):
+                    try:
+                        finished[i] = f.result()
+                    except concurrent.futures.process.BrokenProcessPool:
+                        if len(batch) == 1:
+                            crashed.add(i)
+                        elif started[i]:
+                            suspects.append(i)
+                        else:
+                            pending.append(i)
+
+                    while next_result < len(self._invocations) and (next_result in finished or next_result in crashed):
+                        r = finished.pop(next_result, None)
+                        if r is not None:
+                            # The worker doesn't send back its copy of the invocation, so use ours.
+                            r.invocation = self._invocations[next_result]
+                            yield r
+                        next_result += 1
+
+        if crashed:
+            described = ", ".join(f"{self._invocations[i].function}({self._invocations[i].arguments})" for i in sorted(crashed))
+            raise RunnerException(f"A worker process died while running {described} on CPUs {cpus}.  The other invocations completed.")
+
     def get_invocations(self):
         return self._invocations
 
-    def _pickle_run(self, f):
+    def _read_journal(self, journal):
+        # Return the (key, index, result) records already in the journal and where they end.
+        # Drop anything after the last complete record, since a crash
+        # might have left a partial record behind.
+        journal.seek(0)
+        completed = [value for kind, value in read_records(journal) if kind == "result"]
+        end = journal.tell()
+        journal.truncate(end)
+        journal.flush()
+        return completed, end
+
+    def _pickle_run(self, f, runner=None):
         from .config import peek_config
         with open(f, "wb") as r:
-            pickle.dump(dict(config=peek_config(), runner=self), r)
-
-    def _unpickle_results(self, f):
-        with open(f, "rb") as r:
-            return pickle.load(r)
+            pickle.dump(dict(config=peek_config(), runner=runner or self), r)
 
     def _temp_files(self):
         from .config import get_config
-        os.makedirs(os.path.join(get_config("CFIDDLE_BUILD_ROOT"), self._uuid))
+        os.makedirs(os.path.join(get_config("CFIDDLE_BUILD_ROOT"), self._uuid), exist_ok=self._checkpoint is not None)
         return os.path.join(get_config("CFIDDLE_BUILD_ROOT"), self._uuid, "runner.pickle"), os.path.join(get_config("CFIDDLE_BUILD_ROOT"), self._uuid, "results.pickle")
 
     
@@ -201,16 +428,81 @@ class DirectRunner(Runner):
 
     """
     
+    def __init__(self, *argv, checkpoint=None, **kwargs):
+        if checkpoint is not None:
+            raise RunnerException("DirectRunner doesn't support checkpoints.")
+        super().__init__(*argv, **kwargs)
+
     def run(self):
         return self._delegated_run()
 
+    def _streamed_run(self):
+        # There's no journal, so we don't need the keys.
+        return ((None, r) for r in self._delegated_iter())
+
+
+def resolve_cpu_list(cpus):
+    """
+    Turn the :code:`run_cpus` configuration option into a list of CPU numbers.
+
+    :code:`cpus` can be a list of CPU numbers, a string in the kernel's
+    cpulist format (e.g., :code:`"2-5,8"`), or :code:`"isolated"` for the
+    CPUs set aside with the :code:`isolcpus` kernel parameter.
+    """
+    if cpus == "isolated":
+        try:
+            with open("/sys/devices/system/cpu/isolated") as f:
+                cpus = f.read().strip()
+        except OSError:
+            cpus = ""
+        if not cpus:
+            raise RunnerException("run_cpus is 'isolated', but there are no isolated CPUs.")
+
+    if isinstance(cpus, str):
+        cpus = parse_cpu_list(cpus)
+
+    cpus = list(dict.fromkeys(cpus))
+    unavailable = set(cpus) - os.sched_getaffinity(0)
+    if unavailable:
+        raise RunnerException(f"Can't run on CPUs {sorted(unavailable)}.  The available CPUs are {sorted(os.sched_getaffinity(0))}.")
+    return cpus
+
+
+def parse_cpu_list(cpu_list):
+    cpus = []
+    for r in cpu_list.split(","):
+        r = r.strip()
+        if not r:
+            continue
+        if "-" in r:
+            low, high = r.split("-")
+            cpus += list(range(int(low), int(high) + 1))
+        else:
+            cpus.append(int(r))
+    return cpus
+
+
+_started_invocations = None
+
+def _start_worker(available_cpus, started):
+    global _started_invocations
+    _started_invocations = started
+    os.sched_setaffinity(0, [available_cpus.get()])
+
+
+def _run_invocation(invoker, result_factory, index, invocation):
+    _started_invocations[index] = 1
+    return _without_invocation(invoker(invocation, result_factory).run())
+
 
 class InvocationResult:
 
-    def __init__(self, invocation, results, return_value):
+    def __init__(self, invocation, results, return_value, histograms=None, profile=None):
         self.invocation = invocation
         self.results = results
         self.return_value = return_value
+        self.histograms = histograms if histograms is not None else {}
+        self.profile = profile
         
     def get_results_field_names(self):
         if len(self.results) == 0:
@@ -235,6 +527,149 @@ class SubprocessDelegate:
         except subprocess.CalledProcessError as e:
             raise RunnerDelegateException(f"SubprocessDelegate failed (error code {e.returncode}): {e.stdout} {e.stderr}")
 
+
+class WorkerDelegate:
+    """
+    Run :code:`cfiddle-run` commands in long-lived worker processes.
+
+    Starting :code:`cfiddle-run` means starting a new Python interpreter
+    and importing CFiddle and its dependencies, which can take longer
+    than the code being measured.  This delegate keeps a pool of worker
+    processes around and sends each command to an idle one over a pipe,
+    so the start-up cost is paid once.
+
+    The worker is still a separate process, so a misbehaving function
+    (e.g., a segmentation fault) only takes out the worker.  The
+    :func:`run()` that caused it raises :obj:`RunnerDelegateException`
+    and the next one starts a fresh worker.
+
+    To use it, set the :code:`RunnerDelegate_type` configuration option:
+
+    .. doctest::
+
+        >>> from cfiddle import  *
+        >>> from cfiddle.Runner import WorkerDelegate
+        >>> with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        ...    results = run(build(code(r'''extern "C" int four() {return 4;}''')), "four")
+
+    """
+
+    def execute(self, command, runner):
+        worker = TheRunnerWorkerPool.acquire()
+        try:
+            worker.execute(command)
+        finally:
+            TheRunnerWorkerPool.release(worker)
+
+
+class RunnerWorker:
+    """
+    One worker process for :class:`WorkerDelegate`.
+
+    Requests and replies are pickled over the worker's stdin and stdout.
+    Each request carries the command line along with the current working
+    directory and environment, so the command runs as if it had been
+    started from scratch.
+    """
+
+    def __init__(self):
+        self._process = subprocess.Popen([sys.executable, "-c", "from cfiddle.Runner import serve_runner_requests; serve_runner_requests()"],
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE)
+
+    def is_alive(self):
+        return self._process.poll() is None
+
+    def execute(self, command):
+        request = dict(command=command,
+                       cwd=os.getcwd(),
+                       environment=dict(os.environ))
+        try:
+            pickle.dump(request, self._process.stdin)
+            self._process.stdin.flush()
+            error = pickle.load(self._process.stdout)
+        except (EOFError, BrokenPipeError, pickle.UnpicklingError):
+            self.close()
+            raise RunnerDelegateException(f"WorkerDelegate's worker process died (error code {self._process.returncode}).")
+
+        if error is not None:
+            raise RunnerDelegateException(f"WorkerDelegate failed: {error}")
+
+    def close(self):
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+
+class RunnerWorkerPool:
+    """
+    The set of :class:`RunnerWorker` processes used by :class:`WorkerDelegate`.
+
+    It starts a new worker when none are idle and discards workers that have died.
+    """
+
+    def __init__(self):
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.is_alive():
+                    return worker
+        return RunnerWorker()
+
+    def release(self, worker):
+        if not worker.is_alive():
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+TheRunnerWorkerPool = RunnerWorkerPool()
+atexit.register(TheRunnerWorkerPool.shutdown)
+
+
+def serve_runner_requests():
+    # Keep our own copies of the pipes and point stdin/stdout elsewhere so
+    # output from the code we run can't corrupt the replies.
+    requests = os.fdopen(os.dup(0), "rb")
+    replies = os.fdopen(os.dup(1), "wb")
+    os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+    os.dup2(2, 1)
+
+    while True:
+        try:
+            request = pickle.load(requests)
+        except EOFError:
+            return
+
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["environment"])
+
+        try:
+            invoke_runner.main(args=request["command"][1:], standalone_mode=False)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+        pickle.dump(error, replies)
+        replies.flush()
+
+        
 def get_uuid(id_length=8):
     return uuid.uuid4().hex[:id_length]
 
@@ -261,18 +696,102 @@ class RunnerDelegateException(CFiddleException):
 
 @click.command()
 @click.option('--runner', "runner", required=True, type=click.File("rb"), help="File with a pickled Runner in it.")
-@click.option('--results', "results", required=True, type=click.File("wb"), help="File to deposit the results in.")
+@click.option('--results', "results", required=True, type=click.File("ab"), help="File to append the results to.")
 def invoke_runner(runner, results):
     do_invoke_runner(runner, results)
     
 def do_invoke_runner(runner, results):
     from .config import cfiddle_config
     contents = pickle.load(runner)
+    runner = contents["runner"]
+
+    # Each result refers to its invocation and, through it, the
+    # Executable.  Rather than pickling a copy of them with every result,
+    # we record the invocation's index in the runner and the parent
+    # process reattaches its own copy.
+    positions = collections.defaultdict(collections.deque)
+    for n, i in enumerate(runner.get_invocations()):
+        positions[id(i)].append(n)
 
     with cfiddle_config(**contents["config"]):
         try:
-            return_value = contents["runner"]._delegated_run()
-            pickle.dump(return_value, results)
+            for r in runner._delegated_iter():
+                # Compute the key now, so if the source file changes
+                # before we resume, this result won't match.
+                key = invocation_key(r.invocation)
+                index = positions[id(r.invocation)].popleft() if positions[id(r.invocation)] else None
+                write_record(results, "result", (key, index, _without_invocation(r) if index is not None else r))
         except CFiddleException as e:
-            pickle.dump(e, results)
+            write_record(results, "error", e)
+        else:
+            write_record(results, "done", None)
+
+
+def _without_invocation(result):
+    result = copy.copy(result)
+    result.invocation = None
+    return result
+
+
+def invocation_key(invocation):
+    """Return a hashable key identifying what :code:`invocation` runs, for matching journaled results.
+
+    The key describes how the library was built (the source file, a hash
+    of its contents, and the build parameters) rather than the library
+    itself, since rebuilding the same code gives the library a new name.
+    """
+    build_spec = invocation.executable.build_spec
+    return (build_spec.source_file,
+            _source_digest(build_spec.source_file),
+            repr(sorted(build_spec.build_parameters.items())),
+            invocation.function,
+            repr(sorted(invocation.arguments.items())),
+            repr(sorted(invocation.run_options.items())),
+            repr(list(invocation.perf_counters)),
+            invocation.repetitions,
+            invocation.warmup,
+            invocation.until_stable,
+            invocation.profile)
+
+
+def _check_checkpoint_name(checkpoint):
+    # The name is a directory in CFIDDLE_BUILD_ROOT, so it mustn't lead out of it.
+    separators = [s for s in [os.sep, os.altsep] if s]
+    if not isinstance(checkpoint, str) or checkpoint in ["", ".", ".."] or any(s in checkpoint for s in separators):
+        raise RunnerException(f"Invalid checkpoint name {checkpoint!r}.  It can't be empty, '.', or '..', or contain path separators.")
+
+
+def _source_digest(path):
+    try:
+        return file_digest(path)
+    except OSError:
+        return None
+
+
+RECORD_HEADER = struct.Struct("<Q")
+
+def write_record(f, kind, value):
+    """Append a length-prefixed, pickled :code:`(kind, value)` record to :code:`f` and flush it."""
+    data = pickle.dumps((kind, value))
+    f.write(RECORD_HEADER.pack(len(data)) + data)
+    f.flush()
+
+
+def read_records(f):
+    """Yield the complete records in :code:`f` written by :func:`write_record`.
+
+    If the last record is incomplete (e.g., because it's still being
+    written), stop before it and leave the file positioned at its start.
+    """
+    while True:
+        start = f.tell()
+        header = f.read(RECORD_HEADER.size)
+        if len(header) == RECORD_HEADER.size:
+            length, = RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) == length:
+                yield pickle.loads(data)
+                continue
+        f.seek(start)
+        return
 
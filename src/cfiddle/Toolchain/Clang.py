@@ -2,10 +2,10 @@ import re
 import collections
 import copy
 
-from ..util import invoke_process
 
 from .Toolchain import Toolchain
 from .Registry import TheToolchainRegistry
+from .ProbeCache import TheToolchainProbeCache
 from .Exceptions import *
 
 class LinuxToolchain(Toolchain):
@@ -29,7 +29,7 @@ class ClangToolchain(LinuxToolchain):
         self._version, self._architecture_name = self._extract_version() # this will be wrong with we coss compile
         
     def get_target(self):
-        success, value = invoke_process([self.get_compiler(), "-print-target-triple"])
+        success, value = TheToolchainProbeCache.probe([self.get_compiler(), "-print-target-triple"])
         if not success:
             raise ToolError(f"Couldn't extract target name from {self.get_compiler()}")
         return value.strip()
@@ -40,11 +40,14 @@ class ClangToolchain(LinuxToolchain):
         else:
             return f"llvm-{tool}-{self._version}"
 
+    def get_time_report_flags(self):
+        return ["-ftime-trace"]
+
     def _asm_bookends(self, function):
         return fr"^{re.escape(function)}:\s*", ".cfi_endproc"
 
     def _extract_version(self):
-        success, output = invoke_process([self._compiler, "-v"])
+        success, output = TheToolchainProbeCache.probe([self._compiler, "-v"])
         if not success:
             raise ToolError(f"Couldn't extract version from {self._compiler}.")
         lines = output.split("\n")
@@ -2,10 +2,11 @@ import re
 import collections
 import copy
 
-from ..util import get_native_architecture, invoke_process
+from ..util import get_native_architecture
 
 from .Toolchain import Toolchain
 from .Registry import TheToolchainRegistry
+from .ProbeCache import TheToolchainProbeCache
 from .Exceptions import *
 
 class GCCToolchain(Toolchain):
@@ -26,7 +27,7 @@ class GCCToolchain(Toolchain):
             
     @classmethod
     def _is_toolchain_present(cls, suffix):
-        success, _ = invoke_process([f"{suffix}-gcc","-v"])
+        success, _ = TheToolchainProbeCache.probe([f"{suffix}-gcc","-v"])
         return success
             
     def __init__(self, language, build_parameters):
@@ -49,7 +50,7 @@ class GCCToolchain(Toolchain):
         return self._compiler
 
     def get_target(self):
-        success, value = invoke_process([self.get_compiler(), "-print-multiarch"])
+        success, value = TheToolchainProbeCache.probe([self.get_compiler(), "-print-multiarch"])
         if not success:
             raise ToolError(f"Couldn't extract target name from {self.get_compiler()}")
         return value.strip()
@@ -57,6 +58,9 @@ class GCCToolchain(Toolchain):
     def get_tool(self, tool):
         return f"{self._tool_prefix}{tool}"
 
+    def get_time_report_flags(self):
+        return ["-ftime-report"]
+
     def describe(self):
         return f"{self._compiler} compiling for {self._architecture_name}"
 
@@ -0,0 +1,136 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from ..util import invoke_process
+
+
+class ToolchainProbeCache:
+    """Cache the results of running compilers to learn about them.
+
+    Toolchains run commands like :code:`gcc -print-multiarch` or
+    :code:`clang -v` to find their target, version, etc.  The answers
+    only change when the compiler does, so we remember them, keyed on the
+    compiler's path, size, and modification time and the command's
+    arguments.  Only successful probes are cached: a failure might be
+    transient, and we'd rather ask again than remember it forever.  If
+    the tool isn't on :code:`PATH`, the probe fails without running
+    anything.
+
+    Results are kept in memory and in :code:`toolchain_probes.json` in
+    :code:`CFIDDLE_BUILD_ROOT`, so other processes (e.g.,
+    :code:`cfiddle-run`) can use them, too.  Set the
+    :code:`toolchain_probe_cache` configuration option to :code:`False`
+    to turn the cache off.
+    """
+
+    FILENAME = "toolchain_probes.json"
+
+    def __init__(self):
+        self._probes = {}
+        self._paths = {}
+        self._loaded = set()
+        self._lock = threading.Lock()
+
+    def probe(self, cmd):
+        """Run :code:`cmd` with :func:`invoke_process()` unless we already know the result.
+
+        Args:
+          cmd: The command line.  The first element is the tool.
+
+        Returns:
+          :code:`(success, output)`, just like :func:`invoke_process()`.
+        """
+        from ..config import get_config
+        if not get_config("toolchain_probe_cache"):
+            return invoke_process(cmd)
+
+        key = self._compute_key(cmd)
+        if key is None:  # The tool doesn't exist (yet), so don't bother running it.
+            return False, f"Couldn't find '{cmd[0]}'."
+
+        cache_file = self._cache_file()
+        with self._lock:
+            self._load(cache_file)
+            if key in self._probes:
+                return self._probes[key]
+
+        result = invoke_process(cmd)
+        if not result[0]:
+            return result
+
+        with self._lock:
+            self._probes[key] = result
+            self._save(cache_file, key, result)
+        return result
+
+    def which(self, tool):
+        """Return the full path to :code:`tool` (like :func:`shutil.which()`) or :code:`None`."""
+        key = (tool, os.environ.get("PATH"))
+        path = self._paths.get(key)
+        if path is None or not os.path.exists(path):
+            path = shutil.which(tool)
+            if path is not None:
+                self._paths[key] = path
+        return path
+
+    def clear(self):
+        """Forget everything, including the results on disk."""
+        with self._lock:
+            self._probes.clear()
+            self._paths.clear()
+            self._loaded.clear()
+            try:
+                os.unlink(self._cache_file())
+            except OSError:
+                pass
+
+    def _compute_key(self, cmd):
+        path = self.which(cmd[0])
+        if path is None:
+            return None
+        try:
+            s = os.stat(os.path.realpath(path))
+        except OSError:
+            return None
+        return json.dumps([path, s.st_size, s.st_mtime_ns] + list(cmd[1:]))
+
+    def _cache_file(self):
+        from ..config import get_config
+        build_root = os.environ.get("CFIDDLE_BUILD_ROOT", get_config("CFIDDLE_BUILD_ROOT"))
+        return os.path.abspath(os.path.join(build_root, self.FILENAME))
+
+    def _load(self, cache_file):
+        if cache_file in self._loaded:
+            return
+        self._loaded.add(cache_file)
+        for key, result in self._read(cache_file).items():
+            self._probes.setdefault(key, tuple(result))
+
+    def _read(self, cache_file):
+        try:
+            with open(cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, cache_file, key, result):
+        # Merge with what's there, since other processes may have added
+        # probes.  Don't create CFIDDLE_BUILD_ROOT just for this, though,
+        # since we probe when cfiddle is imported.
+        if not os.path.isdir(os.path.dirname(cache_file)):
+            return
+        probes = self._read(cache_file)
+        probes[key] = result
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+            with os.fdopen(fd, "w") as f:
+                json.dump(probes, f)
+            os.replace(temp_path, cache_file)
+        except OSError:
+            pass  # The on-disk cache is just an optimization.
+
+
+TheToolchainProbeCache = ToolchainProbeCache()
@@ -6,3 +6,7 @@ class Toolchain:
     def __init__(self, language, build_parameters):
         self._language = language.upper()
         self._build_parameters = copy.copy(build_parameters)
+
+    def get_time_report_flags(self):
+        """Compiler flags that make the compiler report how long each phase of compilation takes."""
+        return []
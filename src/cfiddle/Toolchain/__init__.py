@@ -1,9 +1,8 @@
-from ..util import invoke_process
-
 from .GCC import GCCToolchain
 from .Go import GoToolchain
 from .Clang import ClangToolchain
 from .Registry import ToolchainRegistry, TheToolchainRegistry
+from .ProbeCache import ToolchainProbeCache, TheToolchainProbeCache
 from .Exceptions import *
 
 def list_architectures():
@@ -16,11 +15,11 @@ def list_architectures():
 
 
 def get_native_toolchain():
-    success, arch = invoke_process(["gcc", "-print-multiarch"])
+    success, arch = TheToolchainProbeCache.probe(["gcc", "-print-multiarch"])
     if not success:
         raise ToolchainException("Unable to determine native toolchain.")
     return arch.strip()
 
 def toolchain_present(cross_toolchain):
-    success, _ = invoke_process([f"{cross_toolchain}-gcc","-v"])
+    success, _ = TheToolchainProbeCache.probe([f"{cross_toolchain}-gcc","-v"])
     return success
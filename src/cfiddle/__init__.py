@@ -13,6 +13,7 @@ __all__ = [
     "build_and_run",
     "build",
     "run",
+    "iter_run",
     "run_list",
     "sanity_test",
     "changes_in",
@@ -26,8 +27,8 @@ __all__ = [
 ]
 
 from .Data import InvocationResultsList
-from .Builder import ExecutableDescription, Executable, ExecutableList
-from .MakeBuilder import MakeBuilder, InvalidBuildParameter
+from .Builder import ExecutableDescription, Executable, ExecutableList, build_in_parallel
+from .MakeBuilder import MakeBuilder, InvalidBuildParameter, build_in_batch
 from .Runner import InvocationDescription, InvocationResult, Runner, InvalidRunOption, DirectRunner
 from .Invoker import Invoker
 from .util import arg_map, arg_product, changes_in, exp_range, running_under_jupyter, ArgProductError
@@ -48,6 +49,16 @@ def build_list(build_specs, **kwargs):
     ExeDesc = get_config("ExecutableDescription_type")
     progress_bar = get_config("ProgressBar")
 
+    build_jobs = get_config("build_jobs")
+
+    if get_config("batch_make"):
+        builders = [Builder(ExeDesc(**p), **kwargs) for p in build_specs]
+        return build_in_batch(builders, jobs=build_jobs, verbose=kwargs.get("verbose", False), progress_bar=progress_bar)
+
+    if build_jobs is None or build_jobs > 1:
+        builders = [Builder(ExeDesc(**p), **kwargs) for p in build_specs]
+        return build_in_parallel(builders, jobs=build_jobs, progress_bar=progress_bar)
+
     l = ExecutableList()
     for p in progress_bar(build_specs, miniters=1):
         l.append(Builder(ExeDesc(**p), **kwargs).build())
@@ -102,7 +113,7 @@ def build(source, build_parameters=None, **kwargs):
     return build_list(builds, **kwargs)
 
 
-def run_list(invocations, **kwargs):
+def run_list(invocations, stream=False, batch_size=None, **kwargs):
 
     IRList = get_config("InvocationResultsList_type")
     IRType = get_config("InvocationResult_type")
@@ -111,16 +122,21 @@ def run_list(invocations, **kwargs):
     InvDesc = get_config("InvocationDescription_type")
     progress_bar = get_config("ProgressBar")
 
-    return Runner([InvDesc(**i) for i in invocations],
-                  invoker=Invoker,
-                  result_list_factory=IRList,
-                  result_factory=IRType,
-                  progress_bar=progress_bar,
-                  **kwargs).run()
+    runner = Runner([InvDesc(**i) for i in invocations],
+                    invoker=Invoker,
+                    result_list_factory=IRList,
+                    result_factory=IRType,
+                    progress_bar=progress_bar,
+                    **kwargs)
+    if stream:
+        return runner.iter_run(batch_size=batch_size)
+    else:
+        return runner.run()
 
 
 @handle_cfiddle_exceptions
-def run(executable, function, arguments=None, perf_counters=None, run_options=None, **kwargs):
+def run(executable, function, arguments=None, perf_counters=None, run_options=None,
+        repetitions=None, warmup=0, until_stable=None, profile=False, stream=False, batch_size=None, **kwargs):
     """Run one or more functions with one or more sets of arguments and
     collect one or more measurements.
     
@@ -167,6 +183,43 @@ def run(executable, function, arguments=None, perf_counters=None, run_options=No
     includes multiple sets of values, :func:`run()` will run all
     combinations of the defaults and the values passed supplied.
 
+    To get statistically meaningful measurements, :func:`run()` can
+    call each function several times in the same process.
+    :code:`warmup` calls happen first and aren't recorded.  Then,
+    :code:`repetitions` calls are recorded, each with a
+    :code:`repetition` column.  If you pass :code:`until_stable`,
+    :func:`run()` stops early once the relative standard error of the
+    total :code:`ET` of each call is at most :code:`until_stable` (e.g.,
+    :code:`0.01` for 1%).  In that case, :code:`repetitions` is the
+    upper limit and defaults to 100, and the function must record
+    :code:`ET` (e.g., with :code:`start_measurement()`) or
+    :func:`run()` raises :obj:`cfiddle.Invoker.NoMeasurements`.
+    :meth:`InvocationResultsList.summarize()` will compute the mean,
+    median, standard deviation, and confidence interval for each
+    measurement.
+
+    To find out where the time goes, pass :code:`profile=True`.  CFiddle
+    samples the call stack while the function runs (like :code:`perf
+    record -g`) and stores a :obj:`cfiddle.Profile.Profile` in each
+    result's :code:`profile`.  Pass it to :meth:`InstrumentedExecutable.asm()`
+    to see the hot instructions.
+
+    For large sweeps, pass :code:`stream=True` (or call
+    :func:`iter_run()`) to get an iterator that yields each
+    :obj:`InvocationResult` as soon as it's available (or
+    :obj:`InvocationResultsList` objects of up to :code:`batch_size`
+    results).  This keeps memory usage bounded and lets you look at
+    partial results.  If the run fails, you still get the results that
+    completed before the exception is raised.
+
+    For long sweeps, pass :code:`checkpoint="some-name"`.  Completed
+    invocations are journaled under :code:`CFIDDLE_BUILD_ROOT`, and if
+    the run crashes or is interrupted, calling :func:`run()` again with
+    the same checkpoint name only runs the invocations that didn't
+    finish.  The name can't contain path separators, and only one run
+    can use a checkpoint at a time.  :meth:`InvocationResultsList.rerun()`
+    accepts :code:`checkpoint` as well.
+
     :code:`run()` returns an :obj:`cfiddle.InvocationResultsList` which is a
     subclass of :obj:`list` that can format results in useful ways
     (e.g., as a Panda dataframe or CSV file).
@@ -181,9 +234,15 @@ def run(executable, function, arguments=None, perf_counters=None, run_options=No
        arguments: A :obj:`dict` of arguments for the function.  Or a list of such :obj:`dict`.  Defaults to ``[{}]``
        perf_counters: A list of performance counters to collect. Default to None.
        run_options: Parameters controlling how the function is run.  Default to None.
+       repetitions: Number of times to call the function (or the maximum, with :code:`until_stable`).  Defaults to None, which means once and without a :code:`repetition` column.
+       warmup: Number of calls to make and discard before measuring.  Defaults to 0.
+       until_stable: Stop repeating once the relative standard error of :code:`ET` reaches this value.  Defaults to None.
+       profile: Record a sampling profile of each invocation.  Defaults to False.
+       stream: Return an iterator over the results instead of a list.  Defaults to False.
+       batch_size: With :code:`stream=True`, yield lists of up to this many results.  Defaults to None, which yields individual results.
 
     Returns:
-       :obj:`InvocationResultsList`:  A list of :obj:`InvocationResult` objects.
+       :obj:`InvocationResultsList`:  A list of :obj:`InvocationResult` objects (or an iterator, if :code:`stream` is true).
 
     """
     
@@ -211,7 +270,16 @@ def run(executable, function, arguments=None, perf_counters=None, run_options=No
     perf_counters = normalize_perf_counters(perf_counters)
     
     invocations = arg_map(executable=executable, function=function, arguments=arguments, run_options=full_run_options, perf_counters=perf_counters)
-    return run_list(invocations, **kwargs)
+    invocations = [dict(**i, repetitions=repetitions, warmup=warmup, until_stable=until_stable, profile=profile) for i in invocations]
+    return run_list(invocations, stream=stream, batch_size=batch_size, **kwargs)
+
+
+def iter_run(*argv, batch_size=None, **kwargs):
+    """Like :func:`run()`, but return an iterator that yields results as they complete.
+
+    This is the same as :code:`run(..., stream=True)`.
+    """
+    return run(*argv, stream=True, batch_size=batch_size, **kwargs)
 
 
 def normalize_perf_counters(perf_counters):
@@ -31,7 +31,20 @@ default_config = dict(Executable_type=InstrumentedExecutable,
                       RunOptionInterpreter_type=RunOptionInterpreter,
                       perf_counters_default=None,
                       build_parameters_default=None,
+                      build_jobs=1,
+                      # batch_make takes precedence over building build_jobs builds at once:
+                      # build() runs one make for all the builds, and build_jobs is make's -j.
+                      batch_make=False,
+                      build_cache=True,
+                      build_cache_max_entries=10000,
+                      precompiled_headers=False,
+                      build_time_report=False,
+                      toolchain_probe_cache=True,
                       run_options_default=None,
+                      run_cpus=None,
+                      histogram_percentiles=[50, 90, 99, 99.9],
+                      profile_frequency=4000,
+                      profile_buffer_pages=64,
                       DEBUG_MODE=False)
 
 
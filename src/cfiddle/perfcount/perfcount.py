@@ -1,5 +1,6 @@
 import ctypes
 from ..Exceptions import CFiddleException
+from ..LibraryCache import TheLibraryCache
 
 def install_perf_counters(perf_counters):
     libcfiddle = _load_libcfiddle()
@@ -22,7 +23,7 @@ def clear_perf_counters():
 
 
 def _load_libcfiddle():
-    return  ctypes.CDLL("libcfiddle.so")
+    return TheLibraryCache.load_library("libcfiddle.so")
 
 
 class UnknownPerformanceCounter(CFiddleException):
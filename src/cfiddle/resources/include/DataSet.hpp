@@ -7,14 +7,40 @@
 #include<vector>
 #include<set>
 #include<map>
+#include<memory>
+#include<unordered_map>
 #include<cassert>
+#include<cstdint>
+#include<type_traits>
 
 template<typename T>
 class Datum;
 
+// The types values have when they are exported to Python (see
+// stats_column_type() in cfiddle.cpp).  Wider types come later.
+enum DatumKind {
+	DATUM_INT64 = 0,
+	DATUM_DOUBLE = 1,
+	DATUM_STRING = 2
+};
+
+template<typename T>
+double datum_as_double(const T & v, std::true_type) { return static_cast<double>(v); }
+template<typename T>
+double datum_as_double(const T & v, std::false_type) { return 0.0; }
+
+template<typename T>
+int64_t datum_as_int64(const T & v, std::true_type) { return static_cast<int64_t>(v); }
+template<typename T>
+int64_t datum_as_int64(const T & v, std::false_type) { return 0; }
+
 class AbstractDatum {
 public:
+	virtual ~AbstractDatum() {}
 	virtual std::string to_string() const = 0;
+	virtual DatumKind kind() const = 0;
+	virtual double as_double() const = 0;
+	virtual int64_t as_int64() const = 0;
 
 	template<typename T>
 	T as() const {
@@ -24,125 +50,407 @@ public:
 		}
 		return d->value;
 	}
-		
+
 };
 
+// A single, free-standing value.  DataSet doesn't use these (see
+// DatumView), but they're handy for printing values of any type.
 template<typename T>
 class Datum: public AbstractDatum {
 	friend AbstractDatum;
 	T value;
 public:
 	explicit Datum(const T & v): value(v) {}
-	
+
 	std::string to_string() const {
 		std::stringstream ss;
 		ss << value;
 		return ss.str();
 	}
+
+	DatumKind kind() const {
+		if (std::is_floating_point<T>::value) {
+			return DATUM_DOUBLE;
+		} else if (std::is_integral<T>::value) {
+			return DATUM_INT64;
+		} else {
+			return DATUM_STRING;
+		}
+	}
+
+	double as_double() const {
+		return datum_as_double(value, std::is_arithmetic<T>());
+	}
+
+	int64_t as_int64() const {
+		return datum_as_int64(value, std::is_arithmetic<T>());
+	}
 };
 
-static std::ostream& operator<<(std::ostream& os, const AbstractDatum & d)
+inline std::ostream& operator<<(std::ostream& os, const AbstractDatum & d)
 {
 	os << d.to_string();
 	return os;
 }
 
-class DataSet;
+// How a value is stored in a column.
+enum CellType {
+	CELL_EMPTY = 0,
+	CELL_INT64,
+	CELL_UINT64,
+	CELL_DOUBLE,
+	CELL_STRING
+};
+
+union CellValue {
+	int64_t i;
+	uint64_t u;
+	double d;
+	uint32_t s; // Index into the column's strings.
+};
+
+// A value in a DataSet.  It's only valid until the DataSet changes.
+class DatumView {
+	CellType type;
+	CellValue value;
+	const std::string * string;
+
+	template<typename T>
+	T numeric_as() const {
+		switch(type) {
+		case CELL_INT64: return static_cast<T>(value.i);
+		case CELL_UINT64: return static_cast<T>(value.u);
+		case CELL_DOUBLE: return static_cast<T>(value.d);
+		default: return T();
+		}
+	}
+
+	template<typename T>
+	T as(std::true_type) const { return numeric_as<T>(); }
+	template<typename T>
+	T as(std::false_type) const { return to_string(); }
 
-class DataRow {
-	friend DataSet;
-	std::map<std::string, AbstractDatum*> data;
-	std::vector<std::string> key_order;
-	std::set<std::string> key_set;
-	
 public:
+	DatumView(CellType type, CellValue value, const std::string * string): type(type), value(value), string(string) {}
+
+	bool empty() const {
+		return type == CELL_EMPTY;
+	}
+
+	DatumKind kind() const {
+		switch(type) {
+		case CELL_DOUBLE: return DATUM_DOUBLE;
+		case CELL_STRING: return DATUM_STRING;
+		default: return DATUM_INT64;
+		}
+	}
+
+	std::string to_string() const {
+		std::stringstream ss;
+		switch(type) {
+		case CELL_INT64: ss << value.i; break;
+		case CELL_UINT64: ss << value.u; break;
+		case CELL_DOUBLE: ss << value.d; break;
+		case CELL_STRING: return *string;
+		default: break;
+		}
+		return ss.str();
+	}
+
+	double as_double() const {
+		return numeric_as<double>();
+	}
+
+	int64_t as_int64() const {
+		return numeric_as<int64_t>();
+	}
+
+	// Convert the value to T, which should be arithmetic or std::string.
 	template<typename T>
-	void set(const std::string & name, T t) { // It should be const T & t, but this makes string literals work.
-		if (key_set.find(name) == key_set.end()) {
-			key_order.push_back(name);
-			key_set.insert(name);
+	T as() const {
+		return as<T>(std::is_arithmetic<T>());
+	}
+};
+
+inline std::ostream& operator<<(std::ostream& os, const DatumView & d)
+{
+	os << d.to_string();
+	return os;
+}
+
+// A column of values, one per row.  Rows past the end of the vectors
+// are empty.  Strings are stored separately, and overwriting a string
+// reuses its slot.
+class DataColumn {
+	friend class DataSet;
+	std::string name;
+	std::vector<uint8_t> types;
+	std::vector<CellValue> values;
+	std::vector<std::string> strings;
+	DatumKind kind;
+
+	DataColumn(const std::string & name, size_t reserve): name(name), kind(DATUM_INT64) {
+		types.reserve(reserve);
+		values.reserve(reserve);
+	}
+
+	void extend_to(size_t row) {
+		if (types.size() <= row) {
+			types.resize(row + 1, CELL_EMPTY);
+			values.resize(row + 1);
 		}
-		data[name] = new Datum<T>(t);
 	}
 
-	bool has_datum(const std::string & name) {
-		return data.find(name) != data.end();
+	void set(size_t row, CellType type, CellValue value) {
+		extend_to(row);
+		types[row] = type;
+		values[row] = value;
+		widen(type);
 	}
-	
-	const AbstractDatum & get_datum(const std::string & name) {
-		return *(data[name]);
+
+	void set_string(size_t row, const std::string & s) {
+		extend_to(row);
+		if (types[row] == CELL_STRING) {
+			strings[values[row].s] = s;
+		} else {
+			types[row] = CELL_STRING;
+			values[row].s = strings.size();
+			strings.push_back(s);
+		}
+		widen(CELL_STRING);
+	}
+
+	void widen(CellType type) {
+		DatumKind k = type == CELL_DOUBLE ? DATUM_DOUBLE : type == CELL_STRING ? DATUM_STRING : DATUM_INT64;
+		if (k > kind) {
+			kind = k;
+		}
 	}
-	const std::vector<std::string> & get_keys() const {
-		return key_order;
+
+	void clear() {
+		types.clear();
+		values.clear();
+		strings.clear();
+		kind = DATUM_INT64;
 	}
+
+public:
+	const std::string & get_name() const {
+		return name;
+	}
+
+	DatumKind get_kind() const {
+		return kind;
+	}
+
+	bool has(size_t row) const {
+		return row < types.size() && types[row] != CELL_EMPTY;
+	}
+
+	DatumView get(size_t row) const {
+		if (!has(row)) {
+			CellValue v;
+			v.u = 0;
+			return DatumView(CELL_EMPTY, v, NULL);
+		}
+		CellType type = static_cast<CellType>(types[row]);
+		return DatumView(type, values[row], type == CELL_STRING ? &strings[values[row].s] : NULL);
+	}
+};
+
+// A column's position in a DataSet.  Look it up once with
+// DataSet::column_id() to avoid looking up the name on every set().
+struct ColumnId {
+	uint32_t index;
 };
 
+class DataRow;
 
+// The measurements.  The values are stored by column, and column names
+// are interned, so setting a value doesn't allocate memory (except to
+// grow a column, which reserve() avoids).
 class DataSet {
-	std::vector<DataRow *> rows;
+	std::vector<std::unique_ptr<DataColumn>> columns;
+	std::unordered_map<std::string, uint32_t> column_ids;
+	size_t row_count;
+	size_t reserved_rows;
+
+	// For the DataRow interface.  Created on demand.
+	std::vector<std::unique_ptr<DataRow>> row_views;
+	std::vector<DataRow*> row_pointers;
+
+	template<typename T>
+	void set_value(size_t row, ColumnId column, const T & t, std::true_type) {
+		CellValue v;
+		CellType type;
+		if (std::is_floating_point<T>::value) {
+			v.d = static_cast<double>(t);
+			type = CELL_DOUBLE;
+		} else if (std::is_signed<T>::value) {
+			v.i = static_cast<int64_t>(t);
+			type = CELL_INT64;
+		} else {
+			v.u = static_cast<uint64_t>(t);
+			type = CELL_UINT64;
+		}
+		columns[column.index]->set(row, type, v);
+	}
+
+	template<typename T>
+	void set_value(size_t row, ColumnId column, const T & t, std::false_type) {
+		std::stringstream ss;
+		ss << t;
+		columns[column.index]->set_string(row, ss.str());
+	}
+
+	void sync_row_views();
+
 public:
-	DataSet() {
+	DataSet(): row_count(0), reserved_rows(0) {
 	}
 
+	DataSet(const DataSet &) = delete;
+	DataSet & operator=(const DataSet &) = delete;
+
+	// Forget all the rows.  The columns (and their memory) are kept.
 	void clear() {
-		for (auto & r: rows) {
-			delete r;
+		for (auto & c: columns) {
+			c->clear();
 		}
-		rows.clear();
+		row_count = 0;
+		row_views.clear();
+		row_pointers.clear();
 	}
+
+	// Make room for this many rows in every column (including ones
+	// created later).
+	void reserve(size_t rows) {
+		if (rows <= reserved_rows) {
+			return;
+		}
+		reserved_rows = rows;
+		for (auto & c: columns) {
+			c->types.reserve(rows);
+			c->values.reserve(rows);
+		}
+	}
+
 	void start_new_row() {
-		rows.push_back(new DataRow());
+		row_count++;
+	}
+
+	size_t size() const {
+		return row_count;
 	}
 
-	DataRow & current_row() {
-		return *rows.back();
+	ColumnId column_id(const std::string & name) {
+		auto i = column_ids.find(name);
+		if (i != column_ids.end()) {
+			return ColumnId{i->second};
+		}
+		uint32_t index = columns.size();
+		columns.push_back(std::unique_ptr<DataColumn>(new DataColumn(name, reserved_rows)));
+		column_ids[name] = index;
+		return ColumnId{index};
 	}
 
-	const std::vector<DataRow*> & get_rows() const {
-		return rows;
+	size_t column_count() const {
+		return columns.size();
 	}
-	
-	size_t size() {
-		return rows.size(); 
+
+	const DataColumn & get_column(size_t index) const {
+		return *columns[index];
+	}
+
+	// Returns NULL if there's no such column.
+	const DataColumn * find_column(const std::string & name) const {
+		auto i = column_ids.find(name);
+		return i == column_ids.end() ? NULL : columns[i->second].get();
 	}
-	
+
+	// Set a value in the current row.
 	template<typename T>
-	DataSet & set(const std::string & name, const T & t) {
-		current_row().set(name, t);
+	DataSet & set(ColumnId column, const T & t) {
+		set_at(row_count - 1, column, t);
 		return *this;
 	}
 
+	template<typename T>
+	DataSet & set(const std::string & name, const T & t) {
+		return set(column_id(name), t);
+	}
+
 	DataSet & set(const std::string & name, const char *t) {
 		// convert char* to strings so we don't have to worry
 		// about memory management of the char*.
-		current_row().set(name, std::string(t));
-		return *this;
+		return set(column_id(name), std::string(t));
 	}
 
-	std::ostream & write_csv(std::ostream & o) {
-		std::vector<std::string> keys;
-		std::set<std::string> key_set;
+	template<typename T>
+	void set_at(size_t row, ColumnId column, const T & t) {
+		assert(row < row_count);
+		set_value(row, column, t, std::integral_constant<bool, std::is_arithmetic<T>::value && !std::is_same<T, char>::value>());
+	}
+
+	void set_at(size_t row, ColumnId column, const char * t) {
+		set_at(row, column, std::string(t));
+	}
+
+	bool has(size_t row, const std::string & name) const {
+		auto c = find_column(name);
+		return c && c->has(row);
+	}
+
+	DatumView get(size_t row, const std::string & name) const {
+		auto c = find_column(name);
+		if (c) {
+			return c->get(row);
+		}
+		CellValue v;
+		v.u = 0;
+		return DatumView(CELL_EMPTY, v, NULL);
+	}
+
+	// The DataRow interface.  These are slower than the rest.
+	DataRow & current_row();
+	const std::vector<DataRow*> & get_rows();
 
-		for(auto & r: rows) {
-			for(auto & k: r->key_order) {
-				if (key_set.find(k) == key_set.end()) {
-					keys.push_back(k);
-					key_set.insert(k);
+	// All the columns that have a value, in the order they were created.
+	std::vector<std::string> get_keys() const {
+		std::vector<std::string> keys;
+		for(auto & c: columns) {
+			for(size_t r = 0; r < row_count; r++) {
+				if (c->has(r)) {
+					keys.push_back(c->name);
+					break;
 				}
 			}
 		}
-		
+		return keys;
+	}
+
+	// The widest kind of any value in column key.
+	DatumKind get_kind(const std::string & key) const {
+		auto c = find_column(key);
+		return c ? c->kind : DATUM_INT64;
+	}
+
+	std::ostream & write_csv(std::ostream & o) {
+		std::vector<std::string> keys = get_keys();
+		std::vector<const DataColumn *> key_columns;
+
 		csvfile out(o);
 
 		for(auto &k: keys) {
 			out << k;
+			key_columns.push_back(find_column(k));
 		}
 		out.endrow();
-	       
-		for(auto & r: rows) {
-			for(auto &k: keys) {
-				if (r->has_datum(k)) {
-					out << r->get_datum(k);
+
+		for(size_t r = 0; r < row_count; r++) {
+			for(auto c: key_columns) {
+				if (c->has(r)) {
+					out << c->get(r).to_string();
 				} else {
 					out << "";
 				}
@@ -153,6 +461,59 @@ public:
 	}
 };
 
+// One row of a DataSet.  A DataRow you create yourself has its own
+// one-row DataSet.
+class DataRow {
+	std::unique_ptr<DataSet> own;
+	DataSet * dataset;
+	size_t index;
+
+public:
+	DataRow(): own(new DataSet()), dataset(own.get()), index(0) {
+		own->start_new_row();
+	}
+
+	DataRow(DataSet * dataset, size_t index): dataset(dataset), index(index) {}
+
+	template<typename T>
+	void set(const std::string & name, T t) { // It should be const T & t, but this makes string literals work.
+		dataset->set_at(index, dataset->column_id(name), t);
+	}
+
+	bool has_datum(const std::string & name) const {
+		return dataset->has(index, name);
+	}
+
+	DatumView get_datum(const std::string & name) const {
+		return dataset->get(index, name);
+	}
+
+	std::vector<std::string> get_keys() const {
+		std::vector<std::string> keys;
+		for(size_t c = 0; c < dataset->column_count(); c++) {
+			if (dataset->get_column(c).has(index)) {
+				keys.push_back(dataset->get_column(c).get_name());
+			}
+		}
+		return keys;
+	}
+};
+
+inline void DataSet::sync_row_views() {
+	while (row_views.size() < row_count) {
+		row_views.push_back(std::unique_ptr<DataRow>(new DataRow(this, row_views.size())));
+		row_pointers.push_back(row_views.back().get());
+	}
+}
+
+inline DataRow & DataSet::current_row() {
+	sync_row_views();
+	return *row_views[row_count - 1];
+}
 
+inline const std::vector<DataRow*> & DataSet::get_rows() {
+	sync_row_views();
+	return row_pointers;
+}
 
 #endif
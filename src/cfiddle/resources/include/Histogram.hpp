@@ -0,0 +1,162 @@
+#ifndef HISTOGRAM_INCLUDED
+#define HISTOGRAM_INCLUDED
+#include<string>
+#include<vector>
+#include<memory>
+#include<unordered_map>
+#include<cstdint>
+#include<cstring>
+#include<limits>
+
+// A histogram of latencies (or any other non-negative integers) with
+// log-linear buckets, like HdrHistogram.  Values below 2^SUB_BUCKET_BITS
+// get their own bucket.  Above that, each power of two is split into
+// 2^(SUB_BUCKET_BITS-1) buckets, so a value's bucket is within 1/128th
+// (i.e., <0.8%) of it.  Recording a value is a few instructions and never
+// allocates memory after the first one.
+class Histogram {
+public:
+	enum {
+		SUB_BUCKET_BITS = 8,
+		SUB_BUCKETS = 1 << SUB_BUCKET_BITS,
+		HALF_SUB_BUCKETS = SUB_BUCKETS / 2,
+		BUCKETS = (64 - SUB_BUCKET_BITS) * HALF_SUB_BUCKETS + SUB_BUCKETS
+	};
+
+private:
+	std::string name;
+	std::unique_ptr<uint64_t[]> counts;
+	uint64_t count;
+	uint64_t min;
+	uint64_t max;
+	double sum;
+
+public:
+	explicit Histogram(const std::string & name): name(name) {
+		clear();
+	}
+
+	static unsigned int index_of(uint64_t value) {
+		if (value < SUB_BUCKETS) {
+			return value;
+		}
+		int msb = 63 - __builtin_clzll(value);
+		int shift = msb - SUB_BUCKET_BITS + 1;
+		return shift * HALF_SUB_BUCKETS + (value >> shift);
+	}
+
+	static int shift_of(unsigned int index) {
+		if (index < SUB_BUCKETS) {
+			return 0;
+		}
+		return (index - SUB_BUCKETS) / HALF_SUB_BUCKETS + 1;
+	}
+
+	// The smallest value in bucket index.
+	static uint64_t lowest_value(unsigned int index) {
+		int shift = shift_of(index);
+		return static_cast<uint64_t>(index - shift * HALF_SUB_BUCKETS) << shift;
+	}
+
+	// The largest value in bucket index.
+	static uint64_t highest_value(unsigned int index) {
+		return lowest_value(index) + ((static_cast<uint64_t>(1) << shift_of(index)) - 1);
+	}
+
+	void record(uint64_t value) {
+		if (!counts) {
+			counts.reset(new uint64_t[BUCKETS]);
+			memset(counts.get(), 0, sizeof(uint64_t) * BUCKETS);
+		}
+		counts[index_of(value)]++;
+		count++;
+		sum += value;
+		if (value < min) {
+			min = value;
+		}
+		if (value > max) {
+			max = value;
+		}
+	}
+
+	// Forget the values.  The buckets' memory is kept.
+	void clear() {
+		if (counts) {
+			memset(counts.get(), 0, sizeof(uint64_t) * BUCKETS);
+		}
+		count = 0;
+		min = std::numeric_limits<uint64_t>::max();
+		max = 0;
+		sum = 0.0;
+	}
+
+	const std::string & get_name() const { return name; }
+	uint64_t get_count() const { return count; }
+	uint64_t get_min() const { return count ? min : 0; }
+	uint64_t get_max() const { return max; }
+	double get_sum() const { return sum; }
+
+	uint64_t get_bucket_count(unsigned int index) const {
+		return counts ? counts[index] : 0;
+	}
+
+	// The number of buckets with values in them.
+	unsigned int used_buckets() const {
+		unsigned int n = 0;
+		for(unsigned int i = 0; counts && i < BUCKETS; i++) {
+			if (counts[i]) {
+				n++;
+			}
+		}
+		return n;
+	}
+};
+
+// Histograms by name.
+class HistogramSet {
+	std::vector<std::unique_ptr<Histogram>> histograms;
+	std::unordered_map<std::string, Histogram*> by_name;
+
+	// The last histogram we looked up, so recording to the same one
+	// repeatedly doesn't need a hash lookup.
+	const char * last_name;
+	Histogram * last;
+
+public:
+	HistogramSet(): last_name(NULL), last(NULL) {}
+
+	Histogram * get(const char * name) {
+		if (name == last_name && strcmp(name, last->get_name().c_str()) == 0) {
+			return last;
+		}
+		auto i = by_name.find(name);
+		Histogram * h;
+		if (i != by_name.end()) {
+			h = i->second;
+		} else {
+			h = new Histogram(name);
+			histograms.push_back(std::unique_ptr<Histogram>(h));
+			by_name[name] = h;
+		}
+		last_name = name;
+		last = h;
+		return h;
+	}
+
+	// Clear all the histograms.  They aren't deleted, so pointers to them stay valid.
+	void clear() {
+		for(auto & h: histograms) {
+			h->clear();
+		}
+	}
+
+	size_t size() const {
+		return histograms.size();
+	}
+
+	Histogram & operator[](size_t i) {
+		return *histograms[i];
+	}
+};
+
+#endif
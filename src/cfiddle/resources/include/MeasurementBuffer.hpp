@@ -0,0 +1,97 @@
+#ifndef MEASUREMENT_BUFFER_INCLUDED
+#define MEASUREMENT_BUFFER_INCLUDED
+
+#include <stdint.h>
+#include <string.h>
+#include <memory>
+
+#define CFIDDLE_MAX_FAST_COUNTERS 16
+#define CFIDDLE_FAST_TAG_LENGTH 32
+#define CFIDDLE_DEFAULT_FAST_CAPACITY 16384
+
+// One measurement from start_fast_measurement()/end_fast_measurement().
+// While the measurement is in progress, values holds the counters'
+// starting values.  After, it holds the differences.
+struct FastRecord {
+	uint64_t start_ticks;
+	uint64_t end_ticks;
+	bool read_with_rdpmc;
+	char tag[CFIDDLE_FAST_TAG_LENGTH];
+	uint64_t values[CFIDDLE_MAX_FAST_COUNTERS];
+};
+
+// A fixed-size buffer of FastRecords.  Nothing is allocated while
+// measuring; the records are copied into the DataSet later.  The buffer
+// is allocated by the first open_record() (before that measurement
+// starts), so processes that never make fast measurements don't pay
+// for it.
+class MeasurementBuffer {
+	std::unique_ptr<FastRecord[]> records;
+	size_t capacity;
+	size_t count;
+	bool in_progress;
+public:
+	MeasurementBuffer(size_t capacity = CFIDDLE_DEFAULT_FAST_CAPACITY) : capacity(capacity), count(0), in_progress(false) {}
+
+	// Returns NULL if the buffer is full.
+	FastRecord * open_record(const char * tag) {
+		if (count == capacity) {
+			return NULL;
+		}
+		if (!records) {
+			records.reset(new FastRecord[capacity]);
+		}
+		FastRecord * r = &records[count];
+		if (tag) {
+			strncpy(r->tag, tag, CFIDDLE_FAST_TAG_LENGTH - 1);
+			r->tag[CFIDDLE_FAST_TAG_LENGTH - 1] = 0;
+		} else {
+			r->tag[0] = 0;
+		}
+		in_progress = true;
+		return r;
+	}
+
+	// Returns NULL if there's no measurement in progress.
+	FastRecord * current_record() {
+		return in_progress ? &records[count] : NULL;
+	}
+
+	void commit_record() {
+		in_progress = false;
+		count++;
+	}
+
+	const FastRecord * begin() const {
+		return records.get();
+	}
+
+	const FastRecord * end() const {
+		return records.get() + count;
+	}
+
+	size_t size() const {
+		return count;
+	}
+
+	bool is_full() const {
+		return count == capacity;
+	}
+
+	// Forget the completed records.  A measurement in progress keeps going.
+	void clear() {
+		if (in_progress && count) {
+			records[0] = records[count];
+		}
+		count = 0;
+	}
+
+	void set_capacity(size_t new_capacity) {
+		clear();
+		in_progress = false;
+		capacity = new_capacity ? new_capacity : 1;
+		records.reset();
+	}
+};
+
+#endif
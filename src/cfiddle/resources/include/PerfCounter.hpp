@@ -10,6 +10,7 @@
 #include <asm/unistd.h>
 #include <sys/stat.h>
 #include <fcntl.h>
+#include <sys/mman.h>
 #include <perfmon/pfmlib.h>
 #include <perfmon/pfmlib_perf_event.h>
 
@@ -21,26 +22,50 @@
 #include <sstream>
 
 #include "PerfCounterDefs.hpp"
+#include "MeasurementBuffer.hpp"
+#include "tsc.h"
 
 class CounterValue {
 public:
 	std::string name;
 	int fd;
+	int group;
 	uint64_t value;
 
-	CounterValue(const std::string & name, int fd): name(name), fd(fd), value(0) {}
+	CounterValue(const std::string & name, int fd, int group = -1): name(name), fd(fd), group(group), value(0) {}
+};
+
+// A set of events the kernel schedules onto the PMU together.  If there
+// are more groups than the hardware can count at once, the kernel
+// multiplexes them, and we scale each group's counts by how long it
+// was actually counting.
+class CounterGroup {
+public:
+	int lead_fd;
+	std::vector<int> members; // Indices into counter_values, in the order the kernel reports them.
+	uint64_t start_enabled;
+	uint64_t start_running;
+	std::vector<uint64_t> start_values;
+
+	CounterGroup(int lead_fd): lead_fd(lead_fd), start_enabled(0), start_running(0) {}
 };
 
 
 class PerfCounter {
-	int lead_fd;
+	std::vector<CounterGroup> groups;
 	std::vector<CounterValue> counter_values;
 	bool valid;
 	bool initialization_successful;
 	bool fake_success;
+	bool groups_enabled;
+
+	// For read_fast().  One mmap'd page per counter.
+	std::vector<struct perf_event_mmap_page *> pages;
+	bool fast_reads_prepared;
+	bool fast_reads_available;
 	
 public:
-	PerfCounter() : valid(true), initialization_successful(true){
+	PerfCounter() : valid(true), initialization_successful(true), groups_enabled(false), fast_reads_prepared(false), fast_reads_available(false) {
 		init_libpfm4();
 		clear();
 	}
@@ -96,15 +121,55 @@ public:
 	}
 
 	void start() {
-		enable_counter_group();
-		reset_counter_group();
+		for(auto & g: groups) {
+			enable_counter_group(g);
+			reset_counter_group(g);
+		}
+		groups_enabled = true;
+		// Resetting doesn't clear the enabled and running times, so we
+		// measure from here.
+		for(auto & g: groups) {
+			if (!read_counter_group(g, g.start_enabled, g.start_running, g.start_values)) {
+				flag_error();
+			}
+		}
 	}
 
 	void stop() {
-		disable_counter_group();
+		for(auto g = groups.rbegin(); g != groups.rend(); g++) {
+			disable_counter_group(*g);
+		}
+		groups_enabled = false;
 		read_counters_and_update_values();
 	}
 
+	// Returns true if read_fast() works for the current counters.  It
+	// does if there's at most one group (so there's no multiplexing)
+	// and the kernel lets us read the counters with rdpmc.  Otherwise,
+	// use start() and stop().  The counters stay enabled, so fast reads
+	// don't need any system calls.
+	bool prepare_fast_reads() {
+		if (!fast_reads_prepared) {
+			fast_reads_prepared = true;
+			fast_reads_available = map_counter_pages();
+		}
+		if (fast_reads_available && !groups_enabled) {
+			for(auto & g: groups) {
+				enable_counter_group(g);
+			}
+			groups_enabled = true;
+		}
+		return fast_reads_available;
+	}
+
+	// Read the current (unscaled, cumulative) value of each counter
+	// into values.  Only use this if prepare_fast_reads() returned true.
+	void read_fast(uint64_t * values) const {
+		for(unsigned int i = 0; i < pages.size(); i++) {
+			values[i] = read_mapped_counter(pages[i]);
+		}
+	}
+
 	void reset_values() {
 		for(auto & cv : counter_values) {
 			cv.value = 0;
@@ -122,13 +187,17 @@ public:
 	}
 	
 	void clear() {
+		unmap_counter_pages();
+		fast_reads_prepared = false;
+		fast_reads_available = false;
 		for(auto & cv : counter_values) {
 			if (cv.fd != -1) {
 				close(cv.fd);
 			}
 		}
 		counter_values.clear();
-		lead_fd = -1;
+		groups.clear();
+		groups_enabled = false;
 
 		if (getenv("CFIDDLE_FAKE_PERF_COUNTER_SUCCESS")) {
 			fake_success = true;
@@ -142,6 +211,10 @@ public:
 		return counter_values;
 	}
 
+	int get_group_count() const {
+		return groups.size();
+	}
+
 	bool check_valid() {
 		return valid && initialization_successful;
 	}
@@ -176,18 +249,30 @@ public:
 private:
 	void add_perf_event(struct perf_event_attr & perf_event,
 			    const std::string & name) {
-		auto new_fd = perf_event_open(perf_event, 0, -1, lead_fd, 0);
+		int new_fd = -1;
+		if (!groups.empty()) {
+			// The kernel refuses to add an event to a group that
+			// the PMU can't count all at once...
+			new_fd = perf_event_open(perf_event, 0, -1, groups.back().lead_fd, 0);
+		}
+		if (new_fd == -1) {
+			// ...so we start a new group.
+			new_fd = perf_event_open(perf_event, 0, -1, -1, 0);
+			if (new_fd != -1) {
+				groups.push_back(CounterGroup(new_fd));
+			}
+		}
 		if (new_fd == -1) {
 			std::cerr << "Couldn't monitor event '"
 				  << name
 				  << "': "
 				  << strerror(errno) << "\n";
 			flag_error();
-		}			
-		if (lead_fd == -1) {
-			lead_fd = new_fd;
+			counter_values.push_back(CounterValue(name, new_fd));
+			return;
 		}
- 		counter_values.push_back(CounterValue(name, new_fd));
+		groups.back().members.push_back(counter_values.size());
+ 		counter_values.push_back(CounterValue(name, new_fd, groups.size() - 1));
 	}
 	
 	long perf_event_open(struct perf_event_attr &hw_event, pid_t pid,
@@ -199,7 +284,7 @@ private:
 	void init_perf_event_attr(struct perf_event_attr & pe, uint32_t type = 0, uint64_t config = 0) {
 	        memset(&pe, 0, sizeof(struct perf_event_attr));
 		pe.size = sizeof(struct perf_event_attr);
-		pe.read_format = PERF_FORMAT_GROUP;
+		pe.read_format = PERF_FORMAT_GROUP | PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING;
 		pe.type = type;
 		pe.config = config;
 		pe.exclude_kernel = 1;
@@ -207,25 +292,116 @@ private:
 	}
 
 
-	void read_counters_and_update_values() {
-		uint64_t buffer[counter_values.size() + 1];
-		const ssize_t to_read = sizeof(uint64_t) * (counter_values.size() + 1);
-		int r = read(lead_fd, buffer, to_read);
+	bool map_counter_pages() {
+#if defined(__x86_64__) || defined(__i386__)
+		if (groups.size() > 1 || counter_values.size() > CFIDDLE_MAX_FAST_COUNTERS) {
+			return false;
+		}
+		long page_size = sysconf(_SC_PAGESIZE);
+		bool available = true;
+		for(auto & cv : counter_values) {
+			if (cv.fd == -1) {
+				available = false;
+				break;
+			}
+			void * page = mmap(NULL, page_size, PROT_READ, MAP_SHARED, cv.fd, 0);
+			if (page == MAP_FAILED) {
+				available = false;
+				break;
+			}
+			pages.push_back((struct perf_event_mmap_page *)page);
+			if (!pages.back()->cap_user_rdpmc) {
+				available = false;
+				break;
+			}
+		}
+		if (!available) {
+			unmap_counter_pages();
+		}
+		return available;
+#else
+		return false;
+#endif
+	}
+
+	void unmap_counter_pages() {
+		long page_size = sysconf(_SC_PAGESIZE);
+		for(auto page : pages) {
+			munmap(page, page_size);
+		}
+		pages.clear();
+	}
+
+	// This is the algorithm from the perf_event_open() man page.  If the
+	// kernel updates the page while we read it, we try again.
+	static uint64_t read_mapped_counter(volatile struct perf_event_mmap_page * page) {
+		uint32_t seq, index;
+		uint64_t count;
+		do {
+			seq = page->lock;
+			__asm__ __volatile__ ("" ::: "memory");
+			index = page->index;
+			count = page->offset;
+			if (page->cap_user_rdpmc && index) {
+				uint16_t width = page->pmc_width;
+				int64_t pmc = read_pmc(index - 1);
+				pmc <<= 64 - width;
+				pmc >>= 64 - width;
+				count += pmc;
+			}
+			__asm__ __volatile__ ("" ::: "memory");
+		} while (page->lock != seq);
+		return count;
+	}
+
+	// The layout is {nr, time_enabled, time_running, value[nr]}.
+	bool read_counter_group(CounterGroup & g, uint64_t & enabled, uint64_t & running, std::vector<uint64_t> & values) {
+		std::vector<uint64_t> buffer(g.members.size() + 3);
+		const ssize_t to_read = sizeof(uint64_t) * buffer.size();
+		int r = read(g.lead_fd, buffer.data(), to_read);
 		if (r != to_read) {
-			flag_error();
-			return;
+			return false;
 		}
-		if (buffer[0] != counter_values.size()) {
-			flag_error();
-			return;
+		if (buffer[0] != g.members.size()) {
+			return false;
+		}
+		enabled = buffer[1];
+		running = buffer[2];
+		values.assign(buffer.begin() + 3, buffer.end());
+		return true;
+	}
+
+	static uint64_t scale_count(uint64_t count, uint64_t enabled, uint64_t running) {
+		if (running == 0) {
+			return 0; // The group never got on the PMU.
 		}
-		for(unsigned int i = 0; i < counter_values.size(); i++) {
-			counter_values[i].value = buffer[i + 1];
+		if (running >= enabled) {
+			return count;
+		}
+		return (uint64_t)((double)count * enabled / running + 0.5);
+	}
+
+	void read_counters_and_update_values() {
+		for(auto & g: groups) {
+			uint64_t enabled, running;
+			std::vector<uint64_t> values;
+			if (!read_counter_group(g, enabled, running, values)) {
+				flag_error();
+				continue;
+			}
+			if (g.start_values.size() != values.size()) {
+				g.start_values.assign(values.size(), 0);
+			}
+			for(unsigned int i = 0; i < g.members.size(); i++) {
+				counter_values[g.members[i]].value = scale_count(values[i] - g.start_values[i],
+										 enabled - g.start_enabled,
+										 running - g.start_running);
+			}
 		}
 	}
 	
-	void enable_counter_group() {
-	        int r = ioctl(lead_fd,						
+	void enable_counter_group(CounterGroup & g) {
+	        int r = ioctl(g.lead_fd,
 			      PERF_EVENT_IOC_ENABLE,
 			      PERF_IOC_FLAG_GROUP);
 		if (r == -1) {
@@ -233,8 +409,8 @@ private:
 		}
 	}
 			
-	void reset_counter_group() {
-	        int r = ioctl(lead_fd,						
+	void reset_counter_group(CounterGroup & g) {
+	        int r = ioctl(g.lead_fd,
 			      PERF_EVENT_IOC_RESET,
 			      PERF_IOC_FLAG_GROUP);
 		if (r == -1) {
@@ -242,8 +418,8 @@ private:
 		}
 	}
 			
-	void disable_counter_group() {
-	        int r = ioctl(lead_fd,						
+	void disable_counter_group(CounterGroup & g) {
+	        int r = ioctl(g.lead_fd,
 			      PERF_EVENT_IOC_DISABLE,
 			      PERF_IOC_FLAG_GROUP);
 		if (r == -1) {
@@ -0,0 +1,224 @@
+#ifndef PROFILER_INCLUDED
+#define PROFILER_INCLUDED
+
+#include <unistd.h>
+#include <string.h>
+#include <errno.h>
+#include <sys/ioctl.h>
+#include <sys/mman.h>
+#include <linux/perf_event.h>
+#include <asm/unistd.h>
+
+#include <string>
+#include <vector>
+#include <algorithm>
+#include <cstdint>
+
+// A sampling profiler for the calling thread, like `perf record -g`.  The
+// kernel samples the instruction pointer and the call stack (by
+// following frame pointers) into a ring buffer, and stop() copies them
+// out.  The samples are stored back to back: the number of frames,
+// followed by the frames' addresses, innermost first.  The frames
+// after the first are return addresses.
+//
+// We don't read the ring buffer while the code is running, so it needs
+// to be big enough to hold the samples from one run (between resume()
+// and pause(), which empties it).  If it fills up, the kernel drops
+// samples, and get_lost() says how many.
+class Profiler {
+	// PERF_FORMAT_LOST (Linux 6.0) makes read() return the number of
+	// samples the kernel dropped.  Older kernels only tell us with
+	// PERF_RECORD_LOST records, and only once the buffer has room for
+	// one, so they can miss samples lost just before we pause.
+	static const uint64_t format_lost = 1U << 4;
+
+	int fd;
+	bool reads_lost;
+	void * ring;
+	size_t ring_size;
+	size_t data_size;
+	std::vector<uint64_t> samples;
+	uint64_t lost;
+	std::string error;
+
+public:
+	Profiler(): fd(-1), reads_lost(false), ring(NULL), ring_size(0), data_size(0), lost(0) {}
+
+	~Profiler() {
+		close_event();
+	}
+
+	// Start sampling (paused) frequency times per second, with a ring
+	// buffer of pages pages.  pages is rounded up to a power of two.  We
+	// sample cycles if we can and CPU time otherwise.  Returns false
+	// (and sets get_error()) if we can't.
+	bool start(int frequency, int pages) {
+		close_event();
+		clear();
+
+		if (open_event(PERF_TYPE_HARDWARE, PERF_COUNT_HW_CPU_CYCLES, frequency) == -1 &&
+		    open_event(PERF_TYPE_SOFTWARE, PERF_COUNT_SW_CPU_CLOCK, frequency) == -1) {
+			error = std::string("perf_event_open() failed: ") + strerror(errno);
+			return false;
+		}
+
+		size_t page_size = sysconf(_SC_PAGESIZE);
+		size_t data_pages = 1;
+		while (data_pages < static_cast<size_t>(pages)) {
+			data_pages *= 2;
+		}
+		data_size = data_pages * page_size;
+		ring_size = data_size + page_size;
+		ring = mmap(NULL, ring_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+		if (ring == MAP_FAILED) {
+			ring = NULL;
+			error = std::string("Couldn't map the profiling buffer: ") + strerror(errno);
+			close_event();
+			return false;
+		}
+		return true;
+	}
+
+	void resume() {
+		if (fd != -1) {
+			ioctl(fd, PERF_EVENT_IOC_ENABLE, 0);
+		}
+	}
+
+	// Stop sampling and collect the samples so far, so the ring buffer
+	// only needs to hold one run's samples.
+	void pause() {
+		if (fd != -1) {
+			ioctl(fd, PERF_EVENT_IOC_DISABLE, 0);
+			drain();
+			read_lost();
+		}
+	}
+
+	// Stop sampling and collect the samples.
+	void stop() {
+		if (fd == -1) {
+			return;
+		}
+		pause();
+		close_event();
+	}
+
+	void clear() {
+		samples.clear();
+		lost = 0;
+		error.clear();
+	}
+
+	const std::vector<uint64_t> & get_samples() const {
+		return samples;
+	}
+
+	uint64_t get_lost() const {
+		return lost;
+	}
+
+	const std::string & get_error() const {
+		return error;
+	}
+
+private:
+	int open_event(uint32_t type, uint64_t config, int frequency) {
+		reads_lost = true;
+		if (open_event(type, config, frequency, format_lost) != -1 || errno != EINVAL) {
+			return fd;
+		}
+		reads_lost = false;
+		return open_event(type, config, frequency, 0);
+	}
+
+	int open_event(uint32_t type, uint64_t config, int frequency, uint64_t read_format) {
+		struct perf_event_attr pe;
+		memset(&pe, 0, sizeof(pe));
+		pe.size = sizeof(pe);
+		pe.type = type;
+		pe.config = config;
+		pe.freq = 1;
+		pe.sample_freq = frequency;
+		pe.sample_type = PERF_SAMPLE_IP | PERF_SAMPLE_CALLCHAIN;
+		pe.read_format = read_format;
+		pe.disabled = 1;
+		pe.exclude_kernel = 1;
+		pe.exclude_hv = 1;
+		pe.exclude_callchain_kernel = 1;
+		fd = syscall(__NR_perf_event_open, &pe, 0, -1, -1, 0);
+		return fd;
+	}
+
+	void close_event() {
+		if (ring) {
+			munmap(ring, ring_size);
+			ring = NULL;
+		}
+		if (fd != -1) {
+			close(fd);
+			fd = -1;
+		}
+	}
+
+	void read_lost() {
+		uint64_t values[2]; // value, lost
+		if (reads_lost && read(fd, values, sizeof(values)) == sizeof(values)) {
+			lost = std::max(lost, values[1]);
+		}
+	}
+
+	// Copy len bytes at offset in the ring's data area (which may wrap around) to out.
+	void copy_from_ring(uint64_t offset, void * out, size_t len) {
+		char * data = static_cast<char*>(ring) + (ring_size - data_size);
+		size_t start = offset % data_size;
+		size_t first = std::min(len, data_size - start);
+		memcpy(out, data + start, first);
+		memcpy(static_cast<char*>(out) + first, data, len - first);
+	}
+
+	void drain() {
+		if (ring == NULL) {
+			return;
+		}
+		struct perf_event_mmap_page * header = static_cast<struct perf_event_mmap_page *>(ring);
+		uint64_t head = __atomic_load_n(&header->data_head, __ATOMIC_ACQUIRE);
+		uint64_t tail = header->data_tail;
+		std::vector<uint64_t> record;
+
+		while (tail < head) {
+			struct perf_event_header h;
+			copy_from_ring(tail, &h, sizeof(h));
+			if (h.size < sizeof(h)) {
+				break;
+			}
+			record.resize((h.size - sizeof(h) + 7) / 8);
+			copy_from_ring(tail + sizeof(h), record.data(), h.size - sizeof(h));
+
+			if (h.type == PERF_RECORD_SAMPLE && record.size() >= 2) {
+				add_sample(record[0], record[1], record.data() + 2, record.size() - 2);
+			} else if (h.type == PERF_RECORD_LOST && record.size() >= 2) {
+				lost += record[1]; // id, lost
+			}
+			tail += h.size;
+		}
+		__atomic_store_n(&header->data_tail, tail, __ATOMIC_RELEASE);
+	}
+
+	void add_sample(uint64_t ip, uint64_t nr, const uint64_t * callchain, size_t available) {
+		size_t count_index = samples.size();
+		samples.push_back(0);
+		for(uint64_t i = 0; i < nr && i < available; i++) {
+			if (callchain[i] >= PERF_CONTEXT_MAX) {
+				continue; // Not an address (e.g., PERF_CONTEXT_USER).
+			}
+			samples.push_back(callchain[i]);
+		}
+		if (samples.size() == count_index + 1) {
+			samples.push_back(ip);
+		}
+		samples[count_index] = samples.size() - count_index - 1;
+	}
+};
+
+#endif
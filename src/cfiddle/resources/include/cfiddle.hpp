@@ -7,6 +7,8 @@
 
 class DataSet;
 class PerfCounter;
+class HistogramSet;
+class Profiler;
 
 typedef void * funcptr_t;
 
@@ -18,8 +20,20 @@ extern "C" void write_stats(const char *  filename);
 extern "C" void start_measurement(const char *tag=NULL);
 extern "C" void end_measurement();
 extern "C" void restart_measurement(const char *tag=NULL);
+extern "C" void reserve_measurements(int rows);
+
+// Low-overhead measurements for very short regions.  See cfiddle.cpp.
+extern "C" void start_fast_measurement(const char *tag=NULL);
+extern "C" void end_fast_measurement();
+extern "C" void set_fast_measurement_capacity(int records);
+
+// Latency histograms.  Record a value (e.g., a latency in ns) in the
+// histogram called name.  See Histogram.hpp.
+extern "C" void cfiddle_hist_record(const char *name, uint64_t value);
 
 extern DataSet * get_dataset();
 extern PerfCounter * get_perf_counter();
+extern HistogramSet * get_histograms();
+extern Profiler * get_profiler();
 
 #endif
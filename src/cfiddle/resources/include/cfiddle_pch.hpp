@@ -0,0 +1,11 @@
+#ifndef CFIDDLE_PCH_INCLUDED
+#define CFIDDLE_PCH_INCLUDED
+
+// The header CFiddle precompiles when the precompiled_headers
+// configuration option is set.  It's force-included into C++ files that
+// include cfiddle.hpp, so it must not include anything cfiddle.hpp
+// doesn't, or it would change what those files see.
+
+#include"cfiddle.hpp"
+
+#endif
@@ -0,0 +1,66 @@
+#ifndef TSC_H_INCLUDED
+#define TSC_H_INCLUDED
+#include <stdint.h>
+#include <time.h>
+
+// A cheap, monotonic tick counter.  On x86 it's the time stamp counter
+// (rdtsc).  Elsewhere it's CLOCK_MONOTONIC in nanoseconds.
+
+static inline uint64_t read_tsc()
+{
+#if defined(__x86_64__) || defined(__i386__)
+	uint32_t lo, hi;
+	// lfence keeps rdtsc from running before earlier instructions finish.
+	__asm__ __volatile__ ("lfence\n\trdtsc" : "=a" (lo), "=d" (hi) :: "memory");
+	return ((uint64_t)hi << 32) | lo;
+#else
+	struct timespec t;
+	clock_gettime(CLOCK_MONOTONIC, &t);
+	return (uint64_t)t.tv_sec * 1000000000ull + t.tv_nsec;
+#endif
+}
+
+static inline double monotonic_seconds()
+{
+	struct timespec t;
+	clock_gettime(CLOCK_MONOTONIC, &t);
+	return 1.0*t.tv_sec + 1.e-9*t.tv_nsec;
+}
+
+// How long a tick is.  For rdtsc, we measure it once against
+// CLOCK_MONOTONIC, which takes about 10ms.
+static inline double tsc_seconds_per_tick()
+{
+#if defined(__x86_64__) || defined(__i386__)
+	static double seconds_per_tick = 0.0;
+	if (seconds_per_tick == 0.0) {
+		double start = monotonic_seconds();
+		uint64_t start_ticks = read_tsc();
+		double now;
+		do {
+			now = monotonic_seconds();
+		} while (now - start < 0.01);
+		uint64_t end_ticks = read_tsc();
+		seconds_per_tick = (now - start) / (end_ticks - start_ticks);
+	}
+	return seconds_per_tick;
+#else
+	return 1e-9;
+#endif
+}
+
+// Read hardware performance counter 'counter' from user space.  Only
+// valid if the kernel allows it (see perf_event_mmap_page.cap_user_rdpmc).
+static inline uint64_t read_pmc(uint32_t counter)
+{
+#if defined(__x86_64__) || defined(__i386__)
+	uint32_t lo, hi;
+	__asm__ __volatile__ ("rdpmc" : "=a" (lo), "=d" (hi) : "c" (counter));
+	return ((uint64_t)hi << 32) | lo;
+#else
+	(void)counter;
+	return 0;
+#endif
+}
+
+#endif
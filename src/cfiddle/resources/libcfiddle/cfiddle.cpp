@@ -2,13 +2,22 @@
 #include<sstream>
 #include<string>
 #include<fstream>
+#include<vector>
+#include<cstdint>
+#include<dlfcn.h>
 #include"DataSet.hpp"
 #include"PerfCounter.hpp"
+#include"MeasurementBuffer.hpp"
+#include"Histogram.hpp"
+#include"Profiler.hpp"
 #include"walltime.h"
+#include"tsc.h"
 
 double start_time = 0.0;
 
 DataSet * get_dataset();
+MeasurementBuffer * get_measurement_buffer();
+void flush_fast_measurements();
 
 extern "C"
 void write_stats(const char *  filename) {
@@ -18,14 +27,192 @@ void write_stats(const char *  filename) {
 	out.close();
 }
 
+// In-memory export of the data set.  export_stats() takes a snapshot of
+// the columns, and the other functions read the values for a column into
+// buffers the caller provides.  present[i] is set to 1 if row i has a
+// value for the column and 0 otherwise.
+
+std::vector<std::string> exported_columns;
+
+extern "C"
+int export_stats() {
+	flush_fast_measurements();
+	exported_columns = get_dataset()->get_keys();
+	return exported_columns.size();
+}
+
+extern "C"
+int stats_row_count() {
+	return get_dataset()->size();
+}
+
+extern "C"
+const char * stats_column_name(int column) {
+	return exported_columns[column].c_str();
+}
+
+extern "C"
+int stats_column_type(int column) {
+	return get_dataset()->get_kind(exported_columns[column]);
+}
+
+extern "C"
+void stats_column_int64(int column, int64_t * values, char * present) {
+	auto dataset = get_dataset();
+	auto c = dataset->find_column(exported_columns[column]);
+	for(unsigned int i = 0; i < dataset->size(); i++) {
+		present[i] = c->has(i);
+		values[i] = c->get(i).as_int64();
+	}
+}
+
+extern "C"
+void stats_column_double(int column, double * values, char * present) {
+	auto dataset = get_dataset();
+	auto c = dataset->find_column(exported_columns[column]);
+	for(unsigned int i = 0; i < dataset->size(); i++) {
+		present[i] = c->has(i);
+		values[i] = c->get(i).as_double();
+	}
+}
+
+// Returns NULL if the row has no value for the column.  The string is
+// valid until the next call.
+extern "C"
+const char * stats_string_value(int row, int column) {
+	static std::string value;
+	auto c = get_dataset()->find_column(exported_columns[column]);
+	if (!c->has(row)) {
+		return NULL;
+	}
+	value = c->get(row).to_string();
+	return value.c_str();
+}
+
+// Export the histograms the same way.  export_histograms() takes a
+// snapshot of the histograms with values in them.
+
+std::vector<Histogram*> exported_histograms;
+
+extern "C"
+int export_histograms() {
+	auto histograms = get_histograms();
+	exported_histograms.clear();
+	for(unsigned int i = 0; i < histograms->size(); i++) {
+		if ((*histograms)[i].get_count()) {
+			exported_histograms.push_back(&(*histograms)[i]);
+		}
+	}
+	return exported_histograms.size();
+}
+
+extern "C"
+const char * histogram_name(int histogram) {
+	return exported_histograms[histogram]->get_name().c_str();
+}
+
+// Fills in the count, min, and max of the values, and their sum.
+extern "C"
+void histogram_summary(int histogram, uint64_t * count_min_max, double * sum) {
+	auto h = exported_histograms[histogram];
+	count_min_max[0] = h->get_count();
+	count_min_max[1] = h->get_min();
+	count_min_max[2] = h->get_max();
+	*sum = h->get_sum();
+}
+
+extern "C"
+int histogram_bucket_count(int histogram) {
+	return exported_histograms[histogram]->used_buckets();
+}
+
+// Fills in the range of values (inclusive) and count for each bucket
+// with values in it.  The arrays need histogram_bucket_count() elements.
+extern "C"
+void histogram_buckets(int histogram, uint64_t * lows, uint64_t * highs, uint64_t * counts) {
+	auto h = exported_histograms[histogram];
+	int n = 0;
+	for(unsigned int i = 0; i < Histogram::BUCKETS; i++) {
+		uint64_t c = h->get_bucket_count(i);
+		if (c) {
+			lows[n] = Histogram::lowest_value(i);
+			highs[n] = Histogram::highest_value(i);
+			counts[n] = c;
+			n++;
+		}
+	}
+}
+
+// Sampling profiles (i.e., run(..., profile=True)).  The Invoker calls
+// start_profile() once, resume_profile() and pause_profile() around each
+// call to the function, and then stop_profile().  See Profiler.hpp for
+// the format of profile_data().
+
+extern "C"
+bool start_profile(int frequency, int pages) {
+	return get_profiler()->start(frequency, pages);
+}
+
+extern "C"
+void resume_profile() {
+	get_profiler()->resume();
+}
+
+extern "C"
+void pause_profile() {
+	get_profiler()->pause();
+}
+
+extern "C"
+void stop_profile() {
+	get_profiler()->stop();
+}
+
+extern "C"
+const char * profile_error() {
+	return get_profiler()->get_error().c_str();
+}
+
+extern "C"
+uint64_t profile_lost_samples() {
+	return get_profiler()->get_lost();
+}
+
+extern "C"
+int profile_data_size() {
+	return get_profiler()->get_samples().size();
+}
+
+extern "C"
+void profile_data(uint64_t * data) {
+	auto & samples = get_profiler()->get_samples();
+	std::copy(samples.begin(), samples.end(), data);
+}
+
+// Returns the file that contains address and sets *offset to address's
+// offset from where the file is loaded (i.e., the address in the file),
+// or returns NULL if we don't know.
+extern "C"
+const char * profile_resolve(uint64_t address, uint64_t * offset) {
+	Dl_info info;
+	if (dladdr(reinterpret_cast<void*>(address), &info) == 0 || info.dli_fname == NULL) {
+		return NULL;
+	}
+	*offset = address - reinterpret_cast<uint64_t>(info.dli_fbase);
+	return info.dli_fname;
+}
 
 extern "C"
 void clear_stats() {
+	get_measurement_buffer()->clear();
 	get_dataset()->clear();
+	get_histograms()->clear();
 }
 
 extern "C"
 void clear_perf_counters() {
+	// Buffered measurements need the current counters' names.
+	flush_fast_measurements();
 	get_perf_counter()->clear();
 }
 
@@ -79,6 +266,157 @@ void restart_measurement(const char *tag)
 	start_measurement(tag);
 }
 
+// start_fast_measurement() and end_fast_measurement() measure the same
+// things as start_measurement() and end_measurement(), but with much
+// less overhead, so you can measure very short regions.  They time the
+// region with rdtsc instead of clock_gettime(), and if the kernel allows
+// it (and all the counters fit on the PMU at once), they read the
+// performance counters with rdpmc instead of system calls.  The results
+// go in a preallocated buffer, and are added to the data set when it's
+// exported.  So, these rows come after any rows from start_measurement(),
+// and you can't add values to them with get_dataset()->set().  Tags are
+// truncated to 31 characters.
+//
+// If they can't do what you ask (e.g., there are more than
+// CFIDDLE_MAX_FAST_COUNTERS counters), they don't record anything, and
+// fast_measurement_error() says why.
+
+std::string fast_measurement_error_message;
+
+void set_fast_measurement_error(const std::string & message)
+{
+	if (fast_measurement_error_message.empty()) {
+		fast_measurement_error_message = message;
+	}
+}
+
+extern "C"
+const char * fast_measurement_error()
+{
+	return fast_measurement_error_message.c_str();
+}
+
+extern "C"
+void clear_fast_measurement_error()
+{
+	fast_measurement_error_message.clear();
+}
+
+extern "C"
+void start_fast_measurement(const char *tag)
+{
+	auto buffer = get_measurement_buffer();
+	auto perf_counter = get_perf_counter();
+
+	if (perf_counter->get_counters().size() > CFIDDLE_MAX_FAST_COUNTERS) {
+		std::stringstream message;
+		message << "start_fast_measurement() can measure at most " << CFIDDLE_MAX_FAST_COUNTERS
+			<< " performance counters, but there are " << perf_counter->get_counters().size()
+			<< ".  Use start_measurement() instead.";
+		set_fast_measurement_error(message.str());
+		return;
+	}
+
+	FastRecord * r = buffer->open_record(tag);
+	if (r == NULL) {
+		flush_fast_measurements();
+		r = buffer->open_record(tag);
+	}
+
+	r->read_with_rdpmc = perf_counter->prepare_fast_reads();
+	if (r->read_with_rdpmc) {
+		perf_counter->read_fast(r->values);
+	} else {
+		perf_counter->start();
+	}
+	r->start_ticks = read_tsc();
+}
+
+extern "C"
+void end_fast_measurement()
+{
+	uint64_t end_ticks = read_tsc();
+	auto buffer = get_measurement_buffer();
+	auto perf_counter = get_perf_counter();
+
+	FastRecord * r = buffer->current_record();
+	if (r == NULL) {
+		return;
+	}
+
+	r->end_ticks = end_ticks;
+	if (r->read_with_rdpmc) {
+		uint64_t values[CFIDDLE_MAX_FAST_COUNTERS];
+		perf_counter->read_fast(values);
+		for(unsigned int i = 0; i < perf_counter->get_counters().size(); i++) {
+			r->values[i] = values[i] - r->values[i];
+		}
+	} else {
+		perf_counter->stop();
+		auto & counters = perf_counter->get_counters();
+		for(unsigned int i = 0; i < counters.size() && i < CFIDDLE_MAX_FAST_COUNTERS; i++) {
+			r->values[i] = counters[i].value;
+		}
+	}
+	buffer->commit_record();
+}
+
+extern "C"
+void set_fast_measurement_capacity(int records)
+{
+	if (records <= 0) {
+		set_fast_measurement_error("set_fast_measurement_capacity() needs a positive number of records, not " + std::to_string(records) + ".");
+		return;
+	}
+	flush_fast_measurements();
+	get_measurement_buffer()->set_capacity(records);
+}
+
+extern "C"
+void cfiddle_hist_record(const char *name, uint64_t value)
+{
+	get_histograms()->get(name)->record(value);
+}
+
+// Make room for this many rows (in total) in the data set, so recording
+// them doesn't allocate memory.
+extern "C"
+void reserve_measurements(int rows)
+{
+	get_dataset()->reserve(rows);
+}
+
+void flush_fast_measurements()
+{
+	auto buffer = get_measurement_buffer();
+	if (buffer->size() == 0) {
+		return;
+	}
+	auto dataset = get_dataset();
+	auto & counters = get_perf_counter()->get_counters();
+	double seconds_per_tick = tsc_seconds_per_tick();
+
+	dataset->reserve(dataset->size() + buffer->size());
+	ColumnId tag = dataset->column_id("tag");
+	ColumnId et = dataset->column_id("ET");
+	std::vector<ColumnId> counter_columns;
+	for(unsigned int i = 0; i < counters.size() && i < CFIDDLE_MAX_FAST_COUNTERS; i++) {
+		counter_columns.push_back(dataset->column_id(counters[i].name));
+	}
+
+	for(auto r = buffer->begin(); r != buffer->end(); r++) {
+		dataset->start_new_row();
+		if (r->tag[0]) {
+			dataset->set(tag, (const char*)r->tag);
+		}
+		dataset->set(et, (r->end_ticks - r->start_ticks) * seconds_per_tick);
+		for(unsigned int i = 0; i < counter_columns.size(); i++) {
+			dataset->set(counter_columns[i], r->values[i]);
+		}
+	}
+	buffer->clear();
+}
+
 
 DataSet *get_dataset() {
 	static DataSet *ds = new DataSet();
@@ -86,6 +424,24 @@ DataSet *get_dataset() {
 }
 
 
+HistogramSet *get_histograms() {
+	static HistogramSet *hs = new HistogramSet();
+	return hs;
+}
+
+
+Profiler *get_profiler() {
+	static Profiler *p = new Profiler();
+	return p;
+}
+
+
+MeasurementBuffer *get_measurement_buffer() {
+	static MeasurementBuffer *mb = new MeasurementBuffer();
+	return mb;
+}
+
+
 PerfCounter *get_perf_counter() {
 	static PerfCounter *pc = new PerfCounter();
 	return pc;
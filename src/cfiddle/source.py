@@ -2,13 +2,14 @@ import re
 import os
 import subprocess
 import pytest
-import tempfile
 import io
 
 from .Builder import Executable
-from .util import invoke_process, infer_language
+from .util import infer_language, file_stamp
 from .CFG.cfg import CFG
-from .DebugInfo import DebugInfo
+from .DebugInfo import DebugInfo, DWARF_INDEX_ERRORS
+from .CodeIndex import CodeIndex, find_function_in_asm, find_function_in_source
+from .Demangler import TheDemangler
 from .Exceptions import CFiddleException
 
 
@@ -17,12 +18,16 @@ class Source:
     def source(self, show=None, language=None, filter=None, **kwargs):
         """Return the source code for a function.
         
-        This function uses regular expression-based heuristics to find the
-        function, rather than actually parsing the code, this can lead to
-        unexpected outputs.
-
-        The heuristics assume that the function prototype is on a single line
-        and that the function ends with a ``}`` on a line by itself.
+        If the code was compiled with debugging information (the default),
+        the function starts on the line where the debugging information
+        says it's declared and ends with the first ``}`` on a line by
+        itself after its last line of code.
+
+        Otherwise, this function uses regular expression-based heuristics
+        to find the function, rather than actually parsing the code, this
+        can lead to unexpected outputs.  The heuristics assume that the
+        function prototype is on a single line and that the function ends
+        with a ``}`` on a line by itself.
         
         Args:
            show: What to show.  Either a function name or a 2-tuple: either ``(start_regex,end_regex)`` or ``(start_line_number,end_line_number``).  Defaults to ``None`` which shows the whole file.
@@ -34,26 +39,53 @@ class Source:
 
         if language is None:
             language = infer_language(self.build_spec.source_file)
-        return filter_code(extract_code(self.build_spec.source_file, self, show=show, language=language, **kwargs), filter)
+
+        source_file = self.build_spec.source_file
+        source = contents_of(source_file)
+        if isinstance(show, str):
+            show = self._find_function_in_source(source_file, source.split("\n"), language, show) or show
+
+        return filter_code(extract_code(source_file, self, source=source, show=show, language=language, **kwargs), filter)
+
+    def _find_function_in_source(self, source_file, lines, language, function):
+        if language not in ["c++", "c", "go"]:
+            return None
+        _, end_regex = construct_function_regex(self, language, function)
+        return find_function_in_source(self._dwarf_index_if_available(), source_file, lines, function, end_regex)
+
+    def _dwarf_index_if_available(self):
+        try:
+            return self.dwarf_index()
+        except (AttributeError,) + DWARF_INDEX_ERRORS:
+            return None
 
 
 class Assembly:
 
     FUNCTION_LABEL = "^[^\.\s]\w.*:"
 
-    def asm(self, show=None, demangle=True,  filter=None,**kwargs):
+    def asm(self, show=None, demangle=True,  filter=None, profile=None, **kwargs):
         """Return the compiled assembly for a function.
 
         The output is from the assembly output of the compiler (e.g., the
         result of ``g++ -S``), not the compiled object code.
 
-        This function uses regular expression-based heuristics to find the
-        function, rather than actually parsing the code, this can lead to
-        unexpected outputs.
+        Functions are found by their labels and end at the next
+        ``.cfi_endproc`` (or equivalent for the toolchain).  When you ask
+        for a single function, only its lines are demangled.
+
+        If you pass a :obj:`Profile` (from :code:`run(..., profile=True)`),
+        each line starts with the percentage of the samples that were in
+        the instructions it describes.  The debugging information maps
+        addresses to the ``.loc`` directives the compiler emits whenever
+        the source line changes, so the percentages are on the ``.loc``
+        lines and cover the instructions up to the next one.  This needs
+        debugging information (the default).
 
         Args:
            show: What to show.  Either a function name or a 2-tuple: either ``(start_regex,end_regex)`` or ``(start_line_number,end_line_number``).  Defaults to ``None`` which shows the whole file.
-           demangle: Pass the assembly through ``c++filt`` first, so C++ symbols are more readable.  Defaults to ``True``.
+           demangle: Demangle C++ symbols, so they are more readable.  Defaults to ``True``.
+           profile: A :obj:`Profile` to annotate the assembly with.  Defaults to ``None``.
         Returns:
            ``str`` : The assembly.
 
@@ -64,23 +96,47 @@ class Assembly:
 
         assembly = contents_of(asm_file)
 
+        if isinstance(show, str):
+            demangler = self._demangle_symbols if demangle else None
+            show = find_function_in_asm(self, asm_file, assembly, show, demangler=demangler) or show
+
         if demangle:
-            assembly = self.demangle_assembly(assembly)
+            if isinstance(show, tuple) and all(isinstance(x, int) for x in show):
+                assembly = self._demangle_lines(assembly, *show)
+            else:
+                assembly = self.demangle_assembly(assembly)
+
+        if profile is not None:
+            lines = assembly.split("\n")
+            # The annotations would confuse the regexes, so find the region first.
+            show = resolve_region(self, lines, show, "gas")
+            assembly = "\n".join(self._annotate_asm(lines, profile))
 
         return filter_code(extract_code(asm_file, self, source=assembly, show=show, language="gas", **kwargs), filter)
 
+    def _annotate_asm(self, lines, profile):
+        index = self.code_index()
+        samples = {}
+        for address, count in profile.address_counts(self.lib).items():
+            line = index.find_asm_line(address)
+            if line is not None:
+                samples[line] = samples.get(line, 0) + count
+
+        total = profile.sample_count
+        return [(f"{samples[n] * 100.0 / total:5.1f}% " if n in samples else " " * 7) + l for n, l in enumerate(lines)]
+
     
     def demangle_assembly(self, assembly):
-        with tempfile.NamedTemporaryFile() as asm_file:
-            asm_file.write(assembly.encode())
-            asm_file.flush()
+        return TheDemangler.demangle_text(assembly, cxxfilt=self.get_toolchain().get_tool('c++filt'))
 
-            with open(asm_file.name, "r") as f:
-                success, demangled = invoke_process([self.get_toolchain().get_tool('c++filt')],
-                                                    stdin=f)
-            if not success:
-                raise Exception("Demangling failed.")
-        return demangled
+    def _demangle_symbols(self, symbols):
+        return TheDemangler.demangle_all(symbols, cxxfilt=self.get_toolchain().get_tool('c++filt'))
+
+    def _demangle_lines(self, assembly, start, end):
+        # Lines outside [start, end) won't be shown, so we leave them alone.
+        lines = assembly.split("\n")
+        lines[start:end] = self.demangle_assembly("\n".join(lines[start:end])).split("\n")
+        return "\n".join(lines)
 
 
 class Preprocessed:
@@ -137,6 +193,37 @@ class InstrumentedExecutable(Preprocessed, Source, Assembly, CFG, DebugInfo, Exe
     def __init__(self, *argc, **kwargs):
         super().__init__(*argc, **kwargs)
 
+    def code_index(self):
+        """Return a :obj:`CodeIndex` describing where each function is in the library, source, and assembly.
+
+        The index uses the symbol table in the library, so function names
+        are the symbol names (i.e., mangled for C++).  It's built the
+        first time you ask for it.
+
+        Returns:
+          :obj:`CodeIndex`: The index.
+        """
+        source_file = self.build_spec.source_file
+        asm_file = self.compute_built_filename(f"{self.extract_build_name(source_file)}.s")
+        key = tuple(file_stamp(f) for f in [self.lib, source_file, asm_file])
+
+        cached = getattr(self, "_code_index", None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        language = infer_language(source_file)
+        source_lines, source_end_regex = None, None
+        if language in ["c++", "c", "go"] and os.path.exists(source_file):
+            source_lines = contents_of(source_file).split("\n")
+            _, source_end_regex = construct_function_regex(self, language, "")
+
+        asm_lines = contents_of(asm_file).split("\n") if os.path.exists(asm_file) else None
+        _, asm_end_regex = self.get_toolchain().get_asm_function_bookends("")
+
+        index = CodeIndex.build(self.lib, self._dwarf_index_if_available(), source_file, source_lines, asm_lines, source_end_regex, asm_end_regex)
+        self._code_index = (key, index)
+        return index
+
 
 
 def extract_code(filename, executable, source=None, show=None, language=None, include_header=False):
@@ -146,24 +233,10 @@ def extract_code(filename, executable, source=None, show=None, language=None, in
 
     lines = source.split("\n")
 
-    if show is None:
-        show = 0, len(lines)
-
     if language is None:
         language = infer_language(filename)
 
-    if isinstance(show, str):
-        show = construct_function_regex(executable, language, show)
-
-    if len(show) == 2:
-        if all([isinstance(x, str) for x in show]): 
-            start_line, end_line = find_region_by_regex(lines, show)
-        elif all([isinstance(x, int) for x in show]): 
-            start_line, end_line = show
-        else:
-            raise InspectionError(f"{show} is not a valid specification of code to extract.")
-    else:
-        raise InspectionError(f"{show} is not a valid specification of code to extract.")
+    start_line, end_line = resolve_region(executable, lines, show, language)
 
     src = "\n".join(lines[start_line:end_line])
 
@@ -172,6 +245,22 @@ def extract_code(filename, executable, source=None, show=None, language=None, in
 
     return src
 
+def resolve_region(executable, lines, show, language):
+    """Turn :code:`show` (see :meth:`Source.source()`) into :code:`(start_line, end_line)`."""
+    if show is None:
+        return 0, len(lines)
+
+    if isinstance(show, str):
+        show = construct_function_regex(executable, language, show)
+
+    if len(show) == 2:
+        if all([isinstance(x, str) for x in show]): 
+            return find_region_by_regex(lines, show)
+        elif all([isinstance(x, int) for x in show]): 
+            return show
+
+    raise InspectionError(f"{show} is not a valid specification of code to extract.")
+
 def filter_code(contents, filt):
 
     if filt is None:
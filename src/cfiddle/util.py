@@ -2,6 +2,7 @@ import pytest
 import copy
 import sys
 import os
+import hashlib
 
 from contextlib import contextmanager
 from functools import reduce
@@ -198,6 +199,52 @@ def changes_in(filename):
 
         
 
+def same_file(a, b):
+    """Return whether paths :code:`a` and :code:`b` are the same file.
+
+    If either doesn't exist, compare their base names instead.  Either can
+    be :code:`None`, which doesn't match anything.
+    """
+    if a is None or b is None:
+        return False
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return os.path.basename(a) == os.path.basename(b)
+
+
+def file_stamp(path):
+    """Return :code:`path`'s size and modification time, or :code:`None` if it doesn't exist.
+
+    If the stamp hasn't changed, we assume the contents haven't either.
+    """
+    try:
+        s = os.stat(path)
+    except OSError:
+        return None
+    return (s.st_size, s.st_mtime_ns)
+
+
+_file_digests = {}
+
+def file_digest(path):
+    """Return the SHA-256 hash of :code:`path`'s contents as a hex string.
+
+    We often need the hash of the same few files over and over, so we
+    only hash each version (see :func:`file_stamp()`) of a file once.
+    Raises :obj:`OSError` if the file can't be read.
+    """
+    stamp = file_stamp(path)
+    key = (os.path.abspath(path), stamp)
+    if stamp is None or key not in _file_digests:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if stamp is None:
+            return digest
+        _file_digests[key] = digest
+    return _file_digests[key]
+
+
 def invoke_process(cmd, stdin=None):
     try:
         p = subprocess.run(cmd, check=True, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=stdin)
@@ -207,7 +254,38 @@ def invoke_process(cmd, stdin=None):
     except FileNotFoundError as e:
         return False, str(e)
 
-    
+
+def invoke_process_with_usage(cmd, stdin=None):
+    """Like :func:`invoke_process()`, but also measure the resources the process uses.
+
+    Returns:
+      :code:`(success, output, usage)` where :code:`usage` is a :obj:`dict` with :code:`wall_time`, :code:`user_time`, and :code:`system_time` in seconds and :code:`max_rss` in bytes.  The CPU times include the process's children, and :code:`max_rss` is the largest of them.  :code:`usage` is :code:`None` if the process couldn't start.
+    """
+    start = time.perf_counter()
+    try:
+        p = subprocess.Popen(cmd, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, stdin=stdin)
+    except FileNotFoundError as e:
+        return False, str(e), None
+
+    with p.stdout:
+        output = p.stdout.read()
+    _, status, rusage = os.wait4(p.pid, 0)
+    p.returncode = _exit_code(status)
+
+    usage = dict(wall_time=time.perf_counter() - start,
+                 user_time=rusage.ru_utime,
+                 system_time=rusage.ru_stime,
+                 max_rss=rusage.ru_maxrss * 1024)
+    return p.returncode == 0, output.decode(), usage
+
+
+def _exit_code(status):
+    # Like os.waitstatus_to_exitcode(), which needs Python 3.9: signals are negative, like subprocess.
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
 def get_native_architecture():
     return os.uname().machine
     
@@ -0,0 +1,82 @@
+from cfiddle.BuildCache import BuildCache
+from fixtures import *
+import os
+import time
+
+
+def write(path, contents):
+    with open(path, "w") as f:
+        f.write(contents)
+
+        
+@pytest.fixture
+def cache(setup):
+    return BuildCache(os.path.join(setup, "cache"))
+
+
+def test_key(setup, cache):
+    source = os.path.join(setup, "a.cpp")
+    write(source, "int a;")
+    k1 = cache.compute_key([source], dict(OPTIMIZE="-O0"), ["g++"])
+    assert k1 == cache.compute_key([source], dict(OPTIMIZE="-O0"), ["g++"])
+    assert k1 != cache.compute_key([source], dict(OPTIMIZE="-O1"), ["g++"])
+    assert k1 != cache.compute_key([source], dict(OPTIMIZE="-O0"), ["g++"], extra=["other"])
+    write(source, "int b;")
+    assert k1 != cache.compute_key([source], dict(OPTIMIZE="-O0"), ["g++"])
+
+    
+def test_store_and_lookup(setup, cache):
+    source = os.path.join(setup, "a.cpp")
+    header = os.path.join(setup, "a.h")
+    dep_file = os.path.join(setup, "a.d")
+    output = os.path.join(setup, "a.so")
+    write(source, "int a;")
+    write(header, "int b;")
+    write(output, "lib")
+    write(dep_file, f"a.o: {source} \\\n {header}\n")
+
+    key = cache.compute_key([source], {}, [])
+    assert cache.lookup(key) is None
+
+    cache.store(key, dict(lib=output), dependency_files=[dep_file], output_files=[output])
+    assert cache.lookup(key)["lib"] == output
+
+    write(header, "int c;")
+    assert cache.lookup(key) is None
+
+    write(header, "int b;")
+    assert cache.lookup(key) is not None
+
+    time.sleep(0.01)
+    write(output, "new lib")
+    assert cache.lookup(key) is None
+
+
+def test_old_entries(setup, cache):
+    import pickle
+    key = cache.compute_key([], {}, [])
+    cache.store(key, dict(lib="a.so"))
+    with open(cache._entry_path(key), "wb") as f:
+        pickle.dump(dict(lib="a.so"), f) # no "outputs" or "dependencies"
+    assert cache.lookup(key) is None
+
+    with open(cache._entry_path(key), "wb") as f:
+        pickle.dump(["not", "a", "dict"], f)
+    assert cache.lookup(key) is None
+
+
+def test_eviction(setup):
+    cache = BuildCache(os.path.join(setup, "cache"), max_entries=2)
+    keys = [cache.compute_key([], {}, [], extra=[str(i)]) for i in range(3)]
+    cache.store(keys[0], dict(lib="0"))
+    time.sleep(0.01)
+    cache.store(keys[1], dict(lib="1"))
+    time.sleep(0.01)
+    assert cache.lookup(keys[0])["lib"] == "0" # now more recently used than keys[1]
+    time.sleep(0.01)
+    cache.store(keys[2], dict(lib="2"))
+
+    assert cache.lookup(keys[0]) is not None
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[2]) is not None
+    assert len(os.listdir(os.path.join(setup, "cache"))) == 2
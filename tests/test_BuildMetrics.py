@@ -0,0 +1,73 @@
+from cfiddle.BuildMetrics import *
+from fixtures import *
+import json
+import os
+import pytest
+
+GCC_OUTPUT = """g++ -c -Wall -Werror -ftime-report -MMD test.cpp -o build/test.o
+
+Time variable                                   usr           sys          wall           GGC
+ phase setup                        :   0.00 (  0%)   0.00 (  0%)   0.01 (100%)  1576k ( 71%)
+ phase opt and generate             :   0.01 (100%)   0.00 (  0%)   0.00 (  0%)    58k (  3%)
+ TOTAL                              :   0.01          0.00          0.01         2228k
+g++ -c -Wall -Werror -ftime-report -MMD other.cpp -o other_build/other.o
+
+Time variable                                   usr           sys          wall           GGC
+ TOTAL                              :   0.50          0.10          0.70           12M
+g++ build/test.o -shared -o build/test.so
+"""
+
+def test_parse_time_report():
+    report = parse_time_report(GCC_OUTPUT, ["build/test.o"])
+    assert [r["phase"] for r in report] == ["phase setup", "phase opt and generate", "TOTAL"]
+    assert all(r["file"] == "build/test.o" for r in report)
+    assert report[0] == dict(file="build/test.o", phase="phase setup", user=0.0, system=0.0, wall=0.01, ggc=1576*1024)
+    assert report[2]["ggc"] == 2228*1024
+
+    report = parse_time_report(GCC_OUTPUT, ["build/test.o", "other_build/other.o"])
+    assert len(report) == 4
+    assert report[3] == dict(file="other_build/other.o", phase="TOTAL", user=0.5, system=0.1, wall=0.7, ggc=12*1024*1024)
+
+    assert parse_time_report("make: nothing to be done", ["build/test.o"]) == []
+
+
+def test_parse_time_trace(setup):
+    trace = os.path.join(setup, "test.json")
+    with open(trace, "w") as f:
+        json.dump(dict(traceEvents=[dict(name="Total ExecuteCompiler", ph="X", dur=2500000),
+                                    dict(name="Total Frontend", ph="X", dur=1000000),
+                                    dict(name="Source", ph="X", dur=10)]), f)
+
+    report = parse_time_trace(trace, "test.o")
+    assert [(r["phase"], r["wall"]) for r in report] == [("TOTAL", 2.5), ("Frontend", 1.0)]
+    assert parse_time_trace(os.path.join(setup, "missing.json"), "test.o") == []
+
+
+def test_collect_build_metrics(setup):
+    obj = os.path.join(setup, "test.o")
+    lib = os.path.join(setup, "test.so")
+    for name, size in [(obj, 100), (lib, 300)]:
+        with open(name, "wb") as f:
+            f.write(b"x" * size)
+
+    usage = dict(wall_time=1.0, user_time=0.5, system_time=0.25, max_rss=1024)
+    output = GCC_OUTPUT.replace("build/test.o", obj)
+    metrics = collect_build_metrics(usage, [obj, os.path.join(setup, "missing.o")], lib, output=output, time_report=True)
+
+    assert metrics.object_sizes == {obj: 100}
+    assert metrics.library_size == 300
+    assert len(metrics.time_report) == 3
+    assert metrics.as_dict() == dict(build_wall_time=1.0,
+                                     build_user_time=0.5,
+                                     build_system_time=0.25,
+                                     build_max_rss=1024,
+                                     object_size=100,
+                                     library_size=300,
+                                     compile_time=0.01,
+                                     build_cached=False,
+                                     build_batch=None)
+
+    metrics = collect_build_metrics(None, [obj], lib, output=output)
+    assert metrics.time_report == []
+    assert metrics.as_dict()["build_wall_time"] is None
+    assert metrics.as_dict()["compile_time"] is None
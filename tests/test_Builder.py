@@ -1,8 +1,9 @@
 from cfiddle import *
 from fixtures import *
-from cfiddle.Builder import Builder, ExecutableDescription, Executable, InvalidBuildParameter
+from cfiddle.Builder import Builder, ExecutableDescription, Executable, ExecutableList, InvalidBuildParameter, BuildFailure, BuildFailures
 from cfiddle.config import get_config, cfiddle_config
 from cfiddle.Toolchain import GCCToolchain
+from cfiddle.BuildMetrics import BuildMetrics
 import os
 import pytest
 
@@ -129,3 +130,70 @@ int number() {
 """, file_name="number.cpp")
     assert run(b.rebuild(), "number")[0].return_value == 5
     
+
+def test_parallel_build_order(setup):
+    with cfiddle_config(Builder_type=NopBuilder, build_jobs=4):
+        b = build(["test_src/test.cpp", "test_src/test_c.c"], arg_map(OPTIMIZE=["-O0", "-O1", "-O2", "-O3"]))
+    assert [e.build_spec.source_file for e in b] == ["test_src/test.cpp"] * 4 + ["test_src/test_c.c"] * 4
+    assert [e.get_build_parameters()["OPTIMIZE"] for e in b] == ["-O0", "-O1", "-O2", "-O3"] * 2
+
+    
+def test_parallel_build_failures(setup):
+    class FailingBuilder(NopBuilder):
+        def build(self):
+            if self.build_parameters["OPTIMIZE"] == "-O1":
+                raise BuildFailure("make", "it broke")
+            return super().build()
+        
+    with cfiddle_config(Builder_type=FailingBuilder, build_jobs=4):
+        with pytest.raises(BuildFailures) as e:
+            build("test_src/test.cpp", arg_map(OPTIMIZE=["-O0", "-O1", "-O2", "-O1"]))
+    assert len(e.value.failures) == 2
+    assert e.value.executables[0] is not None
+    assert e.value.executables[1] is None
+    assert e.value.executables[2] is not None
+
+def test_parallel_build(setup):
+    with cfiddle_config(build_jobs=4):
+        b = build("test_src/test.cpp", arg_map(OPTIMIZE=["-O0", "-O1", "-O2", "-O3"]))
+    assert [e.get_build_parameters()["OPTIMIZE"] for e in b] == ["-O0", "-O1", "-O2", "-O3"]
+    assert all(r[0].return_value == 4 for r in [run(e, "four") for e in b])
+
+
+def test_executable_list_as_df(setup):
+    executables = ExecutableList()
+    for o in ["-O0", "-O1"]:
+        e = NopBuilder(ExecutableDescription(source="test_src/test.cpp", build_parameters=dict(OPTIMIZE=o))).build()
+        e.build_metrics = BuildMetrics(wall_time=1.0, library_size=100,
+                                       time_report=[dict(file="test.o", phase="TOTAL", user=0.5, system=0.1, wall=0.75, ggc=10)])
+        executables.append(e)
+
+    df = executables.as_df()
+    assert list(df["OPTIMIZE"]) == ["-O0", "-O1"]
+    assert list(df["source_file"]) == ["test_src/test.cpp"] * 2
+    assert list(df["build_wall_time"]) == [1.0, 1.0]
+    assert list(df["compile_time"]) == [0.75, 0.75]
+    assert list(df["build_batch"]) == [None, None]
+
+    df = executables.time_report_df()
+    assert list(df["OPTIMIZE"]) == ["-O0", "-O1"]
+    assert list(df["wall"]) == [0.75, 0.75]
+
+
+def test_lazy_functions(setup):
+    import pickle
+    calls = []
+    def parse():
+        calls.append(1)
+        return dict(foo="prototype")
+
+    e = NopBuilder(ExecutableDescription(source="test_src/test.cpp", build_parameters=dict(OPTIMIZE="-O1"))).build()
+    e.functions = parse
+    assert calls == []
+    assert e.functions == dict(foo="prototype")
+    assert e.functions == dict(foo="prototype")
+    assert calls == [1]
+
+    e.functions = parse
+    assert pickle.loads(pickle.dumps(e)).functions == dict(foo="prototype")
+    assert calls == [1, 1]
@@ -4,7 +4,8 @@ import re
 import os
 import ctypes
 from cfiddle.CProtoParser import *
-from cfiddle.ProtoParser import BadParameter, UnknownType, BadParameterName, Prototype, Parameter
+from cfiddle.ProtoParser import BadParameter, UnknownType, BadParameterName, Prototype, Parameter, LazyPrototypes, TheProtoParseCache
+from fixtures import *
 
 @pytest.mark.parametrize("t,ct", [
     ("long", ctypes.c_long),
@@ -141,3 +142,43 @@ def test_split_into_tokens(CParser,string, tokens):
 @pytest.fixture
 def CParser():
     return CProtoParser()
+
+
+class CountingCProtoParser(CProtoParser):
+    parse_count = 0
+    
+    def parse_file(self, f):
+        CountingCProtoParser.parse_count += 1
+        return super().parse_file(f)
+
+
+def test_parse_cache(setup):
+    TheProtoParseCache.clear()
+    parser = CountingCProtoParser()
+    files = [os.path.join(setup, f"{n}.cpp") for n in ["a", "b"]]
+    for f in files:
+        with open(f, "w") as out:
+            out.write("extern \"C\" int foo(int a);\n")
+
+    assert parser.parse_file_cached(files[0]) == parser.parse_file_cached(files[1])
+    assert CountingCProtoParser.parse_count == 1
+
+    functions = parser.parse_file_cached(files[0])
+    functions.clear()
+    assert list(parser.parse_file_cached(files[0])) == ["foo"]
+
+    with open(files[1], "w") as out:
+        out.write("extern \"C\" int bar(int a);\n")
+    assert list(parser.parse_file_cached(files[1])) == ["bar"]
+    assert CountingCProtoParser.parse_count == 2
+
+    lazy = LazyPrototypes(parser, files)
+    assert CountingCProtoParser.parse_count == 2
+    assert sorted(lazy()) == ["bar", "foo"]
+    assert CountingCProtoParser.parse_count == 2
+
+    # The prototypes are the ones in the files when we created it.
+    lazy = LazyPrototypes(parser, files)
+    with open(files[1], "w") as out:
+        out.write("extern \"C\" int baz(int a);\n")
+    assert sorted(lazy()) == ["bar", "foo"]
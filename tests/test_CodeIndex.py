@@ -0,0 +1,104 @@
+from cfiddle.CodeIndex import *
+from cfiddle.DebugInfo import DebugInfo
+from fixtures import *
+import os
+import subprocess
+
+ASM = """	.file	"test.cpp"
+	.text
+	.globl	foo
+	.type	foo, @function
+foo:
+.LFB0:
+	.cfi_startproc
+	ret
+	.cfi_endproc
+.LFE0:
+	.globl	_Z3bari
+_Z3bari:
+	.cfi_startproc
+	ret
+	.cfi_endproc
+std::vector<int>::size() const:
+	.cfi_startproc
+	ret
+	.cfi_endproc
+"""
+
+def test_asm_label_index():
+    index = AsmLabelIndex(ASM.split("\n"), ".fnend|.cfi_endproc")
+    assert index.find("foo") == (4, 9)
+    assert index.find("_Z3bari") == (11, 15)
+    assert index.find("std::vector<int>::size() const") == (15, 19)
+    assert index.find(".LFB0") is None
+    assert index.find("baz") is None
+
+    demangler = lambda symbols: {s: "bar(int)" for s in symbols}
+    assert index.find_demangled("bar(int)", demangler) == (11, 15)
+    assert index.find_demangled("foo", demangler) is None
+
+
+class DebugInfoLibrary(DebugInfo):
+    def __init__(self, lib):
+        self.lib = lib
+
+
+def test_find_function_in_source(setup):
+    source = os.path.join(setup, "index.cpp")
+    lib = os.path.join(setup, "index.so")
+    text = """#include<cstdlib>
+extern "C"
+int foo(int a) {
+    return abs(a);
+    }
+int foo2() { return 0;
+}
+"""
+    with open(source, "w") as f:
+        f.write(text)
+    subprocess.run(["g++", "-g", "-O1", "-shared", "-fPIC", "-o", lib, source], check=True)
+
+    dwarf_index = DebugInfoLibrary(lib).dwarf_index()
+    lines = text.split("\n")
+    assert find_function_in_source(dwarf_index, source, lines, "foo", r"^\}") == (2, 5)
+    assert find_function_in_source(dwarf_index, source, lines, "foo2", r"^\}") == (5, 7)
+    assert find_function_in_source(dwarf_index, source, lines, "missing", r"^\}") is None
+    assert find_function_in_source(None, source, lines, "foo", r"^\}") is None
+    assert find_function_in_source(dwarf_index, os.path.join(setup, "other.cpp"), lines, "foo", r"^\}") is None
+
+
+def test_asm_blocks(setup):
+    source = os.path.join(setup, "blocks.cpp")
+    asm_file = os.path.join(setup, "blocks.s")
+    lib = os.path.join(setup, "blocks.so")
+    text = """extern "C"
+int sum(int *a, int n) {
+    int s = 0;
+    for (int i = 0; i < n; i++)
+        s += a[i];
+    return s;
+}
+"""
+    with open(source, "w") as f:
+        f.write(text)
+    subprocess.run(["g++", "-g", "-O2", "-S", "-o", asm_file, source], check=True)
+    subprocess.run(["g++", "-g", "-shared", "-fPIC", "-o", lib, asm_file], check=True)
+
+    with open(asm_file) as f:
+        asm_lines = f.read().split("\n")
+    dwarf_index = DebugInfoLibrary(lib).dwarf_index()
+    index = CodeIndex.build(lib, dwarf_index, source, text.split("\n"), asm_lines, r"^\}", r"\.cfi_endproc")
+
+    start, end = index.functions["sum"].address_range
+    assert index.find_function(start) == "sum"
+    assert index.find_function(end - 1) == "sum"
+    assert index.find_function(end + 1000) is None
+
+    blocks = [b for b in index.asm_blocks if start <= b[0] < end]
+    assert blocks
+    for block_start, block_end, line in blocks:
+        assert asm_lines[line].strip().startswith(".loc")
+        assert index.find_asm_line(block_start) == line
+        assert index.find_asm_line(block_end - 1) == line
+        # The .loc and the line table agree about the source line.
+        assert int(asm_lines[line].split()[2]) == index.find_address(block_start)[1]
@@ -1,7 +1,10 @@
 import tempfile
+import pickle
+import numpy as np
 from cfiddle import *
 from util import *
 from itertools import product
+from cfiddle.Runner import InvocationResult
 from fixtures import *
 
 def test_df_numeric_conversion(setup):
@@ -139,3 +142,126 @@ uint64_t time() {
     time.sleep(1)
     second = first.rerun()
     assert second[0].return_value > first[0].return_value
+
+
+def fake_result(build_parameters, function, arguments, results, run_options=None, histograms=None):
+    from types import SimpleNamespace
+    executable = SimpleNamespace(build_spec=SimpleNamespace(build_parameters=build_parameters))
+    invocation = SimpleNamespace(executable=executable, function=function, arguments=arguments, run_options=run_options or {})
+    return InvocationResult(invocation=invocation, results=results, return_value=None, histograms=histograms)
+
+
+def test_columns():
+    r = InvocationResultsList()
+    r.append(fake_result(dict(O="-O0"), "f", dict(a=1), [dict(ET=1.0, count=2), dict(ET=2.0, count=3)]))
+    r.append(fake_result(dict(O="-O1", X="y"), "g", dict(a=2, b=3), [], run_options=dict(OPTION=1)))
+    r.append(fake_result(dict(O="-O1"), "g", dict(a=2), [dict(ET=1.5, tag="t", a=10)]))
+
+    assert r.as_dicts() == [dict(O="-O0", X=None, function="f", a=1, b=None, OPTION=None, ET=1.0, count=2, tag=None),
+                            dict(O="-O0", X=None, function="f", a=1, b=None, OPTION=None, ET=2.0, count=3, tag=None),
+                            dict(O="-O1", X="y", function="g", a=2, b=3, OPTION=1, ET=None, count=None, tag=None),
+                            dict(O="-O1", X=None, function="g", a=2, b=None, OPTION=None, ET=1.5, count=None, tag="t")]
+
+    df = r.as_df()
+    assert list(df.columns) == ["O", "X", "function", "a", "b", "OPTION", "ET", "count", "tag"]
+    assert df["a"].dtype == "int64"
+    assert df["ET"].dtype == "float64"
+    assert df["count"].sum() == 5
+
+    
+def test_columns_after_modification():
+    r = InvocationResultsList()
+    for i in range(4):
+        r.append(fake_result({}, "f", dict(a=i), [dict(v=str(i))]))
+
+    assert list(r.as_df()["v"]) == [0, 1, 2, 3]
+    r.pop()
+    r.reverse()
+    r += r[:1]
+    assert list(r.as_df()["a"]) == [2, 1, 0, 2]
+    assert list(pickle.loads(pickle.dumps(r)).as_df()["a"]) == [2, 1, 0, 2]
+
+    
+def test_typed_column():
+    from cfiddle.Data import TypedColumn
+    c = TypedColumn()
+    c.extend_missing(2)
+    c.extend([1, None, 3])
+    assert c.kind == "int"
+    assert c.tolist() == [None, None, 1, None, 3]
+    a = c.as_array()
+    assert a.dtype == "float64"
+    assert list(np.isnan(a)) == [True, True, False, True, False]
+    assert list(a[[2, 4]]) == [1.0, 3.0]
+
+    c.extend([2.5])
+    assert c.kind == "object"
+    assert c.tolist() == [None, None, 1, None, 3, 2.5]
+    assert c[2] == 1 and isinstance(c[2], int)
+
+    big = TypedColumn()
+    big.extend(list(range(100)))
+    assert big.as_array().dtype == "int64"
+    assert big.as_array().sum() == sum(range(100))
+
+
+def test_as_df_keeps_results():
+    r = InvocationResultsList()
+    rows = [dict(ET=1.0, count=2, tag="a"), dict(ET=2.0, count=3, tag="b")]
+    results = [dict(d) for d in rows]
+    r.append(fake_result(dict(O="-O0"), "f", dict(a=1), results))
+    r.append(fake_result(dict(O="-O0"), "f", dict(a=2), [dict(ET=1.0, a=3)]))
+
+    df = r.as_df()
+    assert r[0].results is results
+    assert r[0].results == rows
+    assert r[1].results == [dict(ET=1.0, a=3)]
+
+    # Changing the DataFrame doesn't change the data.
+    df["count"] = 0
+    assert list(r.as_df()["count"].fillna(0)) == [2, 3, 0]
+
+    r.append(fake_result(dict(O="-O0"), "f", dict(a=3), [dict(ET=3.0, count=4)]))
+    assert list(r.as_df()["count"].fillna(0)) == [2, 3, 0, 4]
+    r.sort(key=lambda x: -x.invocation.arguments["a"])
+    assert list(r.as_df()["count"].fillna(0)) == [4, 0, 2, 3]
+
+    
+def test_large_export():
+    import time
+    r = InvocationResultsList()
+    for i in range(100000):
+        r.append(fake_result(dict(O="-O3"), "f", dict(i=i), [dict(ET=float(i), cycles=i * 2)]))
+    start = time.time()
+    df = r.as_df()
+    assert time.time() - start < 2
+    assert len(df) == 100000
+    assert df["cycles"].sum() == 2 * sum(range(100000))
+
+
+def test_summarize():
+    r = InvocationResultsList()
+    r.append(fake_result(dict(O="-O0"), "f", dict(a=1), [dict(repetition=i, tag="t", ET=float(v)) for i, v in enumerate([1, 2, 3, 4])]))
+    r.append(fake_result(dict(O="-O1"), "f", dict(a=1), [dict(repetition=i, tag="t", ET=float(v)) for i, v in enumerate([5, 5])]))
+
+    s = r.summarize()
+    assert list(s.columns) == ["O", "function", "a", "tag", "count", "ET_mean", "ET_median", "ET_std", "ET_ci_low", "ET_ci_high"]
+    assert list(s["count"]) == [4, 2]
+    assert list(s["ET_mean"]) == [2.5, 5.0]
+    assert list(s["ET_median"]) == [2.5, 5.0]
+    assert s["ET_ci_low"][0] < 2.5 < s["ET_ci_high"][0]
+    assert s["ET_ci_low"][1] == s["ET_ci_high"][1] == 5.0
+
+
+def test_histogram_df():
+    from cfiddle.Histogram import LatencyHistogram
+    h = LatencyHistogram("lat", [(10, 10, 2), (512, 513, 1)], count=3, min=10, max=512, sum=532)
+    r = InvocationResultsList()
+    r.append(fake_result(dict(O="-O0"), "f", dict(a=1), [], histograms=dict(lat=h)))
+    r.append(fake_result(dict(O="-O1"), "f", dict(a=2), []))
+
+    df = r.as_histogram_df()
+    assert list(df.columns) == ["O", "function", "a", "histogram", "low", "high", "count"]
+    assert list(df["low"]) == [10, 512]
+    assert list(df["count"]) == [2, 1]
+    assert all(df["O"] == "-O0")
@@ -75,6 +75,79 @@ namespace Tests {
 		ds.current_row().set("foo", 4);
 	}
 
+	TEST_F(DataSetTests, overwrite_test) {
+		DataSet ds;
+		ds.start_new_row();
+		for(int i = 0; i < 1000; i++) {
+			ds.set("foo", i);
+			ds.set("bar", std::string("a long string that doesn't fit in the small string buffer"));
+		}
+		ASSERT_EQ(ds.size(), 1);
+		ASSERT_EQ(ds.column_count(), 2);
+		ASSERT_EQ(ds.get(0, "foo").as<int>(), 999);
+		ASSERT_EQ(ds.get(0, "bar").as<std::string>(), "a long string that doesn't fit in the small string buffer");
+	}
+
+	TEST_F(DataSetTests, column_id_test) {
+		DataSet ds;
+		ColumnId a = ds.column_id("a");
+		ColumnId b = ds.column_id("b");
+		ASSERT_EQ(ds.column_id("a").index, a.index);
+		ASSERT_NE(a.index, b.index);
+
+		ds.reserve(100);
+		for(int i = 0; i < 100; i++) {
+			ds.start_new_row();
+			ds.set(a, i);
+			if (i % 2) {
+				ds.set(b, i * 0.5);
+			}
+		}
+		ASSERT_EQ(ds.size(), 100);
+		ASSERT_EQ(ds.get(10, "a").as<int>(), 10);
+		ASSERT_FALSE(ds.has(10, "b"));
+		ASSERT_TRUE(ds.has(11, "b"));
+		ASSERT_EQ(ds.get(11, "b").as<double>(), 5.5);
+		ASSERT_THAT(ds.get_rows()[10]->get_keys(), ElementsAre("a"));
+		ASSERT_THAT(ds.get_rows()[11]->get_keys(), ElementsAre("a", "b"));
+	}
+
+	TEST_F(DataSetTests, kind_test) {
+		DataSet ds;
+		ds.start_new_row();
+		ds.set("i", -4);
+		ds.set("u", (uint64_t)1 << 63);
+		ds.set("d", 1);
+		ds.set("s", 's');
+		ds.start_new_row();
+		ds.set("d", 1.5);
+
+		ASSERT_EQ(ds.get_kind("i"), DATUM_INT64);
+		ASSERT_EQ(ds.get_kind("u"), DATUM_INT64);
+		ASSERT_EQ(ds.get_kind("d"), DATUM_DOUBLE);
+		ASSERT_EQ(ds.get_kind("s"), DATUM_STRING);
+
+		ASSERT_EQ(ds.get(0, "i").as_int64(), -4);
+		ASSERT_EQ(ds.get(0, "u").as<uint64_t>(), (uint64_t)1 << 63);
+		ASSERT_EQ(ds.get(0, "u").to_string(), "9223372036854775808");
+		ASSERT_EQ(ds.get(0, "d").as_double(), 1.0);
+		ASSERT_EQ(ds.get(0, "s").to_string(), "s");
+		ASSERT_TRUE(ds.get(1, "i").empty());
+	}
+
+	TEST_F(DataSetTests, clear_keeps_columns_test) {
+		DataSet ds;
+		ds.start_new_row();
+		ds.set("foo", 4);
+		ColumnId foo = ds.column_id("foo");
+		ds.clear();
+		ASSERT_THAT(ds.get_keys(), ElementsAre());
+		ds.start_new_row();
+		ds.set(foo, 5);
+		ASSERT_EQ(ds.current_row().get_datum("foo").as<int>(), 5);
+		ASSERT_THAT(ds.get_keys(), ElementsAre("foo"));
+	}
+
 }
 
 
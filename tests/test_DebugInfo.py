@@ -1,5 +1,8 @@
 from cfiddle import *
+from cfiddle.DebugInfo import DebugInfo, DWARFIndexCache, TheDWARFIndexCache
 from fixtures import *
+import os
+import subprocess
 
 def print_ident(a):
     print(a)
@@ -63,3 +66,80 @@ def test_stack_frame(test_cpp):
     for variable in ["a", "b", "c"]:
         assert f"{variable}:" in test_cpp.stack_frame("simple_print") 
     assert "sum" not in test_cpp.stack_frame("simple_print") 
+
+
+class DebugInfoLibrary(DebugInfo):
+    def __init__(self, lib):
+        self.lib = lib
+
+        
+@pytest.fixture
+def debug_library(setup):
+    source = os.path.join(setup, "frame.cpp")
+    lib = os.path.join(setup, "frame.so")
+    with open(source, "w") as f:
+        f.write("""extern "C" int foo(int a) {
+    int sum = 0;
+    for(int i = 0; i < a; i++) {
+        sum += i;
+    }
+    return sum;
+}
+extern "C" void bar() {}
+""")
+    subprocess.run(["g++", "-g", "-O0", "-shared", "-fPIC", "-o", lib, source], check=True)
+    return DebugInfoLibrary(lib)
+
+
+def test_dwarf_index(debug_library):
+    index = debug_library.dwarf_index()
+    assert index.has_dwarf
+    foo = index.functions["foo"]
+    assert [v for v, _ in foo.variables] == ["a", "sum", "i"]
+    assert foo.low_pc < foo.high_pc
+    assert foo.decl_line == 1
+    assert foo.decl_file.endswith("frame.cpp")
+    assert foo.line_range[1:] == (1, 7)
+    assert "sum:" in debug_library.stack_frame("foo")
+    assert "sum" not in debug_library.stack_frame("bar")
+    assert "foo" in debug_library.debug_info(show="foo")
+    assert "bar" not in debug_library.debug_info(show="foo")
+
+
+def test_dwarf_index_cache(debug_library):
+    index = debug_library.dwarf_index()
+    assert debug_library.dwarf_index() is index
+    assert os.path.exists(debug_library.lib + DWARFIndexCache.SUFFIX)
+
+    TheDWARFIndexCache.clear()
+    loaded = debug_library.dwarf_index()
+    assert loaded is not index
+    assert loaded.functions.keys() == index.functions.keys()
+    assert loaded.debug_info == index.debug_info
+
+    os.utime(debug_library.lib, ns=(0, 0))
+    assert debug_library.dwarf_index().stamp != index.stamp
+
+
+def test_dwarf_index_go(setup):
+    skip_if_go_not_available()
+    source = os.path.join(setup, "loop.go")
+    lib = os.path.join(setup, "loop.so")
+    with open(source, "w") as f:
+        f.write("""package main
+import "C"
+//export loop
+func loop(n int) int {
+    s := 0
+    for i := 0; i < n; i++ {
+        s += i
+    }
+    return s
+}
+func main() {}
+""")
+    subprocess.run(["go", "build", "-buildmode=c-shared", "-o", lib, source], check=True, cwd=setup)
+    library = DebugInfoLibrary(lib)
+    # pyelftools can't parse some of Go's variable locations.
+    assert "main.loop" in library.dwarf_index().functions
+    assert "function main.loop" in library.stack_frame("main.loop")
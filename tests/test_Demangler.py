@@ -0,0 +1,30 @@
+from cfiddle.Demangler import *
+from cfiddle.Demangler import _demangle_with_tool
+from fixtures import *
+import pytest
+
+def test_demangle():
+    d = Demangler()
+    assert d.demangle("_Z11demangle_mev") == "demangle_me()"
+    assert d.demangle("simple_print") == "simple_print"
+    assert d.demangle_all(["_Z3bari", "_Z3foov.cold"]) == {"_Z3bari": "bar(int)",
+                                                          "_Z3foov.cold": "foo() [clone .cold]"}
+
+def test_demangle_text():
+    d = Demangler()
+    asm = "_Z3bari:\n\tcall\t_ZNSolsEi@PLT\n\tcall\tfoo_Z3bari\n\tjmp\t.L_Z3bari\n"
+    demangled = d.demangle_text(asm)
+    assert demangled == "bar(int):\n\tcall\tstd::basic_ostream<char, std::char_traits<char> >::operator<<(int)@PLT\n\tcall\tfoo_Z3bari\n\tjmp\t.L_Z3bari\n"
+    assert d.demangle_text(asm) is demangled
+
+def test_demangle_text_cache_size():
+    d = Demangler(max_texts=2)
+    for i in range(4):
+        d.demangle_text(f"_Z3bari {i}")
+    assert len(d._texts) == 2
+
+def test_demangle_with_tool():
+    assert _demangle_with_tool(["_Z3bari", "_Z3bazv"], "c++filt", chunk_size=1) == {"_Z3bari": "bar(int)",
+                                                                                  "_Z3bazv": "baz()"}
+    with pytest.raises(DemanglingFailure):
+        _demangle_with_tool(["_Z3bari"], "not-a-c++filt")
@@ -0,0 +1,77 @@
+#include <iostream>
+#include "gtest/gtest.h"
+#include "gmock/gmock.h"
+#include"Histogram.hpp"
+
+namespace Tests {
+
+	class HistogramTests :  public ::testing::Test {
+	};
+
+	TEST_F(HistogramTests, bucket_test) {
+		// Small values are exact.
+		for(uint64_t v = 0; v < Histogram::SUB_BUCKETS; v++) {
+			ASSERT_EQ(Histogram::index_of(v), v);
+			ASSERT_EQ(Histogram::lowest_value(v), v);
+			ASSERT_EQ(Histogram::highest_value(v), v);
+		}
+
+		// Buckets are contiguous, and every value is in its bucket.
+		for(unsigned int i = 1; i < Histogram::BUCKETS; i++) {
+			ASSERT_EQ(Histogram::lowest_value(i), Histogram::highest_value(i - 1) + 1);
+			ASSERT_EQ(Histogram::index_of(Histogram::lowest_value(i)), i);
+			ASSERT_EQ(Histogram::index_of(Histogram::highest_value(i)), i);
+		}
+		ASSERT_EQ(Histogram::highest_value(Histogram::BUCKETS - 1), UINT64_MAX);
+
+		// Buckets are narrow.
+		for(uint64_t v = 1000; v < 1000000000000; v = v * 3 + 1) {
+			unsigned int i = Histogram::index_of(v);
+			ASSERT_LE(Histogram::lowest_value(i), v);
+			ASSERT_GE(Histogram::highest_value(i), v);
+			ASSERT_LT(Histogram::highest_value(i) - Histogram::lowest_value(i), v / 127);
+		}
+	}
+
+	TEST_F(HistogramTests, record_test) {
+		Histogram h("foo");
+		ASSERT_EQ(h.get_count(), 0);
+		ASSERT_EQ(h.used_buckets(), 0);
+		for(int i = 0; i < 1000; i++) {
+			h.record(1000);
+		}
+		h.record(5);
+		ASSERT_EQ(h.get_count(), 1001);
+		ASSERT_EQ(h.get_min(), 5);
+		ASSERT_EQ(h.get_max(), 1000);
+		ASSERT_EQ(h.get_sum(), 1000005.0);
+		ASSERT_EQ(h.used_buckets(), 2);
+		ASSERT_EQ(h.get_bucket_count(Histogram::index_of(1000)), 1000);
+		h.clear();
+		ASSERT_EQ(h.get_count(), 0);
+		ASSERT_EQ(h.used_buckets(), 0);
+	}
+
+	TEST_F(HistogramTests, histogram_set_test) {
+		HistogramSet hs;
+		char name[] = "a";
+		Histogram * a = hs.get(name);
+		ASSERT_EQ(hs.get("a"), a);
+		name[0] = 'b';
+		Histogram * b = hs.get(name);
+		ASSERT_NE(a, b);
+		ASSERT_EQ(b->get_name(), "b");
+		ASSERT_EQ(hs.size(), 2);
+		a->record(1);
+		hs.clear();
+		ASSERT_EQ(a->get_count(), 0);
+		ASSERT_EQ(hs.get("a"), a);
+	}
+
+}
+
+
+int main(int argc, char **argv) {
+	::testing::InitGoogleTest(&argc, argv);
+	return RUN_ALL_TESTS();
+}
@@ -0,0 +1,57 @@
+import pytest
+
+from cfiddle.Histogram import LatencyHistogram
+
+
+def histogram(values, name="lat"):
+    # One bucket per value, like libcfiddle does for small values.
+    counts = {}
+    for v in values:
+        counts[v] = counts.get(v, 0) + 1
+    return LatencyHistogram(name, [(v, v, c) for v, c in sorted(counts.items())],
+                            count=len(values), min=min(values), max=max(values), sum=sum(values))
+
+
+def test_percentile():
+    h = histogram(list(range(1, 101)))
+    assert h.percentile(0) == 1
+    assert h.percentile(50) == 50
+    assert h.percentile(99) == 99
+    assert h.percentile(99.9) == 100
+    assert h.percentile(100) == 100
+    assert h.mean == 50.5
+
+    with pytest.raises(ValueError):
+        h.percentile(101)
+
+
+def test_percentile_clamps_to_max():
+    h = LatencyHistogram("lat", [(1000, 1007, 3)], count=3, min=1001, max=1003, sum=3006)
+    assert h.percentile(50) == 1003
+    assert h.percentile(100) == 1003
+
+
+def test_summary():
+    h = histogram([1, 2, 3, 4])
+    assert h.summary([50, 99.9]) == {"lat_count": 4,
+                                     "lat_min": 1,
+                                     "lat_mean": 2.5,
+                                     "lat_max": 4,
+                                     "lat_p50": 2,
+                                     "lat_p99.9": 4}
+
+
+def test_merge():
+    a = histogram([1, 2, 2])
+    b = histogram([2, 5])
+    m = a.merge(b)
+    assert m.buckets == [(1, 1, 1), (2, 2, 3), (5, 5, 1)]
+    assert m.count == 5
+    assert m.min == 1
+    assert m.max == 5
+    assert m.sum == 12
+    assert list(m.as_df()["count"]) == [1, 3, 1]
+
+    empty = LatencyHistogram("lat", [], count=0, min=0, max=0, sum=0)
+    assert empty.merge(a) is a
+    assert empty.percentile(50) is None
@@ -1,7 +1,8 @@
 from cfiddle import *
 from util import *
 from fixtures import *
-from cfiddle.Runner import RunnerException
+from cfiddle.Runner import RunnerException, InvalidInvocation
+from cfiddle.Invoker import MIN_STABLE_REPETITIONS, relative_standard_error, FastMeasurementFailure, NoMeasurements
 
 def test_hello_world(test_cpp):
     
@@ -48,3 +49,165 @@ extern "C" int four(int a, funcptr_t f) {
                                   f=["foo", "bar"]
                                   ))[0] != 0
     
+    from cfiddle.LibraryCache import TheLibraryCache
+    result = Invoker(InvocationDescription(b[0], function="four", arguments=dict(a=4, f="foo"))).run()
+    assert result.return_value == 1
+    assert not hasattr(TheLibraryCache.load_symbol(b[0].lib, "foo"), "value") # we didn't tag the shared symbol
+
+
+
+def test_typed_results(setup):
+    b = build(code(r"""
+#include"cfiddle.hpp"
+#include"DataSet.hpp"
+
+extern "C" void go(int k) {
+    start_measurement("first");
+    get_dataset()->set("count", k);
+    end_measurement();
+    start_measurement();
+    get_dataset()->set("ratio", k / 2.0);
+    end_measurement();
+}
+"""))
+    results = Invoker(InvocationDescription(b[0], function="go", arguments=dict(k=3))).run().results
+    assert len(results) == 2
+    assert results[0]["tag"] == "first"
+    assert results[1]["tag"] is None
+    assert results[0]["count"] == 3 and isinstance(results[0]["count"], int)
+    assert results[1]["count"] is None
+    assert results[1]["ratio"] == 1.5
+    assert isinstance(results[0]["ET"], float)
+
+
+def test_fast_measurement(setup):
+    b = build(code(r"""
+#include"cfiddle.hpp"
+
+extern "C" void go(int k) {
+    volatile int s = 0;
+    for (int i = 0; i < k; i++) {
+        start_fast_measurement("loop");
+        s += i;
+        end_fast_measurement();
+    }
+}
+"""))
+    results = Invoker(InvocationDescription(b[0], function="go", arguments=dict(k=1000))).run().results
+    assert len(results) == 1000
+    assert all(r["tag"] == "loop" for r in results)
+    assert all(isinstance(r["ET"], float) and r["ET"] < 0.01 for r in results)
+
+
+def test_fast_measurement_failure(setup):
+    b = build(code(r"""
+#include"cfiddle.hpp"
+
+extern "C" void go() {
+    set_fast_measurement_capacity(-1);
+    start_fast_measurement();
+    end_fast_measurement();
+}
+"""))
+    with pytest.raises(FastMeasurementFailure):
+        Invoker(InvocationDescription(b[0], function="go", arguments={})).run()
+
+
+def test_histogram(setup):
+    b = build(code(r"""
+#include"cfiddle.hpp"
+
+extern "C" void go(int k) {
+    for (int i = 1; i <= k; i++) {
+        cfiddle_hist_record("lat", i);
+    }
+}
+"""))
+    result = Invoker(InvocationDescription(b[0], function="go", arguments=dict(k=100000))).run()
+    assert len(result.results) == 1
+    r = result.results[0]
+    assert r["lat_count"] == 100000
+    assert r["lat_min"] == 1
+    assert r["lat_max"] == 100000
+    assert r["lat_mean"] == 50000.5
+    assert r["lat_p50"] == pytest.approx(50000, rel=0.01)
+    assert r["lat_p99.9"] == pytest.approx(99900, rel=0.01)
+    assert sum(c for _, _, c in result.histograms["lat"].buckets) == 100000
+
+    repeated = Invoker(InvocationDescription(b[0], function="go", arguments=dict(k=1000), repetitions=3)).run()
+    assert [r["lat_count"] for r in repeated.results] == [1000, 1000, 1000]
+    assert repeated.histograms["lat"].count == 3000
+
+
+def test_profile(setup):
+    b = build(code(r"""
+extern "C" long busy(long n) {
+    long s = 0;
+    for (long i = 0; i < n; i++) {
+        s = s * 7 + i;
+    }
+    return s;
+}
+"""), build_parameters=arg_map(OPTIMIZE="-O1 -fno-omit-frame-pointer"))
+    result = Invoker(InvocationDescription(b[0], function="busy", arguments=dict(n=200000000), profile=True)).run()
+    profile = result.profile
+    assert profile.sample_count > 0
+    assert profile.functions()["function"][0] == "busy"
+    assert "%" in b[0].asm(show="busy", profile=profile)
+
+    assert Invoker(InvocationDescription(b[0], function="busy", arguments=dict(n=1))).run().profile is None
+
+    # The buffer is emptied between runs, so a small one is enough if it can hold one run's samples.
+    with cfiddle_config(profile_buffer_pages=1):
+        result = Invoker(InvocationDescription(b[0], function="busy", arguments=dict(n=20000000), repetitions=20, profile=True)).run()
+    assert result.profile.lost == 0
+    assert result.profile.sample_count > 4096 // 32
+
+    with cfiddle_config(profile_buffer_pages=1):
+        with pytest.warns(UserWarning, match="lost"):
+            result = Invoker(InvocationDescription(b[0], function="busy", arguments=dict(n=400000000), profile=True)).run()
+    assert result.profile.lost > 0
+
+
+@pytest.fixture
+def measured(setup):
+    return build(code(r"""
+#include"cfiddle.hpp"
+extern "C" int go(int a) {
+    start_measurement();
+    end_measurement();
+    return a;
+}
+"""))[0]
+
+
+def test_repetitions(measured):
+    invocation = InvocationDescription(measured, function="go", arguments=dict(a=1), repetitions=5, warmup=2)
+    results = Invoker(invocation).run().results
+    assert [r["repetition"] for r in results] == list(range(5))
+
+
+def test_until_stable(measured):
+    invocation = InvocationDescription(measured, function="go", arguments=dict(a=1), repetitions=50, until_stable=1e9)
+    results = Invoker(invocation).run().results
+    assert len(results) == MIN_STABLE_REPETITIONS
+
+
+def test_until_stable_without_measurements(test_cpp):
+    invocation = InvocationDescription(test_cpp, function="four", arguments={}, repetitions=50, until_stable=0.1)
+    with pytest.raises(NoMeasurements):
+        Invoker(invocation).run()
+
+    invocation = InvocationDescription(test_cpp, function="four", arguments={}, repetitions=5)
+    assert Invoker(invocation).run().return_value == 4
+
+
+@pytest.mark.parametrize("bad", [dict(repetitions=0), dict(warmup=-1), dict(until_stable=0)])
+def test_invalid_repetitions(test_cpp, bad):
+    with pytest.raises(InvalidInvocation):
+        InvocationDescription(test_cpp, function="sum", arguments=dict(a=1, b=2), **bad)
+
+
+def test_relative_standard_error():
+    assert relative_standard_error([1.0, 1.0, 1.0]) == 0.0
+    assert relative_standard_error([1.0, 2.0, 3.0]) == pytest.approx(1 / 3 ** 0.5 / 2)
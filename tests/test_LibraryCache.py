@@ -0,0 +1,54 @@
+from cfiddle.LibraryCache import LibraryCache
+from fixtures import *
+import os
+import subprocess
+
+
+def build_library(directory, name, body):
+    source = os.path.join(directory, f"{name}.c")
+    lib = os.path.join(directory, f"{name}.so")
+    with open(source, "w") as f:
+        f.write(body)
+    subprocess.run(["gcc", "-shared", "-fPIC", "-o", lib, source], check=True)
+    return lib
+
+
+@pytest.fixture
+def library(setup):
+    return build_library(setup, "lib_a", "int answer() { return 42; }")
+
+
+def test_load_library(library):
+    cache = LibraryCache()
+    assert cache.load_library(library) is cache.load_library(library)
+
+
+def test_load_symbol(library):
+    cache = LibraryCache()
+    f = cache.load_symbol(library, "answer")
+    assert f() == 42
+    assert cache.load_symbol(library, "answer") is f
+    with pytest.raises(AttributeError):
+        cache.load_symbol(library, "missing")
+
+
+def test_invalidate(setup, library):
+    cache = LibraryCache()
+    other = build_library(setup, "lib_b", "int other() { return 1; }")
+    f = cache.load_symbol(library, "answer")
+    g = cache.load_symbol(other, "other")
+
+    cache.invalidate(library)
+    assert cache.load_symbol(library, "answer") is not f
+    assert cache.load_symbol(other, "other") is g
+
+    cache.invalidate(setup)
+    assert cache.load_symbol(other, "other") is not g
+
+
+def test_changed_library(setup, library):
+    cache = LibraryCache()
+    first = cache.load_library(library)
+    os.unlink(library)
+    build_library(setup, "lib_a", "int answer() { return 43; }")
+    assert cache.load_library(library) is not first
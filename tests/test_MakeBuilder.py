@@ -1,4 +1,5 @@
-from cfiddle.MakeBuilder import MakeBuilder
+from cfiddle.MakeBuilder import MakeBuilder, build_in_batch, _batch_makefile, _split_into_batches
+from cfiddle.util import invoke_process
 from cfiddle.Builder import ExecutableDescription, Executable
 import os
 import pytest
@@ -47,3 +48,143 @@ def test_more_src(setup):
     
                           
     
+
+def test_build_cache_hit(setup):
+    source = code(r"""extern "C" int nop() { return 4; }""")
+    first = MakeBuilder(ExecutableDescription(source, build_parameters={})).build()
+
+    class NoMakeBuilder(MakeBuilder):
+        def _invoke_make(self, cmd):
+            assert False, "The build cache should have made this unnecessary."
+
+    second = NoMakeBuilder(ExecutableDescription(source, build_parameters={})).build()
+    assert second.lib == first.lib
+    assert second.functions.keys() == first.functions.keys()
+
+def test_build_cache_miss(setup):
+    header = os.path.join(setup, "value.h")
+    with open(header, "w") as f:
+        f.write("#define VALUE 4\n")
+    source = code(fr"""#include"{header}"
+extern "C" int nop() {{ return VALUE; }}""")
+    first = MakeBuilder(ExecutableDescription(source, build_parameters={})).build()
+    assert ctypes.CDLL(first.lib).nop() == 4
+
+    with open(header, "w") as f:
+        f.write("#define VALUE 5\n")
+    second = MakeBuilder(ExecutableDescription(source, build_parameters={})).build()
+    assert second.lib != first.lib
+    assert ctypes.CDLL(second.lib).nop() == 5
+
+    third = MakeBuilder(ExecutableDescription(source, build_parameters={}), build_cache=False).build()
+    assert third.lib != second.lib
+
+
+def test_batch_makefile(setup):
+    builders = [MakeBuilder(ExecutableDescription("test_src/test.cpp", dict(OPTIMIZE=o, MORE_CFLAGS="-DX='a#b'"))) for o in ["-O0", "-O3"]]
+    for b in builders:
+        b._prepare_build()
+
+    makefile = os.path.join(setup, "batch.make")
+    with open(makefile, "w") as f:
+        f.write(_batch_makefile(builders))
+
+    objects = [os.path.join(b.build_directory, "test.o") for b in builders]
+    success, output = invoke_process(["make", "-R", "-j2", "-f", makefile] + objects)
+    assert success
+    assert all(os.path.exists(o) for o in objects)
+    for o, flag in zip(objects, ["-O0", "-O3"]):
+        [command] = [l for l in output.split("\n") if l.endswith(o)]
+        assert flag in command.split()
+        assert "-DX='a#b'" in command
+
+        
+def test_split_into_batches(setup):
+    builders = [MakeBuilder(ExecutableDescription(s, p)) for s, p in [("test_src/test.cpp", dict(OPTIMIZE="-O0")),
+                                                                       ("test_src/test.cpp", dict(OPTIMIZE="-O1")),
+                                                                       ("test_src/test.cpp", dict(OPTIMIZE="-O0")),
+                                                                       ("test_src/test_c.c", dict(OPTIMIZE="-O0"))]]
+    assert _split_into_batches(builders, [0, 1, 2, 3]) == [[0, 1, 3], [2]]
+
+    
+def test_build_in_batch(setup):
+    builders = [MakeBuilder(ExecutableDescription("test_src/test.cpp", dict(OPTIMIZE=o)), build_cache=False) for o in ["-O0", "-O1", "-O3"]]
+    steps = []
+    def progress_bar(l, **kwargs):
+        steps.extend(l)
+        return l
+    executables = build_in_batch(builders, jobs=2, progress_bar=progress_bar)
+    assert [e.get_build_parameters()["OPTIMIZE"] for e in executables] == ["-O0", "-O1", "-O3"]
+    assert all(os.path.exists(e.lib) for e in executables)
+    assert steps == [[0, 1, 2]]
+    assert all(e.get_build_metrics().library_size > 0 for e in executables)
+
+    # The make usage is the whole batch's, so it's labelled with the batch.
+    df = executables.as_df()
+    assert df["build_batch"].nunique() == 1 and df["build_batch"][0] is not None
+    assert df["build_wall_time"].nunique() == 1 and df["build_wall_time"][0] > 0
+
+    separate = MakeBuilder(ExecutableDescription("test_src/test.cpp", dict(OPTIMIZE="-O2")), build_cache=False).build()
+    assert separate.get_build_metrics().batch is None
+
+
+def test_precompiled_headers(setup):
+    builders = [MakeBuilder(ExecutableDescription("test_src/test.cpp", dict(OPTIMIZE=o)), precompiled_headers=True) for o in ["-O0", "-O0", "-O3"]]
+    for b in builders:
+        b._prepare_build()
+
+    pch_directories = [dict(b._make_variables())["PCH_DIR"] for b in builders]
+    assert pch_directories[0] == pch_directories[1]
+    assert pch_directories[0] != pch_directories[2]
+
+    c_builder = MakeBuilder(ExecutableDescription("test_src/test_c.c", dict(OPTIMIZE="-O0")), precompiled_headers=True)
+    c_builder._prepare_build()
+    assert "PCH_DIR" not in dict(c_builder._make_variables())
+
+    b = builders[0]
+    obj = os.path.join(b.build_directory, "test.o")
+    success, output = invoke_process(b._base_make_cmd() + [obj])
+    assert success, output
+    assert os.path.exists(os.path.join(pch_directories[0], "cfiddle_pch.hpp.gch"))
+    [command] = [l for l in output.split("\n") if l.endswith(obj)]
+    assert "-include cfiddle_pch.hpp" in command
+    assert os.path.exists(os.path.join(pch_directories[0], "cfiddle_pch.hpp.gch.d"))
+    assert [f for f in os.listdir(pch_directories[0]) if not f.endswith((".gch", ".gch.d"))] == []
+
+    # Files that don't include cfiddle.hpp don't get it.
+    source = os.path.join(setup, "plain.cpp")
+    with open(source, "w") as f:
+        f.write("int index(int i) { return i; }\n")
+    plain = MakeBuilder(ExecutableDescription(source, dict(OPTIMIZE="-O0")), precompiled_headers=True)
+    plain._prepare_build()
+    obj = os.path.join(plain.build_directory, "plain.o")
+    success, output = invoke_process(plain._base_make_cmd() + [obj])
+    assert success, output
+    [command] = [l for l in output.split("\n") if l.endswith(obj)]
+    assert "-include" not in command
+
+    makefile = os.path.join(setup, "batch.make")
+    with open(makefile, "w") as f:
+        f.write(_batch_makefile(builders[1:]))
+
+    objects = [os.path.join(b.build_directory, "test.o") for b in builders[1:]]
+    success, output = invoke_process(["make", "-R", "-j2", "-f", makefile] + objects)
+    assert success, output
+    assert os.path.exists(os.path.join(pch_directories[2], "cfiddle_pch.hpp.gch"))
+    [command] = [l for l in output.split("\n") if "-x c++-header" in l]
+    assert "-O3" in command.split()
+
+
+def test_build_metrics(setup):
+    executable = MakeBuilder(ExecutableDescription("test_src/test.cpp", dict(OPTIMIZE="-O1")), build_cache=True, time_report=True).build()
+    metrics = executable.get_build_metrics()
+    assert metrics.wall_time > 0
+    assert metrics.max_rss > 0
+    assert metrics.library_size == os.path.getsize(executable.lib)
+    assert list(metrics.object_sizes) == [os.path.join(executable.build_dir, "test.o")]
+    assert "TOTAL" in [r["phase"] for r in metrics.time_report]
+    assert not metrics.cached
+
+    cached = MakeBuilder(ExecutableDescription("test_src/test.cpp", dict(OPTIMIZE="-O1")), build_cache=True, time_report=True).build()
+    assert cached.get_build_metrics().cached
+    assert cached.get_build_metrics().wall_time == metrics.wall_time
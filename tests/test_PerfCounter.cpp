@@ -65,6 +65,43 @@ namespace Tests {
 		ASSERT_EQ(results[1].value, 0);
 	}
 
+	TEST_F(PerfCountTests, test_many_counters) {
+		PerfCounter counter;
+		SKIP_FOR_NO_PERFCOUNT_PERMS;
+		// More than most PMUs can count at once, so we'll need several groups.
+		const char * events[] = {"PERF_COUNT_HW_CPU_CYCLES",
+					 "PERF_COUNT_HW_INSTRUCTIONS",
+					 "PERF_COUNT_HW_BRANCH_INSTRUCTIONS",
+					 "PERF_COUNT_HW_BRANCH_MISSES",
+					 "PERF_COUNT_HW_CACHE_REFERENCES",
+					 "PERF_COUNT_HW_CACHE_MISSES",
+					 "PERF_COUNT_HW_CACHE_L1D:READ:ACCESS",
+					 "PERF_COUNT_HW_CACHE_L1D:READ:MISS",
+					 "PERF_COUNT_HW_CACHE_DTLB:READ:ACCESS",
+					 "PERF_COUNT_HW_CACHE_DTLB:READ:MISS",
+					 "PERF_COUNT_HW_CPU_CYCLES",
+					 "PERF_COUNT_HW_INSTRUCTIONS"};
+		for(auto e: events) {
+			counter.add_counter(e);
+		}
+		ASSERT_EQ(counter.check_valid(), true);
+		ASSERT_GE(counter.get_group_count(), 1);
+		counter.start();
+ 		volatile int i;
+ 		for(i = 0; i < 10000000; i++) {
+ 		}
+		counter.stop();
+		ASSERT_EQ(counter.check_valid(), true);
+		auto results = counter.get_counters();
+		ASSERT_EQ(results.size(), 12);
+		for(auto & v: results) {
+			std::cout << v.name << " (group " << v.group << ") = " << v.value << "\n";
+		}
+		// Scaled estimates for the same event in different groups should be close.
+		ASSERT_GT(results[1].value, 0);
+		ASSERT_NEAR((double)results[11].value/results[1].value, 1.0, 0.2);
+	}
+
 	TEST_F(PerfCountTests, test_clear) {
 		PerfCounter counter;
 		counter.add_counter("CYCLES");
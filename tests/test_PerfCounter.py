@@ -100,6 +100,15 @@ def test_default_perf_count(mem_loop):
     assert "CYCLES" not in results.as_dicts()[0]
     assert "INSTRUCTIONS" not in results.as_dicts()[0]
 
+def test_perf_count_many(mem_loop):
+    skip_if_no_perf_counters()
+    counters = ["CYCLES", "INSTRUCTIONS", "BRANCHES", "BRANCH-MISSES", "CACHE-REFERENCES", "CACHE-MISSES",
+                "L1-DCACHE-LOADS", "L1-DCACHE-LOAD-MISSES", "PERF_COUNT_SW_CPU_CLOCK"]
+    results = run(mem_loop, "go", arg_map(count=[10000000]), perf_counters=counters)
+    assert len(results) == 1
+    for c in counters:
+        assert c in results.as_dicts()[0]
+
 def test_perf_counter_multiple_sets(mem_loop):
     skip_if_no_perf_counters()
     results = run(mem_loop, "go", arg_map(count=[10000]), perf_counters=[["CYCLES"],["INSTRUCTIONS"]])
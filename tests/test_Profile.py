@@ -0,0 +1,82 @@
+from cfiddle.Profile import *
+from cfiddle.CodeIndex import CodeIndex, FunctionLocation
+import pytest
+
+
+LIB = "/nonexistent/lib.so"
+OTHER = "/nonexistent/libc.so"
+
+
+class FakeExecutable:
+    lib = LIB
+
+    def code_index(self):
+        functions = dict(main=FunctionLocation("main", (0x100, 0x200), None, None),
+                         helper=FunctionLocation("_Z6helperv", (0x200, 0x300), None, None))
+        return CodeIndex(functions, [(0x100, "a.cpp", 10), (0x180, "a.cpp", 12), (0x200, "a.cpp", 20)])
+
+
+def profile():
+    # Return addresses are one past the call.
+    stacks = [[(LIB, 0x210), (LIB, 0x121)],
+              [(LIB, 0x210), (LIB, 0x121)],
+              [(LIB, 0x190)],
+              [(None, 0x7fff0000), (LIB, 0x121)],
+              [(LIB, 0x101), (None, 0x7fff0000)]]
+    return build_profile(stacks, 3, FakeExecutable())
+
+
+def test_build_profile():
+    p = profile()
+    assert p.sample_count == 5
+    assert p.lost == 3
+    assert p.samples[0] == ((LIB, 0x210), (LIB, 0x120))
+    assert p.samples[4] == ((LIB, 0x101),)
+    assert p.locations[(LIB, 0x210)] == Location("_Z6helperv", "a.cpp", 20)
+    assert p.locations[(LIB, 0x120)] == Location("main", "a.cpp", 10)
+    assert p.locations[(None, 0x7fff0000)] == Location(None, None, None)
+
+
+def test_functions():
+    df = profile().functions(demangle=False)
+    assert list(df["function"]) == ["main", "_Z6helperv", "0x7fff0000"]
+    assert list(df["self"]) == [2, 2, 1]
+    assert list(df["total"]) == [5, 2, 1]
+    assert list(df["total_percent"]) == [100.0, 40.0, 20.0]
+
+
+def test_lines():
+    df = profile().lines()
+    assert list(zip(df["line"], df["samples"])) == [(20, 2), (12, 1), (10, 1)]
+    assert df["percent"].sum() == 80.0
+
+
+def test_instructions():
+    df = profile().instructions(demangle=False)
+    assert list(df["address"])[0] == 0x210
+    assert list(df["samples"])[0] == 2
+    assert list(df["function"])[0] == "_Z6helperv"
+
+
+def test_address_counts():
+    p = profile()
+    assert p.address_counts(LIB) == {0x210: 2, 0x190: 1, 0x101: 1}
+    assert p.address_counts(OTHER) == {}
+
+
+def test_empty_profile():
+    p = build_profile([], 0, FakeExecutable())
+    assert p.sample_count == 0
+    assert len(p.functions()) == 0
+    assert len(p.lines()) == 0
+
+
+def test_unreadable_code_index():
+    class BrokenExecutable(FakeExecutable):
+        def code_index(self):
+            raise ValueError("Attribute does not have location information")
+
+    p = build_profile([[(LIB, 0x210), (LIB, 0x121)]], 0, BrokenExecutable())
+    assert p.sample_count == 1
+    assert p.locations[(LIB, 0x210)] == Location(None, None, None)
+    assert list(p.functions()["function"]) == ["0x210", "0x120"]
@@ -1,11 +1,12 @@
 from cfiddle import *
 from util import *
-from cfiddle.Runner import Runner, DirectRunner, BashDelegate, SubprocessDelegate, InvocationDescription, IncorrectArgumentType, InvalidInvocation, RunOptionInterpreter, InvalidRunOption
+from cfiddle.Runner import Runner, DirectRunner, RunnerException, parse_cpu_list, BashDelegate, SubprocessDelegate, WorkerDelegate, TheRunnerWorkerPool, RunnerDelegateException, InvocationDescription, IncorrectArgumentType, InvalidInvocation, RunOptionInterpreter, InvalidRunOption, write_record, read_records
 from fixtures import *
 import ctypes
 import pytest
 import inspect
 import os
+import signal
 
 from cfiddle.ProtoParser import Parameter, Prototype
 
@@ -43,6 +44,7 @@ def test_return_values(test_cpp):
 
 
 @pytest.mark.parametrize("ExternalCommandRunner", [BashDelegate,
+                                                   WorkerDelegate,
                                                    SubprocessDelegate])
 def test_run_delegates(test_cpp, ExternalCommandRunner):
     from test_full_flow import test_run_combo
@@ -157,3 +159,217 @@ def test_run_option_manager(setup):
         with pytest.raises(MyException):
             sanity_test()
     
+
+
+class CrashingRunner(Runner):
+    def _delegated_iter(self):
+        os.kill(os.getpid(), signal.SIGSEGV)
+
+        
+def test_worker_delegate(setup):
+    with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        assert len(Runner([]).run()) == 0
+        worker = TheRunnerWorkerPool.acquire()
+        TheRunnerWorkerPool.release(worker)
+        assert len(Runner([]).run()) == 0
+        assert TheRunnerWorkerPool.acquire() is worker # it was reused
+        TheRunnerWorkerPool.release(worker)
+
+        
+def test_worker_delegate_crash(setup):
+    with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        with pytest.raises(RunnerDelegateException):
+            CrashingRunner([]).run()
+        assert len(Runner([]).run()) == 0
+
+        
+def test_worker_delegate_run(test_cpp):
+    with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        assert run(test_cpp, "four")[0].return_value == 4
+        assert run(test_cpp, "four")[0].return_value == 4
+
+
+class CPUReportingInvoker:
+    def __init__(self, invocation, result_factory):
+        self._invocation = invocation
+        self._result_factory = result_factory
+
+    def run(self):
+        return self._result_factory(invocation=self._invocation,
+                                    results=[dict(cpus=sorted(os.sched_getaffinity(0)))],
+                                    return_value=os.getpid())
+
+    
+def test_parse_cpu_list():
+    assert parse_cpu_list("0-3,8, 10-11") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpu_list("") == []
+
+
+def fake_invocation(function, lib="lib.so", arguments=None, repetitions=None):
+    from types import SimpleNamespace
+    return SimpleNamespace(executable=SimpleNamespace(lib=lib, build_spec=SimpleNamespace(source_file="test_src/test.cpp", build_parameters={})),
+                           function=function,
+                           arguments=arguments or {},
+                           run_options={},
+                           perf_counters=[],
+                           repetitions=repetitions,
+                           warmup=0,
+                           until_stable=None,
+                           profile=False)
+
+
+def test_scheduled_run(setup):
+    cpus = sorted(os.sched_getaffinity(0))[:2]
+    invocations = [fake_invocation(f"f{i}") for i in range(10)]
+    with cfiddle_config(run_cpus=cpus):
+        results = DirectRunner(invocations, invoker=CPUReportingInvoker).run()
+    assert [r.invocation.function for r in results] == [i.function for i in invocations]
+    assert all(r.invocation is i for r, i in zip(results, invocations))
+    assert all(len(r.results[0]["cpus"]) == 1 and r.results[0]["cpus"][0] in cpus for r in results)
+    assert os.getpid() not in [r.return_value for r in results]
+
+    with cfiddle_config(run_cpus=[max(os.sched_getaffinity(0)) + 1]):
+        with pytest.raises(RunnerException):
+            DirectRunner(list(range(10)), invoker=CPUReportingInvoker).run()
+
+
+class CrashingInvoker(CPUReportingInvoker):
+    def run(self):
+        if self._invocation.function == "crash":
+            os.kill(os.getpid(), signal.SIGSEGV)
+        return super().run()
+
+
+def test_scheduled_run_crash(setup):
+    cpus = sorted(os.sched_getaffinity(0))[:2]
+    invocations = [fake_invocation(f) for f in ["a", "b", "crash", "c", "d", "e"]]
+    results = []
+    with cfiddle_config(run_cpus=cpus):
+        with pytest.raises(RunnerException, match="crash"):
+            for r in DirectRunner(invocations, invoker=CrashingInvoker).iter_run():
+                results.append(r)
+    assert [r.invocation.function for r in results] == ["a", "b", "c", "d", "e"]
+    assert all(r.invocation is i for r, i in zip(results, invocations[:2] + invocations[3:]))
+
+
+def test_iter_run(setup):
+    invocations = [fake_invocation(f) for f in ["a", "b", "c", "crash", "d"]]
+    with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        results = []
+        with pytest.raises(RunnerDelegateException):
+            for r in Runner(invocations, invoker=CrashingInvoker).iter_run():
+                results.append(r)
+    assert [r.invocation.function for r in results] == ["a", "b", "c"]
+
+
+def test_results_share_invocations(setup):
+    invocations = [fake_invocation(f"f{i}") for i in range(3)]
+    with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        results = Runner(invocations, invoker=CPUReportingInvoker, checkpoint="shared").run()
+        assert all(r.invocation is i for r, i in zip(results, invocations))
+
+        # The journal doesn't have a copy of each invocation.
+        with open(os.path.join(get_config("CFIDDLE_BUILD_ROOT"), "shared", "results.pickle"), "rb") as f:
+            records = [value for kind, value in read_records(f) if kind == "result"]
+        assert [index for _, index, _ in records] == [0, 1, 2]
+        assert all(r.invocation is None for _, _, r in records)
+
+        results = Runner(invocations, invoker=CPUReportingInvoker, checkpoint="shared").run()
+        assert all(r.invocation is i for r, i in zip(results, invocations))
+
+
+def test_iter_run_batches(setup):
+    invocations = [fake_invocation(f"f{i}") for i in range(5)]
+    batches = list(DirectRunner(invocations, invoker=CPUReportingInvoker).iter_run(batch_size=2))
+    assert [len(b) for b in batches] == [2, 2, 1]
+    assert all(isinstance(b, InvocationResultsList) for b in batches)
+
+
+def test_records(setup):
+    path = os.path.join(setup, "records")
+    with open(path, "wb") as f:
+        write_record(f, "result", 1)
+        write_record(f, "result", 2)
+        f.write(b"\x10\x00")
+
+    with open(path, "rb") as f:
+        assert list(read_records(f)) == [("result", 1), ("result", 2)]
+        assert list(read_records(f)) == []
+        assert f.tell() == os.path.getsize(path) - 2
+
+
+class CountingInvoker(CPUReportingInvoker):
+    def run(self):
+        directory = os.environ["CHECKPOINT_TEST_DIR"]
+        if self._invocation.function == "crash" and not os.path.exists(os.path.join(directory, "crashed")):
+            open(os.path.join(directory, "crashed"), "w").close()
+            os.kill(os.getpid(), signal.SIGSEGV)
+        with open(os.path.join(directory, "invoked"), "a") as f:
+            f.write(self._invocation.function + "\n")
+        return super().run()
+
+
+def test_checkpoint(setup, monkeypatch):
+    monkeypatch.setenv("CHECKPOINT_TEST_DIR", setup)
+    functions = ["a", "b", "crash", "c", "a"]
+    invocations = [fake_invocation(f) for f in functions]
+    with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        with pytest.raises(RunnerDelegateException):
+            Runner(invocations, invoker=CountingInvoker, checkpoint="sweep").run()
+
+        results = Runner(invocations, invoker=CountingInvoker, checkpoint="sweep").run()
+        assert [r.invocation.function for r in results] == functions
+
+        results = Runner(invocations, invoker=CountingInvoker, checkpoint="sweep").run()
+        assert [r.invocation.function for r in results] == functions
+
+    with open(os.path.join(setup, "invoked")) as f:
+        assert f.read().split() == ["a", "b", "crash", "c", "a"]
+
+    with pytest.raises(RunnerException):
+        DirectRunner(invocations, checkpoint="sweep")
+
+
+def test_checkpoint_other_invocations(setup, monkeypatch):
+    monkeypatch.setenv("CHECKPOINT_TEST_DIR", setup)
+    def invoked():
+        with open(os.path.join(setup, "invoked")) as f:
+            return f.read().split()
+
+    with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        Runner([fake_invocation("f", arguments=dict(a=1)), fake_invocation("f", arguments=dict(a=2))], invoker=CountingInvoker, checkpoint="sweep").run()
+
+        # A different sweep with the same checkpoint only reuses what matches.
+        results = Runner([fake_invocation("f", arguments=dict(a=3)), fake_invocation("f", arguments=dict(a=1))], invoker=CountingInvoker, checkpoint="sweep").run()
+        assert [r.invocation.arguments for r in results] == [dict(a=3), dict(a=1)]
+        assert invoked() == ["f", "f", "f"]
+
+        # Rebuilding the same code gives a new library, but it still matches.
+        Runner([fake_invocation("f", lib="lib_1.so", arguments=dict(a=1))], invoker=CountingInvoker, checkpoint="sweep").run()
+        assert invoked() == ["f", "f", "f"]
+
+        # Different settings don't.
+        Runner([fake_invocation("f", arguments=dict(a=1), repetitions=3)], invoker=CountingInvoker, checkpoint="sweep").run()
+        assert invoked() == ["f", "f", "f", "f"]
+
+
+@pytest.mark.parametrize("name", ["", ".", "..", "../sweep", "a/b", "/tmp/sweep"])
+def test_checkpoint_names(setup, name):
+    with pytest.raises(RunnerException):
+        Runner([fake_invocation("f")], checkpoint=name)
+
+
+def test_checkpoint_lock(setup, monkeypatch):
+    monkeypatch.setenv("CHECKPOINT_TEST_DIR", setup)
+    invocations = [fake_invocation("a"), fake_invocation("b")]
+    with cfiddle_config(RunnerDelegate_type=WorkerDelegate):
+        first = Runner(invocations, invoker=CountingInvoker, checkpoint="sweep").iter_run()
+        assert next(first).invocation.function == "a"
+
+        # The first run still has the journal.
+        with pytest.raises(RunnerException, match="sweep"):
+            Runner(invocations, invoker=CountingInvoker, checkpoint="sweep").run()
+
+        assert [r.invocation.function for r in first] == ["b"]
+        results = Runner(invocations, invoker=CountingInvoker, checkpoint="sweep").run()
+        assert [r.invocation.function for r in results] == ["a", "b"]
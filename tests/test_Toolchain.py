@@ -2,7 +2,7 @@ import pytest
 
 from cfiddle import Toolchain
 from cfiddle import *
-from cfiddle.Toolchain import GCCToolchain, GoToolchain, ToolchainException, UnknownToolchain
+from cfiddle.Toolchain import GCCToolchain, GoToolchain, ToolchainException, UnknownToolchain, ToolchainProbeCache
 from cfiddle.util import get_native_architecture
 
 from fixtures import setup
@@ -74,3 +74,48 @@ def test_GCC(language, build_parameters, prefix, gcc_tool, gpp_tool):
     if gpp_tool:
         assert tool_chain._compiler_suffix == gpp_tool
         assert tool_chain.get_compiler() == prefix + gpp_tool
+
+
+def test_probe_cache(setup, monkeypatch):
+    import os
+    import time
+    tool = os.path.join(setup, "fake-gcc")
+    count = os.path.join(setup, "count")
+    def write_tool(output):
+        with open(tool, "w") as f:
+            f.write(f"#!/bin/sh\necho x >> {count}\necho {output} $1\n")
+        os.chmod(tool, 0o755)
+    def invocations():
+        with open(count) as f:
+            return len(f.readlines())
+
+    write_tool("first")
+    monkeypatch.setenv("PATH", setup + os.pathsep + os.environ["PATH"])
+
+    cache = ToolchainProbeCache()
+    assert cache.probe(["fake-gcc", "-v"]) == (True, "first -v\n")
+    assert cache.probe(["fake-gcc", "-v"]) == (True, "first -v\n")
+    assert cache.probe(["fake-gcc", "-x"]) == (True, "first -x\n")
+    assert invocations() == 2
+
+    assert ToolchainProbeCache().probe(["fake-gcc", "-v"]) == (True, "first -v\n") # from disk
+    assert invocations() == 2
+
+    time.sleep(0.01)
+    write_tool("second")
+    assert cache.probe(["fake-gcc", "-v"]) == (True, "second -v\n")
+    assert invocations() == 3
+
+    with cfiddle_config(toolchain_probe_cache=False):
+        cache.probe(["fake-gcc", "-v"])
+    assert invocations() == 4
+
+    assert cache.probe(["missing-gcc", "-v"])[0] == False
+    assert invocations() == 4
+
+    # Failures aren't cached.
+    with open(tool, "w") as f:
+        f.write(f"#!/bin/sh\necho x >> {count}\nexit 1\n")
+    assert cache.probe(["fake-gcc", "-y"])[0] == False
+    assert cache.probe(["fake-gcc", "-y"])[0] == False
+    assert invocations() == 6
@@ -3,9 +3,16 @@ from util import *
 from fixtures import *
 from cfiddle.source import InstrumentedExecutable
 from cfiddle.util import working_directory
+from cfiddle.CFG.cfg import get_back_edges, identify_loops, R2Session, R2SessionCache, CFGError
+from cfiddle.Toolchain.Registry import TheToolchainRegistry
+from cfiddle.Builder import ExecutableList, ExecutableDescription
+import cfiddle.CFG.cfg
+import networkx as nx
 import pytest
 import tempfile
 import os
+import json
+import threading
 
 
 def test_cfg(test_cpp):
@@ -20,3 +27,114 @@ def test_cfg(test_cpp):
         test_cpp.cfg("four", svg)
         assert os.path.exists(svg)
 
+
+def test_loops():
+    g = nx.DiGraph([("a", "b"), ("b", "c"), ("c", "b"), ("c", "d"), ("d", "d"), ("d", "a"), ("d", "e")])
+    back_edges = get_back_edges(g)
+    assert sorted(back_edges) == [("c", "b"), ("d", "a"), ("d", "d")]
+    assert sorted(identify_loops(g, back_edges)) == [["a", "b", "c", "d"], ["b", "c"], ["d"]]
+
+
+def op(offset, size, disasm, type):
+    return dict(offset=offset, size=size, disasm=disasm, opcode=disasm, type=type, bytes="00" * size)
+
+AGFJ = [dict(name="sym.foo", offset=0x1000,
+             blocks=[dict(offset=0x1000, size=4, jump=0x1010,
+                          ops=[op(0x1000, 1, "pushq %rbp", "upush"),
+                               op(0x1001, 3, "movl %edi, %eax", "mov")]),
+                     dict(offset=0x1010, size=7, jump=0x1010, fail=0x1020,
+                          ops=[op(0x1010, 3, "addl $1, %eax", "add"),
+                               op(0x1013, 2, "cmpl %esi, %eax", "cmp"),
+                               op(0x1015, 2, "jne 0x1010", "cjmp")]),
+                     dict(offset=0x1020, size=6,
+                          ops=[op(0x1020, 5, "call sym.bar", "call"),
+                               op(0x1025, 1, "retq", "ret")])])]
+
+
+class FakeR2:
+    def __init__(self):
+        self.commands = []
+        self.closed = False
+
+    def cmd(self, command):
+        self.commands.append(command)
+        if command.startswith("agfd"):
+            return 'digraph code {\n"0x1000" -> "0x1010";\n"0x1010" -> "0x1000";\n"0x1010" -> "0x1020";\n}\n'
+        if command.startswith("agfj"):
+            return json.dumps(AGFJ) if "sym.foo" in command else ""
+        if command.startswith("fs symbols"):
+            return "0x00001000 16 sym.foo\n0x00001020 4 sym.bar\n"
+        return ""
+
+    def quit(self):
+        self.closed = True
+
+
+class FakeR2Session(R2Session):
+    def __init__(self, file, stamp):
+        self.file = file
+        self.stamp = stamp
+        self._lock = threading.Lock()
+        self._r2 = FakeR2()
+        self._symbols = None
+        self._graphs = {}
+        self._blocks = {}
+
+
+def test_r2_session_cache(tmp_path):
+    libs = [tmp_path / f"lib{i}.so" for i in range(3)]
+    for l in libs:
+        l.write_text("x")
+    cache = R2SessionCache(max_sessions=2, session_type=FakeR2Session)
+
+    s0 = cache.get_session(str(libs[0]))
+    assert cache.get_session(str(libs[0])) is s0
+    assert s0.symbols() == ["sym.foo", "sym.bar"]
+
+    nx_cfg, back_edges, loops = s0.function_graph("sym.foo")
+    assert back_edges == [("0x1010", "0x1000")]
+    assert loops == [["0x1000", "0x1010"]]
+    assert s0.function_graph("sym.foo")[0] is nx_cfg
+    assert len([c for c in s0._r2.commands if c.startswith("agfd")]) == 1
+
+    libs[0].write_text("xx")
+    s0b = cache.get_session(str(libs[0]))
+    assert s0b is not s0 and s0._r2.closed
+
+    cache.get_session(str(libs[1]))
+    cache.get_session(str(libs[2]))
+    assert s0b._r2.closed
+
+
+def test_basic_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(cfiddle.CFG.cfg, "TheR2SessionCache", R2SessionCache(session_type=FakeR2Session))
+
+    executables = ExecutableList()
+    for o in ["-O0", "-O1"]:
+        lib = tmp_path / f"lib{o}.so"
+        lib.write_text("x")
+        executables.append(InstrumentedExecutable(lib=str(lib),
+                                                  toolchain=TheToolchainRegistry.get_toolchain(language="C++", build_parameters={}, tool="g++"),
+                                                  build_dir=str(tmp_path), output="", build_command="",
+                                                  build_spec=ExecutableDescription("test_src/test.cpp", dict(OPTIMIZE=o)),
+                                                  functions={}))
+
+    blocks = executables[0].basic_blocks("foo")
+    assert list(blocks["block"]) == [0x1000, 0x1010, 0x1020]
+    assert list(blocks["instructions"]) == [2, 3, 2]
+    assert list(blocks["branches"]) == [0, 1, 0]
+    assert list(blocks["calls"]) == [0, 0, 1]
+    assert list(blocks["loop_depth"]) == [0, 1, 0]
+    assert list(blocks["weighted_instructions"]) == [2, 30, 2]
+
+    instructions = executables[0].instructions("sym.foo")
+    assert list(instructions["mnemonic"]) == ["pushq", "movl", "addl", "cmpl", "jne", "call", "retq"]
+    assert instructions["size"].sum() == blocks["size"].sum()
+
+    df = executables.basic_blocks_df("foo")
+    assert list(df["OPTIMIZE"]) == ["-O0"] * 3 + ["-O1"] * 3
+    assert list(df.columns[:2]) == ["OPTIMIZE", "source_file"]
+    assert len(executables.instructions_df("foo")) == 14
+
+    with pytest.raises(CFGError):
+        executables[0].basic_blocks("missing")
@@ -6,9 +6,15 @@
 #include<string.h>
 #include"PerfCounter.hpp"
 #include"DataSet.hpp"
+#include"Profiler.hpp"
 
 using ::testing::ElementsAre;
 
+extern "C" int export_stats();
+extern "C" void clear_stats();
+extern "C" const char * fast_measurement_error();
+extern "C" void clear_fast_measurement_error();
+
 namespace Tests {
 
 	void skip_if_no_perf_counters(const PerfCounter & counter) {
@@ -49,6 +55,96 @@ namespace Tests {
 		ASSERT_NEAR(get_dataset()->current_row().get_datum("ET").as<double>(), 1.0, 0.15);
 	}
 
+	TEST_F(libcfiddleTests, fast_measurement_test) {
+		clear_stats();
+		start_fast_measurement("fast");
+		usleep(100000);
+		end_fast_measurement();
+		for(int i = 0; i < 100; i++) {
+			start_fast_measurement();
+			end_fast_measurement();
+		}
+		export_stats();
+		ASSERT_EQ(get_dataset()->size(), 101);
+		ASSERT_EQ(get_dataset()->get_rows()[0]->get_datum("tag").as<std::string>(), "fast");
+		ASSERT_NEAR(get_dataset()->get_rows()[0]->get_datum("ET").as<double>(), 0.1, 0.05);
+		ASSERT_LT(get_dataset()->current_row().get_datum("ET").as<double>(), 0.001);
+	}
+
+	TEST_F(libcfiddleTests, fast_measurement_overflow_test) {
+		clear_stats();
+		set_fast_measurement_capacity(10);
+		for(int i = 0; i < 25; i++) {
+			start_fast_measurement();
+			end_fast_measurement();
+		}
+		export_stats();
+		ASSERT_EQ(get_dataset()->size(), 25);
+		set_fast_measurement_capacity(16384);
+	}
+
+	TEST_F(libcfiddleTests, fast_measurement_bad_capacity_test) {
+		clear_stats();
+		clear_fast_measurement_error();
+		set_fast_measurement_capacity(-1);
+		ASSERT_NE(std::string(fast_measurement_error()), "");
+		clear_fast_measurement_error();
+		set_fast_measurement_capacity(0);
+		ASSERT_NE(std::string(fast_measurement_error()), "");
+		clear_fast_measurement_error();
+
+		// The old capacity still works.
+		for(int i = 0; i < 25; i++) {
+			start_fast_measurement();
+			end_fast_measurement();
+		}
+		export_stats();
+		ASSERT_EQ(get_dataset()->size(), 25);
+		ASSERT_EQ(std::string(fast_measurement_error()), "");
+	}
+
+	TEST_F(libcfiddleTests, fast_measurement_too_many_counters_test) {
+		if (!get_perf_counter()->performance_counters_enabled()) {
+			GTEST_SKIP();
+		}
+		clear_stats();
+		clear_fast_measurement_error();
+		get_perf_counter()->clear();
+		for(int i = 0; i < CFIDDLE_MAX_FAST_COUNTERS + 1; i++) {
+			get_perf_counter()->add_counter("PERF_COUNT_HW_CPU_CYCLES");
+		}
+		ASSERT_EQ(get_perf_counter()->get_counters().size(), CFIDDLE_MAX_FAST_COUNTERS + 1);
+		start_fast_measurement();
+		end_fast_measurement();
+		export_stats();
+		ASSERT_EQ(get_dataset()->size(), 0);
+		ASSERT_NE(std::string(fast_measurement_error()), "");
+		clear_fast_measurement_error();
+		get_perf_counter()->clear();
+	}
+
+	TEST_F(libcfiddleTests, fast_perf_count_CPU_CYCLES) {
+		if (!get_perf_counter()->performance_counters_enabled()) {
+			GTEST_SKIP();
+		}
+		clear_stats();
+		get_perf_counter()->clear();
+		get_perf_counter()->add_counter("PERF_COUNT_HW_CPU_CYCLES");
+
+		volatile int i;
+		start_fast_measurement();
+		for(i = 0; i < 10000; i++) {
+		}
+		end_fast_measurement();
+		start_fast_measurement();
+		for(i = 0; i < 1000; i++) {
+		}
+		end_fast_measurement();
+		export_stats();
+		ASSERT_GT(get_dataset()->get_rows()[0]->get_datum("PERF_COUNT_HW_CPU_CYCLES").as<uint64_t>(),
+			  get_dataset()->get_rows()[1]->get_datum("PERF_COUNT_HW_CPU_CYCLES").as<uint64_t>());
+	}
+
 	TEST_F(libcfiddleTests, perf_count_CPU_CYCLES) {
 		if (!get_perf_counter()->performance_counters_enabled()) {
 			GTEST_SKIP();
@@ -85,6 +181,30 @@ namespace Tests {
 		ASSERT_GT(get_dataset()->get_rows()[0]->get_datum("PERF_COUNT_HW_CPU_CYCLES").as<uint64_t>(),
 			  get_dataset()->get_rows()[1]->get_datum("PERF_COUNT_HW_CPU_CYCLES").as<uint64_t>());
 	}
+
+	TEST_F(libcfiddleTests, profile) {
+		Profiler * profiler = get_profiler();
+		if (!profiler->start(10000, 64)) {
+			GTEST_SKIP() << profiler->get_error();
+		}
+		profiler->resume();
+		volatile uint64_t s = 0;
+		for(uint64_t i = 0; i < 100000000; i++) {
+			s += i;
+		}
+		profiler->pause();
+		profiler->stop();
+
+		// Each sample is a frame count followed by that many frames.
+		auto & data = profiler->get_samples();
+		ASSERT_GT(data.size(), 0u);
+		size_t i = 0;
+		while (i < data.size()) {
+			ASSERT_GT(data[i], 0u);
+			i += data[i] + 1;
+		}
+		ASSERT_EQ(i, data.size());
+	}
 }
 
 
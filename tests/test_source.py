@@ -4,6 +4,7 @@ from fixtures import *
 from cfiddle.source import InstrumentedExecutable, InspectionError, Assembly
 import pytest
 import re
+import os
 
 def test_source(test_cpp):
     
@@ -63,6 +64,10 @@ def test_demangle(test_cpp):
         t.write(demangled)
     assert "demangle_me():" in demangled
 
+    assert test_cpp.asm(show="demangle_me()") == test_cpp.asm(show="_Z11demangle_mev")
+    assert "demangle_me():" in test_cpp.asm(show="_Z11demangle_mev")
+    assert "_Z11demangle_mev:" in test_cpp.asm(show="_Z11demangle_mev", demangle=False)
+
 def test_CPP_flags(setup):
 
     build = MakeBuilder(build_spec=ExecutableDescription("test_src/test.cpp", build_parameters=dict(MORE_CXXFLAGS="-DINCLUDE_MORE")),
@@ -81,3 +86,33 @@ source_for_more = r"""void more() {
 }"""
 
 
+
+
+def test_code_index(test_cpp):
+    index = test_cpp.code_index()
+    assert index is test_cpp.code_index()
+
+    nop = index.functions["nop"]
+    assert test_cpp.source(show=nop.source_lines) == test_cpp.source(show="nop")
+    assert test_cpp.asm(show=nop.asm_lines, demangle=False) == test_cpp.asm(show="nop", demangle=False)
+    assert nop.address_range[0] < nop.address_range[1]
+
+    file, line = index.find_address(nop.address_range[0])
+    assert os.path.basename(file) == "test.cpp"
+    assert nop.source_lines[0] < line <= nop.source_lines[1]
+
+    df = index.as_df()
+    assert "nop" in list(df["function"])
+
+
+def test_source_without_dwarf_index(setup, monkeypatch):
+    stripped = build_one("test_src/test.cpp", build_parameters=arg_map(DEBUG_FLAGS="-g0"))
+    assert not stripped.dwarf_index().functions
+    assert stripped.source(show="nop") == """int nop() {\n	return 4;\n}"""
+
+    exe = build_one("test_src/test.cpp")
+    def broken_index(self):
+        raise ValueError("Attribute does not have location information")
+    monkeypatch.setattr(InstrumentedExecutable, "dwarf_index", broken_index)
+    assert exe.source(show="nop") == """int nop() {\n	return 4;\n}"""
+    assert "nop" in exe.code_index().functions
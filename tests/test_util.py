@@ -101,6 +101,26 @@ def test_invoke_process():
             success, output = invoke_process(["cat"], stdin=inp)
             assert success == True
             assert output == "hello"
+
+
+def test_invoke_process_with_usage():
+    success, output, usage = invoke_process_with_usage(["python", "-c", "print('hello'); x = bytearray(50*1024*1024); sum(range(1000000))"])
+    assert success
+    assert output == "hello\n"
+    assert usage["wall_time"] >= usage["user_time"] > 0
+    assert usage["max_rss"] > 50*1024*1024
+
+    success, output, usage = invoke_process_with_usage(["false"])
+    assert success == False
+    assert usage is not None
+
+    success, output, usage = invoke_process_with_usage(["sh", "-c", "kill -9 $$"])
+    assert success == False
+    assert usage is not None
+
+    success, output, usage = invoke_process_with_usage(["not-a-command-at-all"])
+    assert success == False
+    assert usage is None
             
 
 def test_working_directory():
@@ -119,6 +139,30 @@ def test_working_directory():
 def test_exp_range(parameters, result):
     assert list(exp_range(*parameters)) == result
 
+
+def test_file_digest():
+    import hashlib
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "f")
+        assert file_stamp(path) is None
+        with pytest.raises(OSError):
+            file_digest(path)
+
+        with open(path, "w") as f:
+            f.write("a")
+        os.utime(path, ns=(1, 1))
+        assert file_stamp(path) == (1, 1)
+        assert file_digest(path) == hashlib.sha256(b"a").hexdigest()
+
+        # The same stamp is assumed to be the same contents.
+        with open(path, "w") as f:
+            f.write("b")
+        os.utime(path, ns=(1, 1))
+        assert file_digest(path) == hashlib.sha256(b"a").hexdigest()
+
+        os.utime(path, ns=(2, 2))
+        assert file_digest(path) == hashlib.sha256(b"b").hexdigest()
+
     
 # def test_changes_in():
 #     if True or os.environ.get("CIRCLECI", "false") == "true":